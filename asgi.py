@@ -0,0 +1,17 @@
+import os
+import sys
+
+# Adicionar o diretório raiz ao path para importar os módulos corretamente
+root_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, root_path)
+
+# Configurar o ambiente antes de importar a aplicação
+os.environ.setdefault('PYTHONPATH', root_path)
+
+# Aplicação ASGI: rotas de leitura assíncronas e as restantes pela aplicação Flask (ver src/asgi.py)
+from src.asgi import app
+
+# Modo ASGI: uvicorn asgi:app --host 0.0.0.0 --port $PORT --workers 2
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=int(os.getenv('PORT', '5000')))
@@ -0,0 +1,248 @@
+"""Benchmark de carga: Gunicorn síncrono (gunicorn_config.py) vs modo ASGI (asgi.py)
+
+Arranca cada configuração como um servidor real sobre a mesma base de dados,
+abre N ligações concorrentes (operadores) que pedem em ciclo as listagens de
+veículos e de emails e o dashboard, e mostra por configuração os pedidos por
+segundo, a latência (p50/p95/p99), os erros e a memória (RSS) máxima do
+servidor com todos os seus processos.
+
+Por omissão usa um SQLite temporário com dados sintéticos; a diferença entre os
+modos aparece sobretudo quando cada consulta espera pela rede, por isso o
+resultado representativo é o obtido contra uma branch do Neon vazia criada
+para o efeito (BENCHMARK_DATABASE_URL).
+
+    python benchmarks/asgi_load_benchmark.py [concorrência] [segundos]
+    BENCHMARK_DATABASE_URL=postgresql://... python benchmarks/asgi_load_benchmark.py 64 30
+
+Variáveis: BENCHMARK_VEHICLES (5000), BENCHMARK_ASGI_WORKERS (2; processos uvicorn).
+"""
+
+import asyncio
+import os
+import random
+import shutil
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import jwt
+from sqlalchemy import create_engine, inspect
+
+from src.models.user import db, User
+import src.models
+from src.models.rent_a_car import EmailTrigger
+from src.models.vehicle import Vehicle
+
+SECRET_KEY = 'benchmark-secret'
+VEHICLE_COUNT = int(os.getenv('BENCHMARK_VEHICLES', '5000'))
+ASGI_WORKERS = os.getenv('BENCHMARK_ASGI_WORKERS', '2')
+INSERT_BATCH = 5000
+PATHS = [
+    '/api/vehicles?limit=50',
+    '/api/vehicles?limit=50&status=em_tratamento&include_total=true',
+    '/api/email-triggers?per_page=20',
+    '/api/email-triggers?processed=false',
+    '/api/dashboard/stats',
+]
+STATUSES = ['em_tratamento', 'submetido', 'recuperado', 'perdido']
+MARCAS = ['Renault', 'Fiat', 'Seat', 'Peugeot', 'Volkswagen', 'Toyota']
+
+
+def seed(engine):
+    start = datetime(2024, 1, 1)
+    with engine.begin() as connection:
+        user = User(username='benchmark', email='benchmark@rec.pt', role='admin', is_active=True)
+        user.set_password('benchmark')
+        connection.execute(User.__table__.insert(), [{
+            'id': 1, 'username': user.username, 'email': user.email, 'password_hash': user.password_hash,
+            'role': user.role, 'is_active': True, 'created_at': start,
+        }])
+        random_ = random.Random(42)
+        vehicles = [{
+            'id': i + 1, 'matricula': f'{i:06d}', 'marca': random_.choice(MARCAS), 'modelo': 'X',
+            'status': random_.choice(STATUSES), 'valor': random_.randint(5000, 40000), 'nuipc': False,
+            'gps_ativo': False, 'data_submissao': start + timedelta(minutes=i),
+            'created_at': start + timedelta(minutes=i), 'updated_at': start + timedelta(minutes=i),
+        } for i in range(VEHICLE_COUNT)]
+        triggers = [{
+            'email_from': 'frota@rent.pt', 'email_subject': vehicle['matricula'],
+            'processed': random_.random() > 0.1, 'received_at': vehicle['created_at'],
+        } for vehicle in vehicles]
+        for table, rows in ((Vehicle.__table__, vehicles), (EmailTrigger.__table__, triggers)):
+            for index in range(0, len(rows), INSERT_BATCH):
+                connection.execute(table.insert(), rows[index:index + INSERT_BATCH])
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def process_tree_rss(pid):
+    """RSS (MB) do processo e de todos os descendentes"""
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f'/proc/{current}/status') as status:
+                for line in status:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+            for task in os.listdir(f'/proc/{current}/task'):
+                with open(f'/proc/{current}/task/{task}/children') as children:
+                    pending.extend(int(child) for child in children.read().split())
+        except (FileNotFoundError, ProcessLookupError):
+            continue
+    return total / 1024
+
+
+async def request(state, port, path, headers):
+    """Um GET em HTTP/1.1 numa ligação reutilizada enquanto o servidor a mantiver aberta"""
+    if state.get('writer') is None:
+        state['reader'], state['writer'] = await asyncio.open_connection('127.0.0.1', port)
+    reader, writer = state['reader'], state['writer']
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\n{headers}\r\n'.encode('latin-1'))
+    await writer.drain()
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    fields = {name.lower(): value.strip() for name, _, value in (line.partition(':') for line in lines[1:] if line)}
+    await reader.readexactly(int(fields.get('content-length', 0)))
+    if fields.get('connection', '').lower() == 'close':
+        writer.close()
+        state['writer'] = None
+    return status
+
+
+async def operator(port, headers, deadline, latencies, errors):
+    state = {}
+    random_ = random.Random()
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            status = await request(state, port, random_.choice(PATHS), headers)
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            status = None
+            state['writer'] = None
+        if status == 200:
+            latencies.append(time.perf_counter() - started)
+        else:
+            errors.append(status)
+    if state.get('writer') is not None:
+        state['writer'].close()
+
+
+async def load(port, token, concurrency, seconds, server_pid):
+    headers = f'Authorization: Bearer {token}\r\n'
+    latencies, errors, rss = [], [], []
+    deadline = time.perf_counter() + seconds
+
+    async def sample_memory():
+        while time.perf_counter() < deadline:
+            rss.append(process_tree_rss(server_pid))
+            await asyncio.sleep(0.5)
+
+    started = time.perf_counter()
+    await asyncio.gather(sample_memory(), *(
+        operator(port, headers, deadline, latencies, errors) for _ in range(concurrency)
+    ))
+    return latencies, errors, time.perf_counter() - started, max(rss or [0])
+
+
+def wait_until_ready(port, process, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('O servidor terminou durante o arranque')
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1) as sock:
+                sock.sendall(b'GET /api/health HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n')
+                if sock.recv(16).startswith(b'HTTP/1.1 200'):
+                    return
+        except OSError:
+            pass
+        time.sleep(0.3)
+    raise RuntimeError('O servidor não respondeu a /api/health')
+
+
+def run_server(label, command, env, token, concurrency, seconds):
+    port = free_port()
+    env = {**env, 'PORT': str(port)}
+    command = [part.replace('{port}', str(port)) for part in command]
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                               start_new_session=True)
+    try:
+        wait_until_ready(port, process)
+        # Aquecer as caches e os pools antes de medir
+        asyncio.run(load(port, token, concurrency, 2, process.pid))
+        latencies, errors, elapsed, rss = asyncio.run(load(port, token, concurrency, seconds, process.pid))
+    finally:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=30)
+
+    latencies.sort()
+    percentile = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0
+    return {
+        'label': label,
+        'rps': len(latencies) / elapsed,
+        'p50': statistics.median(latencies) * 1000 if latencies else 0,
+        'p95': percentile(0.95),
+        'p99': percentile(0.99),
+        'errors': len(errors),
+        'rss': rss,
+    }
+
+
+def main():
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    seconds = int(sys.argv[2]) if len(sys.argv) > 2 else 15
+    temp_dir = None
+    database_url = os.getenv('BENCHMARK_DATABASE_URL')
+    if not database_url:
+        temp_dir = tempfile.mkdtemp(prefix='rec-benchmark-')
+        database_url = f"sqlite:///{os.path.join(temp_dir, 'benchmark.db')}"
+    engine = create_engine(database_url)
+
+    try:
+        if inspect(engine).has_table('vehicle'):
+            print('A base de dados de benchmark tem de estar vazia (já existe a tabela vehicle).')
+            sys.exit(1)
+        db.metadata.create_all(engine)
+        seed(engine)
+        engine.dispose()
+        token = jwt.encode({'user_id': 1, 'exp': datetime.utcnow() + timedelta(hours=2)}, SECRET_KEY, algorithm='HS256')
+        env = {**os.environ, 'DATABASE_URL': database_url, 'SECRET_KEY': SECRET_KEY, 'PYTHONPATH': ROOT}
+
+        configs = [
+            ('gunicorn sync (4 workers x 2 threads)',
+             [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn_config.py', 'src.main:app']),
+            (f'uvicorn ASGI ({ASGI_WORKERS} workers)',
+             [sys.executable, '-m', 'uvicorn', 'asgi:app', '--host', '127.0.0.1', '--port', '{port}',
+              '--workers', ASGI_WORKERS, '--no-access-log']),
+        ]
+        print(f"{engine.dialect.name}: {VEHICLE_COUNT} veículos, {concurrency} operadores concorrentes, "
+              f"{seconds} s por configuração\n")
+        results = [run_server(label, command, env, token, concurrency, seconds) for label, command in configs]
+
+        print(f"{'configuração':40} {'pedidos/s':>10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'erros':>6} {'RSS MB':>8}")
+        for result in results:
+            print(f"{result['label']:40} {result['rps']:10.1f} {result['p50']:8.1f} {result['p95']:8.1f} "
+                  f"{result['p99']:8.1f} {result['errors']:6d} {result['rss']:8.1f}")
+    finally:
+        engine.dispose()
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""Benchmark da extração de dados dos emails
+
+Compara a extração antiga (oito re.search por email, com os padrões recriados
+a cada chamada) com o ExtractionEngine, em emails de texto, de uma rent-a-car
+com etiquetas próprias e só em HTML. Não precisa de base de dados.
+
+    python benchmarks/extraction_benchmark.py [número de emails]
+"""
+
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.extraction import ExtractionEngine, build_template
+
+
+def legacy_extract(email_body):
+    """Cópia da implementação anterior de EmailService.extract_vehicle_data"""
+    data = {}
+    patterns = {
+        'matricula': r'Matrícula[:\s]+(\w+-\w+-\w+|\w+\s\w+\s\w+|\w+\-\w+\-\w+)',
+        'marca': r'Marca[:\s]+(\w+)',
+        'modelo': r'Modelo[:\s]+([\w\s]+)',
+        'vin': r'VIN[:\s]+(\w+)',
+        'data_desaparecimento': r'Data[\s\w]*desaparecimento[:\s]+(\d{2}[/\-]\d{2}[/\-]\d{4})',
+        'cliente_nome': r'Nome[\s\w]*cliente[:\s]+([\w\s]+)',
+        'cliente_contacto': r'Contacto[:\s]+(\+?\d+|\d+[\s\-]\d+)',
+        'loja_aluguer': r'Loja[:\s]+([\w\s]+)'
+    }
+    for key, pattern in patterns.items():
+        match = re.search(pattern, email_body, re.IGNORECASE)
+        if match:
+            data[key] = match.group(1).strip()
+    return data
+
+
+MARCAS = ['Renault', 'Fiat', 'Seat', 'Peugeot', 'Volkswagen', 'Toyota']
+LOJAS = ['Lisboa Aeroporto', 'Porto Campanhã', 'Faro']
+
+
+def plate(random_):
+    return '-'.join(''.join(random_.choice('ABCDEFGHJKLMNPRSTUVWXYZ0123456789') for _ in range(2)) for _ in range(3))
+
+
+def text_email(random_):
+    return (
+        "Boa tarde,\n\nInformamos o desaparecimento da seguinte viatura.\n\n"
+        f"Matrícula: {plate(random_)}\nMarca: {random_.choice(MARCAS)}\nModelo: Modelo {random_.randint(1, 9)}\n"
+        f"VIN: WVWZZZ1JZXW{random_.randint(100000, 999999)}\nData de desaparecimento: 0{random_.randint(1, 9)}/03/2024\n"
+        f"Nome do cliente: Cliente {random_.randint(1, 5000)}\nContacto: 91{random_.randint(1000000, 9999999)}\n"
+        f"Loja: {random_.choice(LOJAS)}\n\nCumprimentos,\nDepartamento de Frota\n" + "Texto legal. " * 20
+    )
+
+
+def custom_email(random_):
+    return (
+        "Dear partner,\n\n"
+        f"Plate No.: {plate(random_)}\nMake: {random_.choice(MARCAS)}\nModel: Model {random_.randint(1, 9)}\n"
+        f"Chassis: WVWZZZ1JZXW{random_.randint(100000, 999999)}\nBranch: {random_.choice(LOJAS)}\n\nRegards\n"
+    )
+
+
+def html_email(random_):
+    rows = [
+        ('Matrícula', plate(random_)), ('Marca', random_.choice(MARCAS)), ('Modelo', f'Modelo {random_.randint(1, 9)}'),
+        ('Loja', random_.choice(LOJAS)), ('Contacto', f'92{random_.randint(1000000, 9999999)}'),
+    ]
+    cells = ''.join(f'<tr><td><b>{label}</b></td><td>{value}</td></tr>' for label, value in rows)
+    return f'<html><head><style>td {{ padding: 2px }}</style></head><body><p>Viatura desaparecida</p><table>{cells}</table></body></html>'
+
+
+def measure(label, func, emails):
+    started = time.perf_counter()
+    fields = 0
+    for body in emails:
+        fields += len(func(body))
+    elapsed = time.perf_counter() - started
+    print(f"{label:<42} {len(emails) / elapsed:>10.0f} emails/s   {fields / len(emails):.1f} campos/email")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    random_ = random.Random(42)
+    texts = [text_email(random_) for _ in range(count)]
+    customs = [custom_email(random_) for _ in range(count)]
+    htmls = [html_email(random_) for _ in range(count)]
+
+    engine = ExtractionEngine()
+    custom_template = build_template('rent_a_car:benchmark', {'fields': {
+        'matricula': {'labels': ['Plate No.']}, 'marca': {'labels': ['Make']}, 'modelo': {'labels': ['Model']},
+        'vin': {'labels': ['Chassis']}, 'loja_aluguer': {'labels': ['Branch']},
+    }})
+
+    print(f"{count} emails por cenário\n")
+    measure('texto: extração antiga', legacy_extract, texts)
+    measure('texto: ExtractionEngine', lambda body: engine.extract(body).data, texts)
+    measure('etiquetas próprias: extração antiga', legacy_extract, customs)
+    measure('etiquetas próprias: modelo da rent-a-car', lambda body: custom_template.extract(body)[0], customs)
+    measure('HTML: extração antiga', legacy_extract, htmls)
+    measure('HTML: ExtractionEngine', lambda body: engine.extract(body).data, htmls)
+
+
+if __name__ == '__main__':
+    main()
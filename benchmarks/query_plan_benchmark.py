@@ -0,0 +1,250 @@
+"""Benchmark dos planos de consulta antes e depois da migração de índices
+
+Cria as tabelas numa base de dados vazia, insere dados sintéticos e corre as
+consultas das listagens e tarefas mais frequentes sem os índices da migração
+0001_hot_path_indexes (downgrade) e depois de a aplicar (upgrade). Para cada
+consulta mostra o plano e o tempo mediano antes e depois.
+
+Por omissão usa um SQLite temporário; BENCHMARK_DATABASE_URL aponta para outra
+base de dados (tem de estar vazia, ex.: uma branch do Neon criada para o efeito).
+
+    python benchmarks/query_plan_benchmark.py [número de veículos]
+    BENCHMARK_DATABASE_URL=postgresql://... python benchmarks/query_plan_benchmark.py 200000
+"""
+
+import importlib.util
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from sqlalchemy import create_engine, event, func, inspect, select
+
+from src.models.user import db
+import src.models
+from src.models.car_model import CarBrand, CarModel
+from src.models.rent_a_car import EmailTrigger, RentACar
+from src.models.store_location import StoreLocation
+from src.models.vehicle import Document, Vehicle, VehicleUpdate
+from src.services.pagination import apply_keyset
+
+MIGRATION_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                              'migrations', 'versions', '0001_hot_path_indexes.py')
+RUNS = int(os.getenv('BENCHMARK_RUNS', '20'))
+INSERT_BATCH = 5000
+
+STATUSES = ['em_tratamento'] * 3 + ['submetido'] * 2 + ['recuperado'] * 4 + ['perdido']
+CLOSED_STATUSES = ['recuperado'] * 8 + ['perdido'] * 2
+MARCAS = ['Renault', 'Fiat', 'Seat', 'Peugeot', 'Volkswagen', 'Toyota', 'Citroën', 'Opel', 'BMW', 'Dacia']
+LOJAS = ['Lisboa Aeroporto', 'Porto Campanhã', 'Faro', 'Coimbra', 'Braga', 'Funchal']
+
+
+def load_migration():
+    spec = importlib.util.spec_from_file_location('hot_path_indexes', MIGRATION_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def run_migration(engine, step):
+    """Correr upgrade()/downgrade() da migração numa ligação própria (como o flask db upgrade)"""
+    with engine.connect() as connection:
+        context = MigrationContext.configure(connection)
+        with Operations.context(context), context.begin_transaction():
+            step()
+
+
+def insert_batches(connection, table, rows):
+    for start in range(0, len(rows), INSERT_BATCH):
+        connection.execute(table.insert(), rows[start:start + INSERT_BATCH])
+
+
+def seed(engine, vehicle_count, random_):
+    """Dados sintéticos com proporções próximas das reais"""
+    start = datetime(2023, 1, 1)
+    with engine.begin() as connection:
+        insert_batches(connection, CarBrand.__table__,
+                       [{'id': i + 1, 'name': f'Marca {i}', 'is_active': True} for i in range(50)])
+        insert_batches(connection, CarModel.__table__,
+                       [{'name': f'Modelo {i}', 'brand_id': i % 50 + 1, 'is_active': True} for i in range(2000)])
+        insert_batches(connection, RentACar.__table__,
+                       [{'id': i + 1, 'nome': f'Rent {i}', 'is_active': True} for i in range(20)])
+        insert_batches(connection, StoreLocation.__table__,
+                       [{'nome': f'Loja {i}', 'rent_a_car_id': i % 20 + 1, 'is_active': True} for i in range(400)])
+
+        vehicles = []
+        for i in range(vehicle_count):
+            created = start + timedelta(minutes=i * 7 + random_.randint(0, 6))
+            # Os casos antigos estão quase todos fechados; os abertos concentram-se nos recentes
+            status = random_.choice(STATUSES if i > vehicle_count * 0.9 else CLOSED_STATUSES)
+            vehicles.append({
+                'id': i + 1, 'matricula': f'{i:06d}', 'marca': random_.choice(MARCAS), 'modelo': 'X',
+                'status': status, 'valor': random_.randint(5000, 40000), 'nuipc': False, 'gps_ativo': False,
+                'loja_aluguer': random_.choice(LOJAS), 'data_submissao': created, 'created_at': created,
+                'updated_at': created,
+                'data_desaparecimento': created - timedelta(days=random_.randint(0, 5)),
+                'data_recuperacao': created + timedelta(days=random_.randint(1, 60)) if status == 'recuperado' else None,
+            })
+        insert_batches(connection, Vehicle.__table__, vehicles)
+
+        updates = []
+        documents = []
+        triggers = []
+        for vehicle in vehicles:
+            for n in range(random_.randint(0, 10)):
+                updates.append({'vehicle_id': vehicle['id'], 'descricao': 'Atualização', 'tipo': 'observacao',
+                                'data_atualizacao': vehicle['created_at'] + timedelta(hours=n)})
+            for n in range(random_.randint(0, 2)):
+                documents.append({'vehicle_id': vehicle['id'], 'nome_ficheiro': f"{vehicle['id']}-{n}.pdf",
+                                  'nome_original': 'queixa.pdf', 'tipo_documento': 'queixa',
+                                  'caminho_ficheiro': '/x', 'data_upload': vehicle['created_at'] + timedelta(hours=n)})
+            processed = random_.random() > 0.02
+            triggers.append({'email_from': 'frota@rent.pt', 'email_subject': vehicle['matricula'],
+                             'processed': processed, 'vehicle_id': vehicle['id'] if processed else None,
+                             'rent_a_car_id': vehicle['id'] % 20 + 1, 'received_at': vehicle['created_at']})
+        insert_batches(connection, VehicleUpdate.__table__, updates)
+        insert_batches(connection, Document.__table__, documents)
+        insert_batches(connection, EmailTrigger.__table__, triggers)
+    return len(updates), len(documents), len(triggers)
+
+
+def benchmark_queries(vehicle_count):
+    """As consultas tal como são feitas pelas rotas e serviços"""
+    vehicle_id = vehicle_count // 2
+    middle = datetime(2023, 1, 1) + timedelta(minutes=vehicle_count * 7 // 2)
+    month_start = datetime(2023, 1, 1) + timedelta(minutes=vehicle_count * 7 // 3)
+    month_start = month_start.replace(day=1, hour=0, minute=0, second=0)
+    month_end = (month_start + timedelta(days=32)).replace(day=1)
+    case_start = func.coalesce(Vehicle.data_desaparecimento, Vehicle.data_submissao)
+    vehicle_list = select(Vehicle.id, Vehicle.matricula, Vehicle.status, Vehicle.created_at)
+    return [
+        ('GET /vehicles (1.ª página)',
+         apply_keyset(vehicle_list, Vehicle.created_at, Vehicle.id, None).limit(51)),
+        ('GET /vehicles?status=perdido&cursor=...',
+         apply_keyset(vehicle_list.filter(Vehicle.status == 'perdido'),
+                      Vehicle.created_at, Vehicle.id, (middle, vehicle_id)).limit(51)),
+        ('GET /vehicles?marca=ault',
+         apply_keyset(vehicle_list.filter(Vehicle.marca.ilike('%ault%')),
+                      Vehicle.created_at, Vehicle.id, None).limit(51)),
+        ('GET /vehicles/<id> (timeline)',
+         apply_keyset(select(VehicleUpdate).filter(VehicleUpdate.vehicle_id == vehicle_id),
+                      VehicleUpdate.data_atualizacao, VehicleUpdate.id, None).limit(51)),
+        ('GET /vehicles/<id>/documents',
+         select(Document).filter(Document.vehicle_id == vehicle_id).order_by(Document.data_upload.desc())),
+        ('GET /email-triggers',
+         select(EmailTrigger).order_by(EmailTrigger.received_at.desc()).limit(10)),
+        ('GET /email-triggers?processed=false',
+         select(EmailTrigger).filter(EmailTrigger.processed == False)
+         .order_by(EmailTrigger.received_at.desc()).limit(10)),
+        ('Processamento automático (lote por id)',
+         select(EmailTrigger).filter(EmailTrigger.processed == False, EmailTrigger.id > 0)
+         .order_by(EmailTrigger.id).limit(100)),
+        ('GET /admin/store-locations?rent_a_car_id=',
+         select(StoreLocation).filter(StoreLocation.rent_a_car_id == 7)),
+        ('GET /admin/car-models?brand_id=',
+         select(CarModel).filter(CarModel.brand_id == 7)),
+        ('Relatório por período de submissão',
+         select(Vehicle.id, Vehicle.matricula).filter(Vehicle.data_submissao >= month_start,
+                                                      Vehicle.data_submissao < month_end)
+         .order_by(Vehicle.data_submissao.desc(), Vehicle.id.desc())),
+        ('Agregados de recuperação (um mês)',
+         select(func.count(Vehicle.id), func.sum(Vehicle.valor))
+         .filter(case_start >= month_start, case_start < month_end)),
+        ('Dossiês dos casos em aberto',
+         select(Vehicle.id).filter(Vehicle.status.in_(('em_tratamento', 'submetido'))).order_by(Vehicle.id)),
+    ]
+
+
+def driver_sql(connection, statement):
+    """SQL e parâmetros exatamente como chegam ao driver"""
+    captured = {}
+
+    def capture(conn, cursor, sql, parameters, context, executemany):
+        captured['sql'], captured['params'] = sql, parameters
+
+    event.listen(connection, 'before_cursor_execute', capture)
+    try:
+        connection.execute(statement).fetchall()
+    finally:
+        event.remove(connection, 'before_cursor_execute', capture)
+    return captured['sql'], captured['params']
+
+
+def explain(connection, sql, params):
+    if connection.dialect.name == 'postgresql':
+        rows = connection.exec_driver_sql('EXPLAIN ' + sql, params).fetchall()
+        return [row[0] for row in rows]
+    rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+    return [row[-1] for row in rows]
+
+
+def measure(connection, sql, params):
+    timings = []
+    for _ in range(RUNS):
+        started = time.perf_counter()
+        connection.exec_driver_sql(sql, params).fetchall()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def run(engine, queries):
+    results = []
+    with engine.connect() as connection:
+        for label, statement in queries:
+            sql, params = driver_sql(connection, statement)
+            results.append((explain(connection, sql, params), measure(connection, sql, params)))
+    return results
+
+
+def main():
+    vehicle_count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    temp_dir = None
+    database_url = os.getenv('BENCHMARK_DATABASE_URL')
+    if not database_url:
+        temp_dir = tempfile.mkdtemp(prefix='rec-benchmark-')
+        database_url = f"sqlite:///{os.path.join(temp_dir, 'benchmark.db')}"
+    engine = create_engine(database_url)
+
+    try:
+        if inspect(engine).has_table('vehicle'):
+            print('A base de dados de benchmark tem de estar vazia (já existe a tabela vehicle).')
+            sys.exit(1)
+        migration = load_migration()
+        db.metadata.create_all(engine)
+        # Partir do esquema sem os índices da migração
+        run_migration(engine, migration.downgrade)
+        random_ = random.Random(42)
+        updates, documents, triggers = seed(engine, vehicle_count, random_)
+        with engine.begin() as connection:
+            connection.exec_driver_sql('ANALYZE')
+
+        print(f"{engine.dialect.name}: {vehicle_count} veículos, {updates} atualizações, "
+              f"{documents} documentos, {triggers} emails; mediana de {RUNS} execuções\n")
+        queries = benchmark_queries(vehicle_count)
+        before = run(engine, queries)
+        run_migration(engine, migration.upgrade)
+        after = run(engine, queries)
+
+        for (label, _), (plan_before, ms_before), (plan_after, ms_after) in zip(queries, before, after):
+            print(f"{label}\n    antes  {ms_before:8.2f} ms   depois {ms_after:8.2f} ms   ({ms_before / ms_after:.1f}x)")
+            for title, plan in (('antes', plan_before), ('depois', plan_after)):
+                print(f"    plano {title}:")
+                for line in plan[:6]:
+                    print(f"        {line}")
+            print()
+    finally:
+        engine.dispose()
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+import os
+import sys
+import signal
+import logging
+import threading
+from dotenv import load_dotenv
+
+# Configurar logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler("email_listener.log"),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger('email_listener')
+
+# Carregar variáveis de ambiente
+load_dotenv()
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from src.main import app
+from src.models.user import db
+from src.services.email_service import EmailService
+
+# Configurações
+EMAIL_FOLDER = os.getenv('EMAIL_FOLDER', 'INBOX')
+AUTO_PROCESS = os.getenv('EMAIL_AUTO_PROCESS', 'true').lower() != 'false'
+
+def on_new_mail(service, folder):
+    """Sincronizar a pasta e criar veículos a partir dos emails novos"""
+    with app.app_context():
+        try:
+            processed_count = service.process_emails(folder)
+            logger.info(f"Sincronização concluída: {processed_count} emails processados")
+            
+            if AUTO_PROCESS and processed_count > 0:
+                results = service.create_vehicles_from_emails()
+                success = sum(1 for result in results if result['success'])
+                logger.info(f"Processamento automático: {success} sucesso, {len(results) - success} falhas")
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Erro ao processar emails: {str(e)}")
+        finally:
+            db.session.remove()
+
+def main():
+    """Escutar a caixa de email com IMAP IDLE (alternativa ao schedule_email_check.py)"""
+    service = EmailService.from_env()
+    stop_event = threading.Event()
+    
+    def stop(signum, frame):
+        logger.info("A terminar a escuta de emails...")
+        stop_event.set()
+    
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    
+    logger.info(f"A escutar {service.email_address}/{EMAIL_FOLDER} em {service.imap_server}:{service.imap_port}")
+    service.listen(on_new_mail, folder=EMAIL_FOLDER, stop_event=stop_event)
+
+if __name__ == "__main__":
+    main()
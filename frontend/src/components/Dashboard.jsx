@@ -11,20 +11,47 @@ import {
   TrendingUp,
   Euro
 } from 'lucide-react'
-import { BarChart, Bar, XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer, PieChart, Pie, Cell } from 'recharts'
+import { BarChart, Bar, XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer, PieChart, Pie, Cell, LineChart, Line, Legend } from 'recharts'
 
 const COLORS = ['#0088FE', '#00C49F', '#FFBB28', '#FF8042', '#8884D8']
 
 export default function PainelDeControlo() {
   const [stats, setStats] = useState(null)
+  const [recovery, setRecovery] = useState([])
+  const [storeLoss, setStoreLoss] = useState([])
   const [loading, setLoading] = useState(true)
   const { token, API_BASE } = useAuth()
 
   // Comentário de teste para verificar hot-reloading no frontend
   useEffect(() => {
     fetchStats()
+    fetchRecoveryAnalytics()
   }, [])
 
+  const fetchRecoveryAnalytics = async () => {
+    try {
+      const headers = { 'Authorization': `Bearer ${token}` }
+      const [weekly, stores] = await Promise.all([
+        fetch(`${API_BASE}/analytics/recovery?granularity=week&group_by=total`, { headers }),
+        fetch(`${API_BASE}/analytics/recovery?granularity=month&group_by=loja`, { headers })
+      ])
+      if (weekly.ok) {
+        const data = await weekly.json()
+        // Últimas 26 semanas da série total
+        setRecovery(data.series.length > 0 ? data.series[0].points.slice(-26) : [])
+      }
+      if (stores.ok) {
+        const data = await stores.json()
+        setStoreLoss(data.series.map(item => ({
+          loja: item.label,
+          taxa_perda: item.resumo.taxa_perda !== null ? +(item.resumo.taxa_perda * 100).toFixed(1) : 0
+        })))
+      }
+    } catch (error) {
+      console.error('Erro ao carregar a análise de recuperação:', error)
+    }
+  }
+
   const fetchStats = async () => {
     try {
       const response = await fetch(`${API_BASE}/dashboard/stats`, {
@@ -209,6 +236,53 @@ export default function PainelDeControlo() {
         </Card>
       )}
 
+      {/* Tempo até à recuperação e taxa de perda por loja */}
+      {recovery.length > 0 && (
+        <div className="grid grid-cols-1 md:grid-cols-2 gap-6">
+          <Card>
+            <CardHeader>
+              <CardTitle>Tempo até Recuperação</CardTitle>
+              <CardDescription>
+                Dias até à recuperação por semana de desaparecimento (mediana e percentil 90)
+              </CardDescription>
+            </CardHeader>
+            <CardContent>
+              <ResponsiveContainer width="100%" height={300}>
+                <LineChart data={recovery}>
+                  <CartesianGrid strokeDasharray="3 3" />
+                  <XAxis dataKey="bucket" />
+                  <YAxis />
+                  <Tooltip />
+                  <Legend />
+                  <Line type="monotone" dataKey="tempo_p50" name="Mediana" stroke="#0088FE" dot={false} />
+                  <Line type="monotone" dataKey="tempo_p90" name="Percentil 90" stroke="#FF8042" dot={false} />
+                </LineChart>
+              </ResponsiveContainer>
+            </CardContent>
+          </Card>
+
+          <Card>
+            <CardHeader>
+              <CardTitle>Taxa de Perda por Loja</CardTitle>
+              <CardDescription>
+                Percentagem de casos perdidos por loja de aluguer
+              </CardDescription>
+            </CardHeader>
+            <CardContent>
+              <ResponsiveContainer width="100%" height={300}>
+                <BarChart data={storeLoss}>
+                  <CartesianGrid strokeDasharray="3 3" />
+                  <XAxis dataKey="loja" />
+                  <YAxis unit="%" />
+                  <Tooltip />
+                  <Bar dataKey="taxa_perda" name="Taxa de perda (%)" fill="#FF8042" />
+                </BarChart>
+              </ResponsiveContainer>
+            </CardContent>
+          </Card>
+        </div>
+      )}
+
       {/* Alertas e resumo */}
       <div className="grid grid-cols-1 md:grid-cols-3 gap-4">
         <Card>
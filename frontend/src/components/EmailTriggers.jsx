@@ -59,6 +59,26 @@ export default function EmailTriggers() {
     }
   }
 
+  // As verificações correm em segundo plano: acompanhar a tarefa até terminar
+  const waitForJob = async (job) => {
+    while (job.status === 'queued' || job.status === 'running') {
+      await new Promise(resolve => setTimeout(resolve, 2000))
+      const response = await fetch(`${API_BASE}/jobs/${job.id}`, {
+        headers: {
+          'Authorization': `Bearer ${token}`
+        }
+      })
+      if (!response.ok) {
+        throw new Error('Erro ao obter o estado da tarefa')
+      }
+      job = await response.json()
+    }
+    if (job.status === 'failed') {
+      throw new Error(job.error || 'A tarefa falhou')
+    }
+    return job.result
+  }
+
   const checkNewEmails = async () => {
     try {
       setCheckingEmails(true)
@@ -70,7 +90,7 @@ export default function EmailTriggers() {
       })
       
       if (response.ok) {
-        const data = await response.json()
+        const data = await waitForJob((await response.json()).job)
         toast.success(`${data.processed_count} novos emails processados`)
         fetchEmailTriggers()
       } else {
@@ -95,7 +115,7 @@ export default function EmailTriggers() {
       })
       
       if (response.ok) {
-        const data = await response.json()
+        const data = await waitForJob((await response.json()).job)
         toast.success(`${data.success} emails processados com sucesso, ${data.failed} falhas`)
         fetchEmailTriggers()
       } else {
@@ -20,6 +20,9 @@ export default function Reports() {
   const [reportType, setReportType] = useState('summary')
   const [dateRange, setDateRange] = useState('last_month')
   const [status, setStatus] = useState('all')
+  const [exportFormat, setExportFormat] = useState('xlsx')
+  const [startDate, setStartDate] = useState('')
+  const [endDate, setEndDate] = useState('')
   const [loading, setLoading] = useState(false)
   const { token, API_BASE } = useAuth()
 
@@ -48,25 +51,95 @@ export default function Reports() {
     { value: 'perdido', label: 'Perdido' }
   ]
 
+  const exportFormats = [
+    { value: 'xlsx', label: 'Excel (XLSX)' },
+    { value: 'csv', label: 'CSV' },
+    { value: 'ndjson', label: 'NDJSON' }
+  ]
+
+  const exportVehicles = async () => {
+    const params = new URLSearchParams({ format: exportFormat })
+    if (status !== 'all') params.set('status', status)
+    if (exportFormat === 'csv') params.set('delimiter', ';')
+
+    await downloadFile(`/vehicles/export?${params}`, `veiculos.${exportFormat}`)
+  }
+
+  const downloadFile = async (path, filename) => {
+    const response = await fetch(`${API_BASE}${path}`, {
+      headers: {
+        'Authorization': `Bearer ${token}`
+      }
+    })
+    if (!response.ok) {
+      const data = await response.json().catch(() => ({}))
+      throw new Error(data.error || 'Erro ao descarregar o relatório')
+    }
+
+    const blob = await response.blob()
+    const url = URL.createObjectURL(blob)
+    const link = document.createElement('a')
+    link.href = url
+    link.download = filename
+    document.body.appendChild(link)
+    link.click()
+    link.remove()
+    URL.revokeObjectURL(url)
+  }
+
+  const waitForJob = async (job) => {
+    while (job.status === 'queued' || job.status === 'running') {
+      await new Promise(resolve => setTimeout(resolve, 2000))
+      const response = await fetch(`${API_BASE}/jobs/${job.id}`, {
+        headers: {
+          'Authorization': `Bearer ${token}`
+        }
+      })
+      if (!response.ok) {
+        throw new Error('Erro ao obter o estado da tarefa')
+      }
+      job = await response.json()
+    }
+    if (job.status === 'failed') {
+      throw new Error(job.error || 'A geração do relatório falhou')
+    }
+    return job
+  }
+
   const generateReport = async () => {
     setLoading(true)
     try {
-      // Simular geração de relatório
-      await new Promise(resolve => setTimeout(resolve, 2000))
-      
-      // Em implementação real, faria chamada à API:
-      // const response = await fetch(`${API_BASE}/reports/generate`, {
-      //   method: 'POST',
-      //   headers: {
-      //     'Content-Type': 'application/json',
-      //     'Authorization': `Bearer ${token}`
-      //   },
-      //   body: JSON.stringify({ type: reportType, dateRange, status })
-      // })
-      
-      alert('Relatório gerado com sucesso! (Funcionalidade em desenvolvimento)')
+      if (reportType === 'vehicles') {
+        await exportVehicles()
+        return
+      }
+
+      // O relatório é gerado em segundo plano; se já existir em cache a tarefa vem concluída
+      const response = await fetch(`${API_BASE}/reports/generate`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          'Authorization': `Bearer ${token}`
+        },
+        body: JSON.stringify({
+          type: reportType,
+          date_range: dateRange,
+          start_date: startDate || undefined,
+          end_date: endDate || undefined,
+          status,
+          format: exportFormat
+        })
+      })
+      const data = await response.json().catch(() => ({}))
+      if (!response.ok) {
+        throw new Error(data.error || 'Erro ao gerar relatório')
+      }
+
+      const job = await waitForJob(data.job)
+      await downloadFile(`/reports/${job.id}/download`, job.result.artifact.filename)
     } catch (error) {
       console.error('Erro ao gerar relatório:', error)
+      alert(error.message)
     } finally {
       setLoading(false)
     }
@@ -149,15 +222,33 @@ export default function Reports() {
             </div>
           </div>
 
+          <div className="grid grid-cols-1 md:grid-cols-3 gap-4">
+            <div className="space-y-2">
+              <Label>Formato</Label>
+              <Select value={exportFormat} onValueChange={setExportFormat}>
+                <SelectTrigger>
+                  <SelectValue />
+                </SelectTrigger>
+                <SelectContent>
+                  {exportFormats.map(format => (
+                    <SelectItem key={format.value} value={format.value}>
+                      {format.label}
+                    </SelectItem>
+                  ))}
+                </SelectContent>
+              </Select>
+            </div>
+          </div>
+
           {dateRange === 'custom' && (
             <div className="grid grid-cols-1 md:grid-cols-2 gap-4">
               <div className="space-y-2">
                 <Label>Data Início</Label>
-                <Input type="date" />
+                <Input type="date" value={startDate} onChange={(e) => setStartDate(e.target.value)} />
               </div>
               <div className="space-y-2">
                 <Label>Data Fim</Label>
-                <Input type="date" />
+                <Input type="date" value={endDate} onChange={(e) => setEndDate(e.target.value)} />
               </div>
             </div>
           )}
@@ -75,6 +75,28 @@ export default function VehicleDetail() {
     }
   }
 
+  const loadMoreUpdates = async () => {
+    try {
+      const cursor = encodeURIComponent(vehicle.atualizacoes_next_cursor)
+      const response = await fetch(`${API_BASE}/vehicles/${id}/updates?cursor=${cursor}`, {
+        headers: {
+          'Authorization': `Bearer ${token}`
+        }
+      })
+      
+      if (response.ok) {
+        const data = await response.json()
+        setVehicle(prev => ({
+          ...prev,
+          atualizacoes: [...prev.atualizacoes, ...data.items],
+          atualizacoes_next_cursor: data.next_cursor
+        }))
+      }
+    } catch (error) {
+      console.error('Erro ao carregar atualizações:', error)
+    }
+  }
+
   const handleAddUpdate = async (e) => {
     e.preventDefault()
     
@@ -123,6 +145,30 @@ export default function VehicleDetail() {
     }
   }
 
+  const handleDownloadDossier = async () => {
+    try {
+      const response = await fetch(`${API_BASE}/reports/vehicle/${id}?format=pdf`, {
+        headers: {
+          'Authorization': `Bearer ${token}`
+        }
+      })
+      
+      if (response.ok) {
+        const blob = await response.blob()
+        const url = window.URL.createObjectURL(blob)
+        const a = document.createElement('a')
+        a.style.display = 'none'
+        a.href = url
+        a.download = `dossie_${vehicle.matricula}.pdf`
+        document.body.appendChild(a)
+        a.click()
+        window.URL.revokeObjectURL(url)
+      }
+    } catch (error) {
+      console.error('Erro ao gerar o dossiê:', error)
+    }
+  }
+
   if (loading) {
     return (
       <div className="flex items-center justify-center h-64">
@@ -161,12 +207,18 @@ export default function VehicleDetail() {
             {statusLabels[vehicle.status]}
           </Badge>
         </div>
-        <Button asChild>
-          <Link to={`/vehicles/${id}/edit`}>
-            <Edit className="h-4 w-4 mr-2" />
-            Editar
-          </Link>
-        </Button>
+        <div className="flex items-center gap-2">
+          <Button variant="outline" onClick={handleDownloadDossier}>
+            <Download className="h-4 w-4 mr-2" />
+            Dossiê PDF
+          </Button>
+          <Button asChild>
+            <Link to={`/vehicles/${id}/edit`}>
+              <Edit className="h-4 w-4 mr-2" />
+              Editar
+            </Link>
+          </Button>
+        </div>
       </div>
 
       {/* Informações principais */}
@@ -338,7 +390,7 @@ export default function VehicleDetail() {
       <Tabs defaultValue="timeline" className="space-y-4">
         <TabsList>
           <TabsTrigger value="timeline">
-            Timeline ({vehicle.atualizacoes?.length || 0})
+            Timeline ({vehicle.atualizacoes_total ?? vehicle.atualizacoes?.length ?? 0})
           </TabsTrigger>
           <TabsTrigger value="documents">
             Documentos ({vehicle.documentos?.length || 0})
@@ -437,6 +489,13 @@ export default function VehicleDetail() {
                 </CardContent>
               </Card>
             )}
+            {vehicle.atualizacoes_next_cursor && (
+              <div className="text-center">
+                <Button variant="outline" onClick={loadMoreUpdates}>
+                  Carregar mais
+                </Button>
+              </div>
+            )}
           </div>
         </TabsContent>
 
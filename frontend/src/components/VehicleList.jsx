@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react'
+import { useState, useEffect, useRef } from 'react'
 import { Link } from 'react-router-dom'
 import { useAuth } from '../contexts/AuthContext'
 import { Card, CardContent, CardDescription, CardHeader, CardTitle } from '@/components/ui/card'
@@ -24,6 +24,14 @@ const statusColors = {
   'perdido': 'bg-red-100 text-red-800 border-red-300'
 }
 
+// Veículos por página (GET /vehicles pagina por cursor)
+const PAGE_SIZE = 50
+// A pesquisa por texto (GET /vehicles/search) devolve no máximo 100 resultados, sem paginação
+const SEARCH_LIMIT = 100
+const SEARCH_MIN_LENGTH = 2
+// Espera depois da última tecla antes de pedir a pesquisa ao servidor
+const SEARCH_DELAY_MS = 300
+
 const statusLabels = {
   'em_tratamento': 'Em Tratamento',
   'submetido': 'Submetido',
@@ -33,24 +41,52 @@ const statusLabels = {
 
 export default function VehicleList() {
   const [vehicles, setVehicles] = useState([])
-  const [filteredVehicles, setFilteredVehicles] = useState([])
+  const [nextCursor, setNextCursor] = useState(null)
+  const [total, setTotal] = useState(null)
+  const [marcas, setMarcas] = useState([])
   const [loading, setLoading] = useState(true)
+  const [fetching, setFetching] = useState(false)
   const [searchTerm, setSearchTerm] = useState('')
   const [statusFilter, setStatusFilter] = useState('all')
   const [marcaFilter, setMarcaFilter] = useState('all')
+  // Só a resposta do pedido mais recente é mostrada (os filtros podem mudar antes de a anterior chegar)
+  const requestId = useRef(0)
   const { token, API_BASE } = useAuth()
 
+  // Termos com menos de SEARCH_MIN_LENGTH caracteres não são pesquisados (a lista fica sem este filtro)
+  const trimmed = searchTerm.trim()
+  const searching = trimmed.length >= SEARCH_MIN_LENGTH
+  const search = searching ? trimmed : ''
+  const filtering = searching || statusFilter !== 'all' || marcaFilter !== 'all'
+
   useEffect(() => {
-    fetchVehicles()
+    fetchMarcas()
   }, [])
 
   useEffect(() => {
-    filterVehicles()
-  }, [vehicles, searchTerm, statusFilter, marcaFilter])
+    // Filtros novos: recomeçar a lista do início, no servidor
+    setVehicles([])
+    setNextCursor(null)
+    setTotal(null)
+    setFetching(true)
+    const timer = setTimeout(fetchVehicles, searching ? SEARCH_DELAY_MS : 0)
+    return () => clearTimeout(timer)
+  }, [search, statusFilter, marcaFilter])
 
-  const fetchVehicles = async () => {
+  const filterParams = () => {
+    const queryParams = new URLSearchParams()
+    if (statusFilter !== 'all') {
+      queryParams.append('status', statusFilter)
+    }
+    if (marcaFilter !== 'all') {
+      queryParams.append('marca', marcaFilter)
+    }
+    return queryParams
+  }
+
+  const fetchMarcas = async () => {
     try {
-      const response = await fetch(`${API_BASE}/vehicles`, {
+      const response = await fetch(`${API_BASE}/vehicles/marcas`, {
         headers: {
           'Authorization': `Bearer ${token}`
         }
@@ -58,44 +94,59 @@ export default function VehicleList() {
       
       if (response.ok) {
         const data = await response.json()
-        setVehicles(data)
+        setMarcas(data.marcas)
       }
     } catch (error) {
-      console.error('Erro ao carregar veículos:', error)
-    } finally {
-      setLoading(false)
+      console.error('Erro ao carregar marcas:', error)
     }
   }
 
-  const filterVehicles = () => {
-    let filtered = vehicles
-
-    // Filtro por termo de pesquisa
-    if (searchTerm) {
-      filtered = filtered.filter(vehicle => 
-        vehicle.matricula.toLowerCase().includes(searchTerm.toLowerCase()) ||
-        vehicle.marca.toLowerCase().includes(searchTerm.toLowerCase()) ||
-        vehicle.modelo.toLowerCase().includes(searchTerm.toLowerCase()) ||
-        (vehicle.vin && vehicle.vin.toLowerCase().includes(searchTerm.toLowerCase()))
-      )
-    }
-
-    // Filtro por status
-    if (statusFilter !== 'all') {
-      filtered = filtered.filter(vehicle => vehicle.status === statusFilter)
-    }
-
-    // Filtro por marca
-    if (marcaFilter !== 'all') {
-      filtered = filtered.filter(vehicle => vehicle.marca === marcaFilter)
+  const fetchVehicles = async (cursor = null) => {
+    const current = ++requestId.current
+    try {
+      const queryParams = filterParams()
+      let url
+      if (searching) {
+        queryParams.append('q', search)
+        queryParams.append('limit', SEARCH_LIMIT)
+        url = `${API_BASE}/vehicles/search?${queryParams}`
+      } else {
+        queryParams.append('limit', PAGE_SIZE)
+        if (cursor) {
+          queryParams.append('cursor', cursor)
+        } else {
+          queryParams.append('include_total', 'true')
+        }
+        url = `${API_BASE}/vehicles?${queryParams}`
+      }
+      const response = await fetch(url, {
+        headers: {
+          'Authorization': `Bearer ${token}`
+        }
+      })
+      
+      if (response.ok && current === requestId.current) {
+        const data = await response.json()
+        if (searching) {
+          setVehicles(data.results.map(result => result.vehicle))
+          setNextCursor(null)
+          setTotal(data.count)
+        } else {
+          setVehicles(prev => cursor ? [...prev, ...data.vehicles] : data.vehicles)
+          setNextCursor(data.next_cursor)
+          if (!cursor) {
+            setTotal(data.total)
+          }
+        }
+      }
+    } catch (error) {
+      console.error('Erro ao carregar veículos:', error)
+    } finally {
+      setLoading(false)
+      if (current === requestId.current) {
+        setFetching(false)
+      }
     }
-
-    setFilteredVehicles(filtered)
-  }
-
-  const getUniqueMarcas = () => {
-    const marcas = [...new Set(vehicles.map(v => v.marca))].sort()
-    return marcas
   }
 
   if (loading) {
@@ -112,7 +163,10 @@ export default function VehicleList() {
         <div>
           <h1 className="text-2xl font-bold">Veículos</h1>
           <p className="text-muted-foreground">
-            Gerir todos os veículos no sistema ({filteredVehicles.length} de {vehicles.length})
+            {searching
+              ? `${vehicles.length} resultado(s) da pesquisa`
+              : `Gerir todos os veículos no sistema (${vehicles.length} de ${total ?? vehicles.length})`
+            }
           </p>
         </div>
         <Button asChild>
@@ -138,7 +192,7 @@ export default function VehicleList() {
               <div className="relative">
                 <Search className="absolute left-3 top-1/2 transform -translate-y-1/2 h-4 w-4 text-muted-foreground" />
                 <Input
-                  placeholder="Matrícula, marca, modelo, VIN..."
+                  placeholder="Matrícula, VIN, cliente..."
                   value={searchTerm}
                   onChange={(e) => setSearchTerm(e.target.value)}
                   className="pl-10"
@@ -170,7 +224,7 @@ export default function VehicleList() {
                 </SelectTrigger>
                 <SelectContent>
                   <SelectItem value="all">Todas as marcas</SelectItem>
-                  {getUniqueMarcas().map(marca => (
+                  {marcas.map(marca => (
                     <SelectItem key={marca} value={marca}>{marca}</SelectItem>
                   ))}
                 </SelectContent>
@@ -182,7 +236,7 @@ export default function VehicleList() {
 
       {/* Lista de veículos */}
       <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-4">
-        {filteredVehicles.map((vehicle) => (
+        {vehicles.map((vehicle) => (
           <Card key={vehicle.id} className="hover:shadow-md transition-shadow">
             <CardHeader className="pb-3">
               <div className="flex items-start justify-between">
@@ -219,15 +273,18 @@ export default function VehicleList() {
                 </div>
               )}
               
-              <div className="flex items-center gap-2 text-sm text-muted-foreground">
-                <Calendar className="h-4 w-4" />
-                <span>
-                  {vehicle.data_submissao 
-                    ? new Date(vehicle.data_submissao).toLocaleDateString('pt-PT')
-                    : 'Data não definida'
-                  }
-                </span>
-              </div>
+              {/* Os resultados da pesquisa não trazem a data de submissão */}
+              {'data_submissao' in vehicle && (
+                <div className="flex items-center gap-2 text-sm text-muted-foreground">
+                  <Calendar className="h-4 w-4" />
+                  <span>
+                    {vehicle.data_submissao 
+                      ? new Date(vehicle.data_submissao).toLocaleDateString('pt-PT')
+                      : 'Data não definida'
+                    }
+                  </span>
+                </div>
+              )}
               
               <div className="flex gap-2 pt-2">
                 <Button variant="outline" size="sm" asChild className="flex-1">
@@ -248,18 +305,26 @@ export default function VehicleList() {
         ))}
       </div>
 
-      {filteredVehicles.length === 0 && !loading && (
+      {nextCursor && (
+        <div className="text-center">
+          <Button variant="outline" onClick={() => fetchVehicles(nextCursor)}>
+            Carregar mais
+          </Button>
+        </div>
+      )}
+
+      {vehicles.length === 0 && !loading && !fetching && (
         <Card>
           <CardContent className="text-center py-8">
             <Car className="h-12 w-12 text-muted-foreground mx-auto mb-4" />
             <h3 className="text-lg font-medium mb-2">Nenhum veículo encontrado</h3>
             <p className="text-muted-foreground mb-4">
-              {vehicles.length === 0 
-                ? 'Ainda não há veículos registados no sistema.'
-                : 'Tente ajustar os filtros de pesquisa.'
+              {filtering
+                ? 'Tente ajustar os filtros de pesquisa.'
+                : 'Ainda não há veículos registados no sistema.'
               }
             </p>
-            {vehicles.length === 0 && (
+            {!filtering && (
               <Button asChild>
                 <Link to="/vehicles/new">
                   Adicionar Primeiro Veículo
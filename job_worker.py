@@ -0,0 +1,63 @@
+import os
+import sys
+import signal
+import logging
+import threading
+from dotenv import load_dotenv
+
+# Configurar logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('job_worker')
+
+# Carregar variáveis de ambiente
+load_dotenv()
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from src.main import app
+from src.services import email_jobs, reports
+from src.services.document_storage import StorageNotShared, require_shared_storage
+from src.services.job_queue import Worker
+
+# Configurações
+JOB_WORKER_THREADS = int(os.getenv('JOB_WORKER_THREADS', '1'))
+# Tipos de tarefa a executar (separados por vírgulas); vazio executa todos
+JOB_KINDS = [kind.strip() for kind in os.getenv('JOB_KINDS', '').split(',') if kind.strip()] or None
+# Tarefas que gravam ficheiros (anexos de email, relatórios) que depois são servidos pelo web
+DOCUMENT_KINDS = {email_jobs.CHECK_NEW, reports.GENERATE}
+
+def main():
+    """Executar as tarefas em segundo plano (verificação de emails, processamento automático, ...)"""
+    if JOB_KINDS is None or DOCUMENT_KINDS.intersection(JOB_KINDS):
+        try:
+            require_shared_storage('anexos e relatórios')
+        except StorageNotShared as e:
+            logger.error(str(e))
+            sys.exit(1)
+    
+    stop_event = threading.Event()
+    
+    def stop(signum, frame):
+        logger.info("A terminar depois das tarefas em curso...")
+        stop_event.set()
+    
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    
+    threads = []
+    for index in range(JOB_WORKER_THREADS):
+        worker = Worker(app, kinds=JOB_KINDS)
+        worker.worker_id = f'{worker.worker_id}:{index}'
+        thread = threading.Thread(target=worker.run, args=(stop_event,), name=worker.worker_id)
+        thread.start()
+        threads.append(thread)
+        logger.info(f"Worker {worker.worker_id} iniciado")
+    
+    for thread in threads:
+        thread.join()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Índices das consultas mais frequentes
+
+Revision ID: 0001_hot_path_indexes
+Revises:
+Create Date: 2026-10-18 10:00:00
+
+Primeira migração gerida pelo Flask-Migrate. Parte do esquema atual (criado
+pelos scripts de src/scripts) e só acrescenta índices, por isso pode ser
+aplicada a uma base de dados existente com `flask db upgrade`.
+
+Cada índice segue a forma real das consultas: a listagem de veículos ordena
+por (created_at DESC NULLS LAST, id DESC) com filtro opcional de estado, a
+timeline por (data_atualizacao DESC NULLS LAST, id DESC) dentro do veículo, os
+emails por received_at com filtro processed e o processamento automático
+percorre os emails por processar por id. Os filtros marca/loja usam ILIKE
+'%...%', que só um índice de trigramas (pg_trgm) consegue servir.
+
+Em PostgreSQL os índices são criados com CREATE INDEX CONCURRENTLY, sem
+bloquear as escritas. Se uma criação for interrompida, o índice fica INVALID;
+apague-o (DROP INDEX CONCURRENTLY ...) e volte a correr a migração.
+"""
+import logging
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001_hot_path_indexes'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+logger = logging.getLogger('alembic.env')
+
+
+# (nome, tabela, colunas em PostgreSQL, colunas em SQLite, condição em PostgreSQL, condição em SQLite)
+# O SQLite não aceita NULLS LAST num índice; com DESC os NULL já ficam no fim.
+INDEXES = [
+    ('ix_vehicle_created_at_id', 'vehicle',
+     'created_at DESC NULLS LAST, id DESC', 'created_at DESC, id DESC', None, None),
+    ('ix_vehicle_status_created_at_id', 'vehicle',
+     'status, created_at DESC NULLS LAST, id DESC', 'status, created_at DESC, id DESC', None, None),
+    ('ix_vehicle_data_submissao_id', 'vehicle',
+     'data_submissao DESC, id DESC', 'data_submissao DESC, id DESC', None, None),
+    ('ix_vehicle_case_start', 'vehicle',
+     'coalesce(data_desaparecimento, data_submissao)', 'coalesce(data_desaparecimento, data_submissao)',
+     None, None),
+    ('ix_vehicle_open', 'vehicle', 'id', 'id',
+     "status IN ('em_tratamento', 'submetido')", "status IN ('em_tratamento', 'submetido')"),
+    ('ix_vehicle_update_timeline', 'vehicle_update',
+     'vehicle_id, data_atualizacao DESC NULLS LAST, id DESC', 'vehicle_id, data_atualizacao DESC, id DESC',
+     None, None),
+    ('ix_document_vehicle_data_upload', 'document',
+     'vehicle_id, data_upload DESC', 'vehicle_id, data_upload DESC', None, None),
+    ('ix_email_trigger_received_at', 'email_trigger', 'received_at DESC', 'received_at DESC', None, None),
+    ('ix_email_trigger_processed_received_at', 'email_trigger',
+     'processed, received_at DESC', 'processed, received_at DESC', None, None),
+    ('ix_email_trigger_unprocessed', 'email_trigger', 'id', 'id', 'processed = false', 'processed = 0'),
+    ('ix_email_trigger_vehicle_id', 'email_trigger', 'vehicle_id', 'vehicle_id',
+     'vehicle_id IS NOT NULL', 'vehicle_id IS NOT NULL'),
+    ('ix_store_location_rent_a_car_id', 'store_location', 'rent_a_car_id', 'rent_a_car_id', None, None),
+    ('ix_car_model_brand_id', 'car_model', 'brand_id', 'brand_id', None, None),
+]
+
+# Só em PostgreSQL: filtros marca=/loja= da listagem (ILIKE '%texto%')
+PG_TRGM_INDEXES = [
+    ('ix_vehicle_marca_trgm', 'vehicle', 'marca gin_trgm_ops'),
+    ('ix_vehicle_loja_aluguer_trgm', 'vehicle', 'loja_aluguer gin_trgm_ops'),
+]
+
+ANALYZED_TABLES = ('vehicle', 'vehicle_update', 'document', 'email_trigger', 'store_location', 'car_model')
+
+
+def _is_postgres():
+    return op.get_bind().dialect.name == 'postgresql'
+
+
+def upgrade():
+    if not _is_postgres():
+        for name, table, _, columns, _, where in INDEXES:
+            op.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"
+                       + (f" WHERE {where}" if where else ''))
+        op.execute('ANALYZE')
+        return
+
+    trgm_available = op.get_bind().execute(
+        sa.text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+    ).scalar() is not None
+    if trgm_available:
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    else:
+        logger.warning('Extensão pg_trgm indisponível; os índices de trigramas de marca/loja não foram criados.')
+    # CREATE INDEX CONCURRENTLY não pode correr dentro de uma transação
+    with op.get_context().autocommit_block():
+        for name, table, columns, _, where, _ in INDEXES:
+            op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({columns})"
+                       + (f" WHERE {where}" if where else ''))
+        if trgm_available:
+            for name, table, columns in PG_TRGM_INDEXES:
+                op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} USING gin ({columns})")
+        # Estatísticas atualizadas para o planeador escolher os índices novos
+        op.execute(f"ANALYZE {', '.join(ANALYZED_TABLES)}")
+
+
+def downgrade():
+    names = [index[0] for index in INDEXES]
+    if not _is_postgres():
+        for name in names:
+            op.execute(f"DROP INDEX IF EXISTS {name}")
+        return
+
+    names += [index[0] for index in PG_TRGM_INDEXES]
+    with op.get_context().autocommit_block():
+        for name in names:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
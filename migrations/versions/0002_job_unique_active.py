@@ -0,0 +1,90 @@
+"""Uma só tarefa ativa por tipo para as tarefas criadas com unique_active
+
+Revision ID: 0002_job_unique_active
+Revises: 0001_hot_path_indexes
+Create Date: 2026-10-18 21:00:00
+
+enqueue(unique_active=True) verificava se já havia uma tarefa do mesmo tipo na
+fila ou em execução antes de inserir, mas dois pedidos simultâneos podiam
+passar ambos a verificação. A coluna job.unique_active marca essas tarefas e o
+índice único parcial uq_job_kind_active garante que há no máximo uma ativa por
+tipo; a segunda inserção falha e enqueue devolve a que já existe.
+
+As tarefas existentes ficam com unique_active = false, pelo que o índice pode
+ser criado mesmo que haja tarefas repetidas na fila.
+
+A migração serve os dois caminhos de instalação: se a tabela job ainda não
+existe é criada já com a coluna e o índice; se foi criada por
+src/scripts/create_job_table.py ou db.create_all (a partir do modelo atual),
+só se acrescenta o que faltar.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002_job_unique_active'
+down_revision = '0001_hot_path_indexes'
+branch_labels = None
+depends_on = None
+
+
+ACTIVE_CONDITION = "unique_active AND status IN ('queued', 'running')"
+
+
+def _create_job_table():
+    """Tabela job tal como o modelo src/models/job.py a define"""
+    op.create_table(
+        'job',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('kind', sa.String(length=50), nullable=False),
+        sa.Column('payload', sa.JSON(), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('idempotency_key', sa.String(length=200), nullable=True),
+        sa.Column('unique_active', sa.Boolean(), nullable=False, server_default=sa.false()),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('max_attempts', sa.Integer(), nullable=False),
+        sa.Column('run_after', sa.DateTime(), nullable=False),
+        sa.Column('progress', sa.Integer(), nullable=False),
+        sa.Column('progress_message', sa.String(length=200), nullable=True),
+        sa.Column('result', sa.JSON(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('locked_by', sa.String(length=100), nullable=True),
+        sa.Column('locked_at', sa.DateTime(), nullable=True),
+        sa.Column('created_by', sa.Integer(), sa.ForeignKey('user.id'), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+    )
+    op.create_index('ix_job_kind', 'job', ['kind'])
+    op.create_index('ix_job_idempotency_key', 'job', ['idempotency_key'], unique=True)
+    op.create_index('ix_job_status_run_after', 'job', ['status', 'run_after'])
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('job'):
+        _create_job_table()
+        columns, indexes = {'unique_active'}, set()
+    else:
+        columns = {column['name'] for column in inspector.get_columns('job')}
+        indexes = {index['name'] for index in inspector.get_indexes('job')}
+
+    if 'unique_active' not in columns:
+        op.add_column('job', sa.Column('unique_active', sa.Boolean(), nullable=False, server_default=sa.false()))
+    if 'uq_job_kind_active' not in indexes:
+        op.create_index('uq_job_kind_active', 'job', ['kind'], unique=True,
+                        postgresql_where=sa.text(ACTIVE_CONDITION), sqlite_where=sa.text(ACTIVE_CONDITION))
+
+
+def downgrade():
+    # A tabela job fica (pode ter sido criada pelos scripts antes desta migração); só sai o que ela acrescentou
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('job'):
+        return
+    if 'uq_job_kind_active' in {index['name'] for index in inspector.get_indexes('job')}:
+        op.drop_index('uq_job_kind_active', table_name='job')
+    if 'unique_active' in {column['name'] for column in inspector.get_columns('job')}:
+        with op.batch_alter_table('job') as batch_op:
+            batch_op.drop_column('unique_active')
@@ -2,7 +2,6 @@ import os
 import sys
 import time
 import schedule
-import requests
 import logging
 from dotenv import load_dotenv
 
@@ -20,66 +19,35 @@ logger = logging.getLogger('email_scheduler')
 # Carregar variáveis de ambiente
 load_dotenv()
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from src.main import app
+from src.services import email_jobs, job_queue
+
 # Configurações
-API_BASE = os.getenv('API_BASE', 'http://localhost:5000/api')
-ADMIN_USERNAME = os.getenv('ADMIN_USERNAME', 'admin')
-ADMIN_PASSWORD = os.getenv('ADMIN_PASSWORD', 'admin')
 CHECK_INTERVAL_MINUTES = int(os.getenv('CHECK_INTERVAL_MINUTES', '15'))
 
-def get_auth_token():
-    """Obter token de autenticação"""
-    try:
-        response = requests.post(
-            f"{API_BASE}/auth/login",
-            json={"username": ADMIN_USERNAME, "password": ADMIN_PASSWORD}
-        )
-        
-        if response.status_code == 200:
-            return response.json().get('token')
-        else:
-            logger.error(f"Falha na autenticação: {response.status_code} - {response.text}")
-            return None
-    except Exception as e:
-        logger.error(f"Erro ao obter token: {str(e)}")
-        return None
-
 def check_new_emails():
-    """Verificar novos emails"""
-    logger.info("Iniciando verificação de novos emails...")
-    
-    token = get_auth_token()
-    if not token:
-        logger.error("Não foi possível obter token de autenticação")
-        return
+    """Agendar a verificação de novos emails na fila de tarefas (executada por job_worker.py)"""
+    logger.info("A agendar verificação de novos emails...")
     
-    try:
-        # Verificar novos emails
-        check_response = requests.post(
-            f"{API_BASE}/email-triggers/check-new",
-            headers={"Authorization": f"Bearer {token}"}
-        )
-        
-        if check_response.status_code == 200:
-            check_data = check_response.json()
-            logger.info(f"Verificação concluída: {check_data.get('processed_count')} emails processados")
-            
-            # Se houver novos emails, processar automaticamente
-            if check_data.get('processed_count', 0) > 0:
-                process_response = requests.post(
-                    f"{API_BASE}/email-triggers/auto-process",
-                    headers={"Authorization": f"Bearer {token}"}
-                )
-                
-                if process_response.status_code == 200:
-                    process_data = process_response.json()
-                    logger.info(f"Processamento automático: {process_data.get('success')} sucesso, {process_data.get('failed')} falhas")
-                else:
-                    logger.error(f"Erro no processamento automático: {process_response.status_code} - {process_response.text}")
-        else:
-            logger.error(f"Erro na verificação de emails: {check_response.status_code} - {check_response.text}")
+    # Uma chave por intervalo: se o agendador for reiniciado não cria verificações repetidas
+    slot = int(time.time() // (CHECK_INTERVAL_MINUTES * 60))
     
-    except Exception as e:
-        logger.error(f"Erro ao verificar/processar emails: {str(e)}")
+    with app.app_context():
+        try:
+            job, created = job_queue.enqueue(
+                email_jobs.CHECK_NEW,
+                {'incremental': True, 'auto_process': True},
+                idempotency_key=f'{email_jobs.CHECK_NEW}:schedule:{slot}',
+                unique_active=True
+            )
+            if created:
+                logger.info(f"Tarefa {job.id} agendada")
+            else:
+                logger.info(f"Já existe a tarefa {job.id} ({job.status}); nada a agendar")
+        except Exception as e:
+            logger.error(f"Erro ao agendar a verificação de emails: {str(e)}")
 
 def main():
     logger.info(f"Iniciando agendador de verificação de emails (intervalo: {CHECK_INTERVAL_MINUTES} minutos)")
@@ -0,0 +1,171 @@
+"""Aplicação ASGI (uvicorn asgi:app): rotas de leitura assíncronas + Flask
+
+As listagens mais pedidas e dependentes da base de dados (GET /api/vehicles e
+GET /api/email-triggers) são servidas aqui de forma assíncrona, com asyncpg
+(ou aiosqlite): enquanto uma consulta espera pelo Neon o processo continua a
+atender outros pedidos, em vez de ocupar uma thread. Todas as outras rotas
+passam para a aplicação Flask (src/main.py) através de um pool de threads
+(a2wsgi), sem alterações.
+
+As rotas assíncronas usam as mesmas consultas e respostas que as rotas Flask
+(src/services/listings.py), a mesma autenticação (token JWT e cache de
+principais), o mesmo CORS e o mesmo encaminhamento para réplicas de leitura.
+
+Variáveis de ambiente: ASGI_WSGI_THREADS (8; threads para as rotas Flask),
+ASGI_ASYNC_ROUTES (true; false passa tudo pelo Flask).
+"""
+
+import logging
+import os
+from urllib.parse import parse_qsl
+
+import jwt
+from a2wsgi import WSGIMiddleware
+from flask_cors.core import get_cors_headers, get_cors_options
+from sqlalchemy import select
+from werkzeug.datastructures import Headers, MultiDict
+from werkzeug.exceptions import InternalServerError
+from werkzeug.http import parse_cookie
+
+from src.main import CORS_OPTIONS, app as flask_app
+from src.models.user import User
+from src.services.async_db import AsyncEngines
+from src.services.auth_cache import AuthPrincipal, principal_cache
+from src.services.db_routing import PIN_COOKIE
+from src.services.listings import EmailTriggerListing, VehicleListing
+from src.services.pagination import InvalidCursor
+from src.services.serialization import InvalidFields, dumps
+
+logger = logging.getLogger(__name__)
+
+WSGI_THREADS = int(os.getenv('ASGI_WSGI_THREADS', '8'))
+ASYNC_ROUTES_ENABLED = os.getenv('ASGI_ASYNC_ROUTES', 'true').strip().lower() in ('1', 'true', 'yes', 'on')
+
+PRINCIPAL_COLUMNS = (User.id, User.username, User.email, User.role, User.rent_a_car_id, User.created_at,
+                     User.is_active)
+
+
+class Unauthorized(Exception):
+    """Pedido sem token válido (mesmas mensagens que token_required)"""
+
+
+class AsyncRequest:
+    def __init__(self, scope):
+        self.headers = Headers([(key.decode('latin-1'), value.decode('latin-1'))
+                                for key, value in scope['headers']])
+        self.args = MultiDict(parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True))
+        self.cookies = parse_cookie(self.headers.get('Cookie', ''))
+
+
+class AsyncApp:
+    """Encaminhar os pedidos para as rotas assíncronas ou para a aplicação Flask"""
+
+    def __init__(self, wsgi_app, database_url):
+        self.wsgi = WSGIMiddleware(wsgi_app, workers=WSGI_THREADS)
+        self.engines = AsyncEngines(database_url)
+        self.cors_options = get_cors_options(wsgi_app, CORS_OPTIONS)
+        self.routes = {
+            '/api/vehicles': self.get_vehicles,
+            '/api/email-triggers': self.get_email_triggers,
+        } if ASYNC_ROUTES_ENABLED else {}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        handler = self.routes.get(scope['path']) if scope['type'] == 'http' and scope['method'] == 'GET' else None
+        if handler is None:
+            await self.wsgi(scope, receive, send)
+            return
+
+        request = AsyncRequest(scope)
+        try:
+            current_user = await self.authenticate(request)
+            status, body = await handler(request, current_user)
+        except Unauthorized as e:
+            status, body = 401, {'message': str(e)}
+        except Exception:
+            logger.exception('Erro em %s', scope['path'])
+            error = InternalServerError()
+            await self.send(send, request, error.code, error.get_body().encode('utf-8'), 'text/html; charset=utf-8')
+            return
+        await self.send(send, request, status, dumps(body) + b'\n', 'application/json')
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.engines.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def send(self, send, request, status, payload, content_type):
+        headers = [(b'content-type', content_type.encode('latin-1')),
+                   (b'content-length', str(len(payload)).encode('latin-1'))]
+        for name, value in get_cors_headers(self.cors_options, request.headers, 'GET').items():
+            headers.append((name.lower().encode('latin-1'), value.encode('latin-1')))
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': payload})
+
+    async def authenticate(self, request):
+        """Equivalente assíncrono de token_required (partilha a cache de principais)"""
+        token = None
+        if 'Authorization' in request.headers:
+            try:
+                token = request.headers['Authorization'].split(" ")[1]  # Bearer TOKEN
+            except IndexError:
+                raise Unauthorized('Token format invalid')
+        if not token:
+            raise Unauthorized('Token is missing')
+
+        current_user = principal_cache.get(token)
+        if current_user is not None:
+            return current_user
+        try:
+            data = jwt.decode(token, flask_app.config['SECRET_KEY'], algorithms=['HS256'])
+        except jwt.ExpiredSignatureError:
+            raise Unauthorized('Token has expired')
+        except jwt.InvalidTokenError:
+            raise Unauthorized('Token is invalid')
+        async with self.engines.primary.connect() as connection:
+            user = (await connection.execute(
+                select(*PRINCIPAL_COLUMNS).where(User.id == data.get('user_id'))
+            )).first()
+        if not user or not user.is_active:
+            raise Unauthorized('Token is invalid')
+        current_user = AuthPrincipal.from_user(user)
+        principal_cache.set(token, current_user, data.get('exp'))
+        return current_user
+
+    def read_engine(self, request):
+        return self.engines.replica_engine(request.cookies.get(PIN_COOKIE), request.headers.get('Authorization'))
+
+    async def get_vehicles(self, request, current_user):
+        """GET /api/vehicles (ver get_vehicles em src/routes/vehicle.py)"""
+        try:
+            listing = VehicleListing(request.args)
+        except InvalidFields as e:
+            return 400, {'error': str(e)}
+        except InvalidCursor:
+            return 400, {'error': 'Cursor inválido'}
+        async with self.read_engine(request).connect() as connection:
+            rows = (await connection.execute(listing.statement())).all()
+            count_statement = listing.count_statement()
+            total = await connection.scalar(count_statement) if count_statement is not None else None
+        return 200, listing.response(rows, total)
+
+    async def get_email_triggers(self, request, current_user):
+        """GET /api/email-triggers (ver get_email_triggers em src/routes/email_trigger.py)"""
+        try:
+            listing = EmailTriggerListing(request.args)
+        except InvalidFields as e:
+            return 400, {'error': str(e)}
+        async with self.read_engine(request).connect() as connection:
+            rows = (await connection.execute(listing.statement())).all()
+            total = await connection.scalar(listing.count_statement())
+        return 200, listing.response(rows, total)
+
+
+app = AsyncApp(flask_app, flask_app.config['SQLALCHEMY_DATABASE_URI'])
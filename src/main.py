@@ -22,25 +22,33 @@ from src.routes.auth import auth_bp
 from src.routes.document import document_bp
 from src.routes.email_trigger import email_trigger_bp
 from src.routes.admin import admin_bp
+from src.routes.job import job_bp
+from src.routes.report import report_bp
+from src.routes.analytics import analytics_bp
 from src.routes.test_route import test_bp  # Importando o novo blueprint de teste
+from src.services.serialization import JSONProvider
+from src.services.db_engine import configure_engines, engine_options, replica_binds, resolve_database_url, sqlite_binds
+from src.services.db_routing import init_read_routing
 
 # Carregar variáveis de ambiente
 load_dotenv()
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
+# jsonify() com orjson (quando instalado) e datas em ISO 8601
+app.json = JSONProvider(app)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'asdf#FGSgvasgf$5$WGT')
 
 # Configurar CORS para permitir requests do frontend com credenciais
-cors = CORS(app, resources={
-    r"/*": {
-        "origins": ["http://localhost:3000", "http://localhost:5173", "https://rec-frontend.vercel.app"],
-        "supports_credentials": True,
-        "allow_headers": ["Content-Type", "Authorization"],
-        "expose_headers": ["Content-Type", "Authorization"],
-        "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-        "max_age": 3600
-    }
-})
+# (as mesmas opções são aplicadas às rotas assíncronas de src/asgi.py)
+CORS_OPTIONS = {
+    "origins": ["http://localhost:3000", "http://localhost:5173", "https://rec-frontend.vercel.app"],
+    "supports_credentials": True,
+    "allow_headers": ["Content-Type", "Authorization"],
+    "expose_headers": ["Content-Type", "Authorization"],
+    "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+    "max_age": 3600
+}
+cors = CORS(app, resources={r"/*": CORS_OPTIONS})
 
 app.register_blueprint(user_bp, url_prefix='/api')
 app.register_blueprint(vehicle_bp, url_prefix='/api')
@@ -48,6 +56,9 @@ app.register_blueprint(auth_bp, url_prefix='/api/auth')
 app.register_blueprint(document_bp, url_prefix='/api')
 app.register_blueprint(email_trigger_bp, url_prefix='/api')
 app.register_blueprint(admin_bp, url_prefix='/api/admin')
+app.register_blueprint(job_bp, url_prefix='/api')
+app.register_blueprint(report_bp, url_prefix='/api')
+app.register_blueprint(analytics_bp, url_prefix='/api')
 app.register_blueprint(test_bp)  # Registrando o novo blueprint de teste
 
 @app.route('/api/health')
@@ -64,13 +75,22 @@ if database_url is None:
     database_url = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
     print("AVISO: Usando SQLite como fallback. Configure DATABASE_URL para usar Neon.tech.")
 
+database_url = resolve_database_url(database_url)
 app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+# Pool de ligações, pre-ping, reciclagem e timeouts (ver src/services/db_engine.py)
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(database_url)
+# Em SQLite, um segundo engine só para leituras sobre o mesmo ficheiro (WAL);
+# com DATABASE_REPLICA_URLS, um engine por réplica de leitura
+app.config['SQLALCHEMY_BINDS'] = {**sqlite_binds(database_url), **replica_binds()}
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))  # 16MB max file size por padrão
 
 # Inicializar o banco de dados e o sistema de migração
 db.init_app(app)
 migrate = Migrate(app, db)
+with app.app_context():
+    configure_engines(db.engines)
+init_read_routing(app)
 
 # Não criar tabelas automaticamente, usar migrações em vez disso
 # with app.app_context():
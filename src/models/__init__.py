@@ -11,6 +11,10 @@ try:
     from . import store_location
     from . import car_model
     from . import vehicle
+    from . import stored_blob
+    from . import mailbox_checkpoint
+    from . import job
+    from . import recovery_rollup
 except ImportError as e:
     print(f"ERRO ao importar módulos no __init__.py: {e}")
 
@@ -28,7 +28,7 @@ class CarModel(db.Model):
     """Modelo para gerenciar modelos de carros"""
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
-    brand_id = db.Column(db.Integer, db.ForeignKey('car_brand.id'), nullable=False)
+    brand_id = db.Column(db.Integer, db.ForeignKey('car_brand.id'), nullable=False, index=True)
     description = db.Column(db.Text, nullable=True)
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -0,0 +1,36 @@
+from .user import db
+from datetime import datetime
+
+class MailboxCheckpoint(db.Model):
+    """Ponto de sincronização de uma pasta IMAP
+
+    Enquanto o UIDVALIDITY da pasta não mudar, os UIDs são crescentes e cada
+    sincronização só precisa de pedir as mensagens com UID > last_uid.
+    """
+    __table_args__ = (
+        db.UniqueConstraint('account', 'mailbox', name='uq_mailbox_checkpoint_account_mailbox'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    account = db.Column(db.String(120), nullable=False)
+    mailbox = db.Column(db.String(200), nullable=False, default='INBOX')
+    uidvalidity = db.Column(db.BigInteger, nullable=True)
+    last_uid = db.Column(db.BigInteger, nullable=False, default=0)
+    uidnext = db.Column(db.BigInteger, nullable=True)
+    last_synced_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<MailboxCheckpoint {self.account}/{self.mailbox} {self.uidvalidity}:{self.last_uid}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'account': self.account,
+            'mailbox': self.mailbox,
+            'uidvalidity': self.uidvalidity,
+            'last_uid': self.last_uid,
+            'uidnext': self.uidnext,
+            'last_synced_at': self.last_synced_at.isoformat() if self.last_synced_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
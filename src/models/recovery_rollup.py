@@ -0,0 +1,79 @@
+from .user import db
+from datetime import datetime
+
+class RecoveryRollup(db.Model):
+    """Agregados de recuperação por período (dia, semana ou mês) e dimensão
+
+    Mantida por src/services/recovery_analytics.py: cada linha resume os casos
+    cujo desaparecimento (ou, sem essa data, a submissão) cai no período.
+    """
+    __tablename__ = 'recovery_rollup'
+    __table_args__ = (
+        db.UniqueConstraint('granularity', 'dimension', 'bucket', 'dimension_value',
+                            name='uq_recovery_rollup_bucket'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    granularity = db.Column(db.String(10), nullable=False)  # day, week, month
+    bucket = db.Column(db.Date, nullable=False)  # Início do período (semanas começam à segunda-feira)
+    dimension = db.Column(db.String(20), nullable=False)  # total, marca, loja, rent_a_car
+    dimension_value = db.Column(db.String(100), nullable=False, default='')  # '' para total ou sem valor
+    casos = db.Column(db.Integer, nullable=False, default=0)
+    em_aberto = db.Column(db.Integer, nullable=False, default=0)
+    recuperados = db.Column(db.Integer, nullable=False, default=0)
+    perdidos = db.Column(db.Integer, nullable=False, default=0)
+    valor_perdido = db.Column(db.Numeric(14, 2), nullable=True)
+    # Dias até à recuperação (só casos recuperados com data de recuperação)
+    tempo_n = db.Column(db.Integer, nullable=False, default=0)
+    tempo_medio = db.Column(db.Float, nullable=True)
+    tempo_p50 = db.Column(db.Float, nullable=True)
+    tempo_p75 = db.Column(db.Float, nullable=True)
+    tempo_p90 = db.Column(db.Float, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<RecoveryRollup {self.granularity} {self.bucket} {self.dimension}={self.dimension_value}>'
+
+    # Colunas de cada ponto das séries, pela ordem esperada por point()
+    POINT_COLUMNS = ('bucket', 'casos', 'em_aberto', 'recuperados', 'perdidos', 'valor_perdido',
+                     'tempo_n', 'tempo_medio', 'tempo_p50', 'tempo_p75', 'tempo_p90')
+
+    @staticmethod
+    def point(values):
+        """Converter os valores de POINT_COLUMNS num ponto de uma série"""
+        (bucket, casos, em_aberto, recuperados, perdidos, valor_perdido,
+         tempo_n, tempo_medio, tempo_p50, tempo_p75, tempo_p90) = values
+        return {
+            'bucket': bucket.isoformat(),
+            'casos': casos,
+            'em_aberto': em_aberto,
+            'recuperados': recuperados,
+            'perdidos': perdidos,
+            'taxa_recuperacao': round(recuperados / casos, 4) if casos else None,
+            'taxa_perda': round(perdidos / casos, 4) if casos else None,
+            'valor_perdido': float(valor_perdido) if valor_perdido is not None else None,
+            'tempo_n': tempo_n,
+            'tempo_medio': tempo_medio,
+            'tempo_p50': tempo_p50,
+            'tempo_p75': tempo_p75,
+            'tempo_p90': tempo_p90
+        }
+
+    def to_dict(self):
+        values = self.point([getattr(self, name) for name in self.POINT_COLUMNS])
+        values.update({
+            'granularity': self.granularity,
+            'dimension': self.dimension,
+            'dimension_value': self.dimension_value
+        })
+        return values
+
+class RecoveryRollupDirty(db.Model):
+    """Meses cujos agregados têm de ser recalculados (marcados na mesma transação da alteração)"""
+    __tablename__ = 'recovery_rollup_dirty'
+
+    month = db.Column(db.Date, primary_key=True)
+    marked_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<RecoveryRollupDirty {self.month}>'
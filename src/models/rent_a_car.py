@@ -14,6 +14,10 @@ class RentACar(db.Model):
     website = db.Column(db.String(200), nullable=True)
     logo_url = db.Column(db.String(500), nullable=True)
     descricao = db.Column(db.Text, nullable=True)
+    # Domínios/endereços (separados por vírgulas) de onde chegam os emails desta empresa
+    email_domains = db.Column(db.String(500), nullable=True)
+    # Etiquetas e padrões próprios para extrair os dados dos emails (ver src/services/extraction.py)
+    email_template = db.Column(db.JSON, nullable=True)
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -38,6 +42,8 @@ class RentACar(db.Model):
             'website': self.website,
             'logo_url': self.logo_url,
             'descricao': self.descricao,
+            'email_domains': self.email_domains,
+            'email_template': self.email_template,
             'is_active': self.is_active,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
@@ -46,28 +52,48 @@ class RentACar(db.Model):
 class EmailTrigger(db.Model):
     """Modelo para registar emails recebidos e processados automaticamente"""
     id = db.Column(db.Integer, primary_key=True)
+    # Message-ID do email (ou sha256:<hex> do conteúdo, quando não existe); evita registar o mesmo email duas vezes
+    message_id = db.Column(db.String(255), nullable=True, unique=True, index=True)
     email_from = db.Column(db.String(120), nullable=False)
     email_subject = db.Column(db.String(200), nullable=True)
     email_body = db.Column(db.Text, nullable=True)
     processed = db.Column(db.Boolean, default=False)
     vehicle_id = db.Column(db.Integer, db.ForeignKey('vehicle.id'), nullable=True)
+    rent_a_car_id = db.Column(db.Integer, db.ForeignKey('rent_a_car.id'), nullable=True)  # Identificada pelo remetente
     extracted_data = db.Column(db.JSON, nullable=True)  # Dados extraídos do email
+    extraction_confidence = db.Column(db.JSON, nullable=True)  # Confiança (0 a 1) de cada campo extraído
+    attachments = db.Column(db.JSON, nullable=True)  # Anexos descarregados (filename, size, content_key, document_id ou error)
     received_at = db.Column(db.DateTime, default=datetime.utcnow)
     processed_at = db.Column(db.DateTime, nullable=True)
     error_message = db.Column(db.Text, nullable=True)
 
+    __table_args__ = (
+        # Listagem (mais recentes primeiro), com e sem filtro processed
+        db.Index('ix_email_trigger_received_at', received_at.desc()),
+        db.Index('ix_email_trigger_processed_received_at', processed, received_at.desc()),
+        # Emails por processar, percorridos por id no processamento automático
+        db.Index('ix_email_trigger_unprocessed', id,
+                 postgresql_where=processed == False, sqlite_where=processed == False),
+        db.Index('ix_email_trigger_vehicle_id', vehicle_id,
+                 postgresql_where=vehicle_id.isnot(None), sqlite_where=vehicle_id.isnot(None)),
+    )
+
     def __repr__(self):
         return f'<EmailTrigger {self.email_from} - {self.email_subject}>'
 
     def to_dict(self):
         return {
             'id': self.id,
+            'message_id': self.message_id,
             'email_from': self.email_from,
             'email_subject': self.email_subject,
             'email_body': self.email_body,
             'processed': self.processed,
             'vehicle_id': self.vehicle_id,
+            'rent_a_car_id': self.rent_a_car_id,
             'extracted_data': self.extracted_data,
+            'extraction_confidence': self.extraction_confidence,
+            'attachments': self.attachments,
             'received_at': self.received_at.isoformat() if self.received_at else None,
             'processed_at': self.processed_at.isoformat() if self.processed_at else None,
             'error_message': self.error_message
@@ -6,7 +6,7 @@ class StoreLocation(db.Model):
     """Modelo para gerenciar localizações de lojas de aluguel de carros"""
     id = db.Column(db.Integer, primary_key=True)
     nome = db.Column(db.String(100), nullable=False)
-    rent_a_car_id = db.Column(db.Integer, db.ForeignKey('rent_a_car.id'), nullable=False)
+    rent_a_car_id = db.Column(db.Integer, db.ForeignKey('rent_a_car.id'), nullable=False, index=True)
     endereco = db.Column(db.String(200), nullable=True)
     cidade = db.Column(db.String(100), nullable=True)
     codigo_postal = db.Column(db.String(20), nullable=True)
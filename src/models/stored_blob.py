@@ -0,0 +1,26 @@
+from .user import db
+from datetime import datetime
+
+class StoredBlob(db.Model):
+    """Conteúdo de um ficheiro guardado uma única vez, identificado pelo SHA-256
+
+    ref_count conta os documentos que apontam para o conteúdo; o ficheiro só é
+    apagado do backend de armazenamento quando deixa de haver referências.
+    """
+    content_key = db.Column(db.String(80), primary_key=True)  # sha256:<hex>
+    size = db.Column(db.BigInteger, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    backend = db.Column(db.String(20), nullable=False, default='local')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<StoredBlob {self.content_key} ({self.ref_count})>'
+
+    def to_dict(self):
+        return {
+            'content_key': self.content_key,
+            'size': self.size,
+            'ref_count': self.ref_count,
+            'backend': self.backend,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
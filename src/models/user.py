@@ -2,7 +2,10 @@ from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
 
-db = SQLAlchemy()
+from src.services.db_routing import RoutingSession
+
+# A sessão encaminha as leituras para o engine de leitura, quando existe (ver src/services/db_routing.py)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
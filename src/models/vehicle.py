@@ -36,6 +36,25 @@ class Vehicle(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Índices das consultas mais frequentes (criados pela migração 0001_hot_path_indexes; o SQLite
+    # não aceita NULLS LAST num índice, mas com DESC os NULL já ficam no fim, por isso lá a migração
+    # cria-os só com DESC)
+    __table_args__ = (
+        # Listagem paginada por keyset, com e sem filtro de estado
+        db.Index('ix_vehicle_created_at_id', created_at.desc().nulls_last(), id.desc())
+            .ddl_if(dialect='postgresql'),
+        db.Index('ix_vehicle_status_created_at_id', status, created_at.desc().nulls_last(), id.desc())
+            .ddl_if(dialect='postgresql'),
+        # Relatórios por período de submissão
+        db.Index('ix_vehicle_data_submissao_id', data_submissao.desc(), id.desc()),
+        # Início do caso usado pelos agregados de recuperação
+        db.Index('ix_vehicle_case_start', db.func.coalesce(data_desaparecimento, data_submissao)),
+        # Casos em aberto (lote noturno dos dossiês)
+        db.Index('ix_vehicle_open', id,
+                 postgresql_where=status.in_(('em_tratamento', 'submetido')),
+                 sqlite_where=status.in_(('em_tratamento', 'submetido'))),
+    )
+    
     # Relacionamentos
     atualizacoes = db.relationship('VehicleUpdate', backref='vehicle', lazy=True, cascade='all, delete-orphan')
     documentos = db.relationship('Document', backref='vehicle', lazy=True, cascade='all, delete-orphan')
@@ -89,6 +108,12 @@ class VehicleUpdate(db.Model):
     localizacao = db.Column(db.String(200), nullable=True)  # Para atualizações de localização
     created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
 
+    __table_args__ = (
+        # Timeline de um veículo (mais recentes primeiro, paginada por keyset)
+        db.Index('ix_vehicle_update_timeline', vehicle_id, data_atualizacao.desc().nulls_last(), id.desc())
+            .ddl_if(dialect='postgresql'),
+    )
+
     def __repr__(self):
         return f'<VehicleUpdate {self.id} - {self.tipo}>'
 
@@ -111,10 +136,15 @@ class Document(db.Model):
     tipo_documento = db.Column(db.String(50), nullable=False)  # contrato, queixa, relatorio, etc.
     caminho_ficheiro = db.Column(db.String(500), nullable=False)
     tamanho_ficheiro = db.Column(db.Integer, nullable=True)
+    checksum_sha256 = db.Column(db.String(64), nullable=True, index=True)  # Usado como ETag no download
     data_upload = db.Column(db.DateTime, default=datetime.utcnow)
     uploaded_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
     origem = db.Column(db.String(50), default='manual')  # manual, email_automatico
 
+    __table_args__ = (
+        db.Index('ix_document_vehicle_data_upload', vehicle_id, data_upload.desc()),
+    )
+
     def __repr__(self):
         return f'<Document {self.nome_ficheiro}>'
 
@@ -127,6 +157,7 @@ class Document(db.Model):
             'tipo_documento': self.tipo_documento,
             'caminho_ficheiro': self.caminho_ficheiro,
             'tamanho_ficheiro': self.tamanho_ficheiro,
+            'checksum_sha256': self.checksum_sha256,
             'data_upload': self.data_upload.isoformat() if self.data_upload else None,
             'uploaded_by': self.uploaded_by,
             'origem': self.origem
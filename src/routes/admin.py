@@ -6,6 +6,12 @@ from ..models.rent_a_car import RentACar
 # Usar importação relativa para evitar problemas no Render
 from ..models.store_location import StoreLocation
 from .auth import token_required, admin_required
+from ..services.db_engine import pool_metrics
+from ..services.db_routing import replica_read
+from ..services.extraction import build_template, extraction_engine
+from ..services.serialization import (
+    CAR_BRAND_SCHEMA, CAR_MODEL_SCHEMA, RENT_A_CAR_SCHEMA, STORE_LOCATION_SCHEMA, InvalidFields
+)
 from datetime import datetime
 
 admin_bp = Blueprint('admin', __name__)
@@ -14,12 +20,16 @@ admin_bp = Blueprint('admin', __name__)
 @admin_bp.route('/car-brands', methods=['GET'])
 @token_required
 @admin_required
+@replica_read
 def get_car_brands(current_user):
     """Obter todas as marcas de carros"""
-    brands = CarBrand.query.all()
+    try:
+        fields = CAR_BRAND_SCHEMA.parse_fields(request.args.get('fields'))
+    except InvalidFields as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     return jsonify({
         'success': True,
-        'data': [brand.to_dict() for brand in brands]
+        'data': CAR_BRAND_SCHEMA.dump(CAR_BRAND_SCHEMA.query(fields).all(), fields)
     }), 200
 
 @admin_bp.route('/car-brands', methods=['POST'])
@@ -126,18 +136,23 @@ def delete_car_brand(current_user, brand_id):
 @admin_bp.route('/car-models', methods=['GET'])
 @token_required
 @admin_required
+@replica_read
 def get_car_models(current_user):
     """Obter todos os modelos de carros"""
     brand_id = request.args.get('brand_id', type=int)
+    try:
+        fields = CAR_MODEL_SCHEMA.parse_fields(request.args.get('fields'))
+    except InvalidFields as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     
+    # O nome da marca vem do mesmo SELECT (outer join), sem uma consulta por modelo
+    query = CAR_MODEL_SCHEMA.query(fields)
     if brand_id:
-        models = CarModel.query.filter_by(brand_id=brand_id).all()
-    else:
-        models = CarModel.query.all()
+        query = query.filter(CarModel.brand_id == brand_id)
     
     return jsonify({
         'success': True,
-        'data': [model.to_dict() for model in models]
+        'data': CAR_MODEL_SCHEMA.dump(query.all(), fields)
     }), 200
 
 @admin_bp.route('/car-models', methods=['POST'])
@@ -249,15 +264,29 @@ def delete_car_model(current_user, model_id):
     }), 200
 
 # Rotas para gerenciar empresas de aluguel de carros
+def _validate_email_template(data):
+    """Compilar o modelo de extração recebido; devolve a mensagem de erro ou None"""
+    if not data or not data.get('email_template'):
+        return None
+    try:
+        build_template('validacao', data['email_template'])
+    except ValueError as e:
+        return str(e)
+    return None
+
 @admin_bp.route('/rent-a-cars', methods=['GET'])
 @token_required
 @admin_required
+@replica_read
 def get_rent_a_cars(current_user):
     """Obter todas as empresas de aluguel de carros"""
-    rent_a_cars = RentACar.query.all()
+    try:
+        fields = RENT_A_CAR_SCHEMA.parse_fields(request.args.get('fields'))
+    except InvalidFields as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     return jsonify({
         'success': True,
-        'data': [rac.to_dict() for rac in rent_a_cars]
+        'data': RENT_A_CAR_SCHEMA.dump(RENT_A_CAR_SCHEMA.query(fields).all(), fields)
     }), 200
 
 @admin_bp.route('/rent-a-cars', methods=['POST'])
@@ -273,6 +302,13 @@ def create_rent_a_car(current_user):
             'message': 'Nome da empresa é obrigatório'
         }), 400
     
+    template_error = _validate_email_template(data)
+    if template_error:
+        return jsonify({
+            'success': False,
+            'message': template_error
+        }), 400
+    
     # Criar nova empresa
     new_rac = RentACar(
         nome=data['nome'],
@@ -286,11 +322,14 @@ def create_rent_a_car(current_user):
         website=data.get('website'),
         logo_url=data.get('logo_url'),
         descricao=data.get('descricao'),
+        email_domains=data.get('email_domains'),
+        email_template=data.get('email_template'),
         is_active=data.get('is_active', True)
     )
     
     db.session.add(new_rac)
     db.session.commit()
+    extraction_engine.invalidate()
     
     return jsonify({
         'success': True,
@@ -312,6 +351,13 @@ def update_rent_a_car(current_user, rac_id):
     
     data = request.get_json()
     
+    template_error = _validate_email_template(data)
+    if template_error:
+        return jsonify({
+            'success': False,
+            'message': template_error
+        }), 400
+    
     # Atualizar campos
     if 'nome' in data:
         rac.nome = data['nome']
@@ -335,10 +381,15 @@ def update_rent_a_car(current_user, rac_id):
         rac.logo_url = data['logo_url']
     if 'descricao' in data:
         rac.descricao = data['descricao']
+    if 'email_domains' in data:
+        rac.email_domains = data['email_domains']
+    if 'email_template' in data:
+        rac.email_template = data['email_template']
     if 'is_active' in data:
         rac.is_active = data['is_active']
     
     db.session.commit()
+    extraction_engine.invalidate()
     
     return jsonify({
         'success': True,
@@ -370,6 +421,7 @@ def delete_rent_a_car(current_user, rac_id):
     
     db.session.delete(rac)
     db.session.commit()
+    extraction_engine.invalidate()
     
     return jsonify({
         'success': True,
@@ -380,18 +432,23 @@ def delete_rent_a_car(current_user, rac_id):
 @admin_bp.route('/store-locations', methods=['GET'])
 @token_required
 @admin_required
+@replica_read
 def get_store_locations(current_user):
     """Obter todas as localizações de lojas"""
     rent_a_car_id = request.args.get('rent_a_car_id', type=int)
+    try:
+        fields = STORE_LOCATION_SCHEMA.parse_fields(request.args.get('fields'))
+    except InvalidFields as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     
+    # O nome da empresa vem do mesmo SELECT (outer join), sem uma consulta por loja
+    query = STORE_LOCATION_SCHEMA.query(fields)
     if rent_a_car_id:
-        locations = StoreLocation.query.filter_by(rent_a_car_id=rent_a_car_id).all()
-    else:
-        locations = StoreLocation.query.all()
+        query = query.filter(StoreLocation.rent_a_car_id == rent_a_car_id)
     
     return jsonify({
         'success': True,
-        'data': [location.to_dict() for location in locations]
+        'data': STORE_LOCATION_SCHEMA.dump(query.all(), fields)
     }), 200
 
 @admin_bp.route('/store-locations', methods=['POST'])
@@ -516,4 +573,14 @@ def delete_store_location(current_user, location_id):
     return jsonify({
         'success': True,
         'message': 'Localização excluída com sucesso'
-    }), 200
\ No newline at end of file
+    }), 200
+# Estado do pool de ligações à base de dados
+@admin_bp.route('/db-pool', methods=['GET'])
+@token_required
+@admin_required
+def get_db_pool(current_user):
+    """Obter o estado e os contadores do pool de ligações (ligações novas, tempo de ligação, invalidações)"""
+    return jsonify({
+        'success': True,
+        'data': pool_metrics()
+    }), 200
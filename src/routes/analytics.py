@@ -0,0 +1,28 @@
+from flask import Blueprint, jsonify, request
+from .auth import token_required
+from ..services import recovery_analytics
+
+analytics_bp = Blueprint('analytics', __name__)
+
+@analytics_bp.route('/analytics/recovery', methods=['GET'])
+@token_required
+def get_recovery_analytics(current_user):
+    """Séries de tempo até à recuperação e taxas de perda (lidas da tabela de agregados)
+
+    Parâmetros: granularity (day, week, month), group_by (total, marca, loja,
+    rent_a_car), start_date e end_date (AAAA-MM-DD) e limit (número de séries).
+    O recálculo dos meses alterados é agendado pelas escritas; enquanto não
+    terminar, a resposta indica os meses em falta em pending_months.
+    """
+    try:
+        params = recovery_analytics.series_params(request.args)
+    except recovery_analytics.AnalyticsError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    series = recovery_analytics.recovery_series(**params)
+    return jsonify({
+        'granularity': params['granularity'],
+        'group_by': params['group_by'],
+        'series': series,
+        'pending_months': recovery_analytics.pending_months()
+    })
@@ -1,5 +1,7 @@
 from flask import Blueprint, jsonify, request, current_app
 from ..models.user import User, db
+from ..services.auth_cache import AuthPrincipal, principal_cache
+from ..services.serialization import USER_SCHEMA, InvalidFields
 from datetime import datetime, timedelta
 import jwt
 from functools import wraps
@@ -23,12 +25,19 @@ def token_required(f):
         if not token:
             return jsonify({'message': 'Token is missing'}), 401
         
+        # Token já validado recentemente: evitar nova verificação da assinatura e a consulta ao utilizador
+        current_user = principal_cache.get(token)
+        if current_user is not None:
+            return f(current_user, *args, **kwargs)
+        
         try:
             # Decodificar o token
             data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
-            current_user = User.query.filter_by(id=data['user_id']).first()
-            if not current_user or not current_user.is_active:
+            user = User.query.filter_by(id=data['user_id']).first()
+            if not user or not user.is_active:
                 return jsonify({'message': 'Token is invalid'}), 401
+            current_user = AuthPrincipal.from_user(user)
+            principal_cache.set(token, current_user, data.get('exp'))
         except jwt.ExpiredSignatureError:
             return jsonify({'message': 'Token has expired'}), 401
         except jwt.InvalidTokenError:
@@ -121,11 +130,13 @@ def change_password(current_user):
     if not data or not all(k in data for k in ('current_password', 'new_password')):
         return jsonify({'message': 'Current password and new password are required'}), 400
     
-    if not current_user.check_password(data['current_password']):
+    user = User.query.get_or_404(current_user.id)
+    if not user.check_password(data['current_password']):
         return jsonify({'message': 'Current password is incorrect'}), 400
     
-    current_user.set_password(data['new_password'])
+    user.set_password(data['new_password'])
     db.session.commit()
+    principal_cache.invalidate_user(user.id)
     
     return jsonify({'message': 'Password changed successfully'})
 
@@ -133,9 +144,12 @@ def change_password(current_user):
 @token_required
 @admin_required
 def get_all_users(current_user):
-    """Obter todos os utilizadores (apenas admin)"""
-    users = User.query.all()
-    return jsonify([user.to_dict() for user in users])
+    """Obter todos os utilizadores (apenas admin; fields= limita os campos devolvidos)"""
+    try:
+        fields = USER_SCHEMA.parse_fields(request.args.get('fields'))
+    except InvalidFields as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(USER_SCHEMA.dump(USER_SCHEMA.query(fields).all(), fields))
 
 @auth_bp.route('/users/<int:user_id>/toggle-status', methods=['POST'])
 @token_required
@@ -149,6 +163,7 @@ def toggle_user_status(current_user, user_id):
     
     user.is_active = not user.is_active
     db.session.commit()
+    principal_cache.invalidate_user(user.id)
     
     status = 'activated' if user.is_active else 'deactivated'
     return jsonify({
@@ -168,6 +183,7 @@ def delete_user(current_user, user_id):
     
     db.session.delete(user)
     db.session.commit()
+    principal_cache.invalidate_user(user_id)
     
     return jsonify({'message': 'User deleted successfully'})
 
@@ -1,21 +1,22 @@
-from flask import Blueprint, jsonify, request, send_file, current_app
+from flask import Blueprint, jsonify, request, send_file, current_app, redirect
 from werkzeug.utils import secure_filename
 from ..models.user import db
 from ..models.vehicle import Vehicle, Document
 from .auth import token_required
+from ..services.serialization import DOCUMENT_SCHEMA, InvalidFields
+from ..services.chunked_upload import ChunkedUpload, UploadError, copy_stream
+from ..services.document_storage import (
+    allowed_file, get_document_store, is_content_key, release_document_content
+)
+import hashlib
 import os
 import uuid
 from datetime import datetime
 
 document_bp = Blueprint('document', __name__)
 
-ALLOWED_EXTENSIONS = {'pdf', 'doc', 'docx', 'jpg', 'jpeg', 'png', 'txt'}
 UPLOAD_FOLDER = 'uploads'
 
-def allowed_file(filename):
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
-
 def ensure_upload_folder():
     """Garantir que a pasta de uploads existe"""
     upload_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), UPLOAD_FOLDER)
@@ -43,52 +44,197 @@ def upload_document(current_user, vehicle_id):
     filename = secure_filename(file.filename)
     unique_filename = f"{uuid.uuid4()}_{filename}"
     
-    # Garantir que a pasta de uploads existe
-    upload_path = ensure_upload_folder()
-    file_path = os.path.join(upload_path, unique_filename)
+    # Gravar o ficheiro em blocos, calculando o tamanho e o SHA-256 na mesma passagem;
+    # o document store guarda o conteúdo uma única vez, mesmo que seja anexado a vários veículos
+    store = get_document_store()
+    staging_path = store.staging_file()
+    hasher = hashlib.sha256()
+    try:
+        with open(staging_path, 'wb') as destination:
+            size = copy_stream(file.stream, destination, hasher)
+        
+        document = _create_document(
+            vehicle_id=vehicle_id,
+            unique_filename=unique_filename,
+            original_filename=filename,
+            tipo_documento=request.form.get('tipo_documento', 'outros'),
+            staging_path=staging_path,
+            size=size,
+            checksum=hasher.hexdigest(),
+            uploaded_by=current_user.id
+        )
+    finally:
+        if os.path.exists(staging_path):
+            os.remove(staging_path)
     
-    # Guardar o ficheiro
-    file.save(file_path)
+    return jsonify(document.to_dict()), 201
+
+def _create_document(vehicle_id, unique_filename, original_filename, tipo_documento, staging_path, size, checksum, uploaded_by, origem='manual'):
+    """Guardar o conteúdo no document store e criar o registo do documento"""
+    content_key = get_document_store().store_file(staging_path, checksum, size)
     
-    # Criar registo na base de dados
     document = Document(
         vehicle_id=vehicle_id,
         nome_ficheiro=unique_filename,
-        nome_original=filename,
-        tipo_documento=request.form.get('tipo_documento', 'outros'),
-        caminho_ficheiro=file_path,
-        tamanho_ficheiro=os.path.getsize(file_path),
-        uploaded_by=current_user.id,
-        origem='manual'
+        nome_original=original_filename,
+        tipo_documento=tipo_documento,
+        caminho_ficheiro=content_key,
+        tamanho_ficheiro=size,
+        checksum_sha256=checksum,
+        uploaded_by=uploaded_by,
+        origem=origem
     )
     
     db.session.add(document)
     db.session.commit()
+    return document
+
+def _upload_error_response(error):
+    response = {'error': str(error)}
+    if error.offset is not None:
+        response['offset'] = error.offset
+    return jsonify(response), error.status
+
+def _load_upload(current_user, upload_root, upload_id):
+    """Carregar um upload por blocos; só quem o iniciou (ou um administrador) lhe pode aceder"""
+    upload = ChunkedUpload.load(upload_root, upload_id)
+    if upload.metadata.get('uploaded_by') != current_user.id and current_user.role != 'admin':
+        raise UploadError('Acesso negado', 403)
+    return upload
+
+@document_bp.route('/vehicles/<int:vehicle_id>/documents/uploads', methods=['POST'])
+@token_required
+def start_chunked_upload(current_user, vehicle_id):
+    """Iniciar um upload resumível por blocos (para ficheiros grandes)
+
+    Depois de criado, os blocos são enviados com PUT /documents/uploads/<upload_id>
+    e o cabeçalho Content-Range: bytes início-fim/total, por ordem. Em caso de falha,
+    GET /documents/uploads/<upload_id> indica o offset a partir do qual retomar.
+    Só quem iniciou o upload (ou um administrador) o pode consultar, continuar ou
+    cancelar; uploads sem blocos novos há DOCUMENT_UPLOAD_TTL_HOURS (24 h) são apagados.
+    """
+    Vehicle.query.get_or_404(vehicle_id)
+    data = request.get_json(silent=True) or {}
+    
+    filename = secure_filename(data.get('filename') or '')
+    if not filename:
+        return jsonify({'error': 'No file selected'}), 400
+    if not allowed_file(filename):
+        return jsonify({'error': 'File type not allowed'}), 400
+    
+    try:
+        total_size = int(data.get('total_size') or 0)
+        upload = ChunkedUpload.create(
+            ensure_upload_folder(),
+            vehicle_id=vehicle_id,
+            filename=filename,
+            total_size=total_size,
+            tipo_documento=data.get('tipo_documento', 'outros'),
+            uploaded_by=current_user.id
+        )
+    except (TypeError, ValueError):
+        return jsonify({'error': 'total_size inválido'}), 400
+    except UploadError as e:
+        return _upload_error_response(e)
+    
+    return jsonify(upload.to_dict()), 201
+
+@document_bp.route('/documents/uploads/<upload_id>', methods=['GET'])
+@token_required
+def get_chunked_upload(current_user, upload_id):
+    """Obter o estado de um upload por blocos (offset para retomar)"""
+    try:
+        upload = _load_upload(current_user, ensure_upload_folder(), upload_id)
+    except UploadError as e:
+        return _upload_error_response(e)
+    return jsonify(upload.to_dict())
+
+@document_bp.route('/documents/uploads/<upload_id>', methods=['PUT'])
+@token_required
+def upload_chunk(current_user, upload_id):
+    """Receber um bloco de um upload; o último bloco cria o documento"""
+    upload_root = ensure_upload_folder()
+    try:
+        upload = _load_upload(current_user, upload_root, upload_id)
+        offset = upload.append(request.stream, request.headers.get('Content-Range'))
+        
+        if offset < upload.total_size:
+            return jsonify({**upload.to_dict(), 'offset': offset}), 202
+        
+        staging_path = get_document_store().staging_file()
+        checksum = upload.finish(staging_path)
+    except UploadError as e:
+        return _upload_error_response(e)
+    
+    try:
+        document = _create_document(
+            vehicle_id=upload.metadata['vehicle_id'],
+            unique_filename=f"{uuid.uuid4()}_{upload.metadata['filename']}",
+            original_filename=upload.metadata['filename'],
+            tipo_documento=upload.metadata['tipo_documento'],
+            staging_path=staging_path,
+            size=upload.total_size,
+            checksum=checksum,
+            uploaded_by=upload.metadata['uploaded_by']
+        )
+    finally:
+        if os.path.exists(staging_path):
+            os.remove(staging_path)
     
     return jsonify(document.to_dict()), 201
 
+@document_bp.route('/documents/uploads/<upload_id>', methods=['DELETE'])
+@token_required
+def cancel_chunked_upload(current_user, upload_id):
+    """Cancelar um upload por blocos e apagar a parte já recebida"""
+    try:
+        _load_upload(current_user, ensure_upload_folder(), upload_id).discard()
+    except UploadError as e:
+        return _upload_error_response(e)
+    return '', 204
+
 @document_bp.route('/vehicles/<int:vehicle_id>/documents', methods=['GET'])
 @token_required
 def get_vehicle_documents(current_user, vehicle_id):
-    """Obter todos os documentos de um veículo"""
+    """Obter todos os documentos de um veículo (fields= limita os campos devolvidos)"""
+    try:
+        fields = DOCUMENT_SCHEMA.parse_fields(request.args.get('fields'))
+    except InvalidFields as e:
+        return jsonify({'error': str(e)}), 400
     vehicle = Vehicle.query.get_or_404(vehicle_id)
-    documents = Document.query.filter_by(vehicle_id=vehicle_id).order_by(Document.data_upload.desc()).all()
-    return jsonify([doc.to_dict() for doc in documents])
+    rows = DOCUMENT_SCHEMA.query(fields).filter(Document.vehicle_id == vehicle_id) \
+        .order_by(Document.data_upload.desc()).all()
+    return jsonify(DOCUMENT_SCHEMA.dump(rows, fields))
 
 @document_bp.route('/documents/<int:document_id>', methods=['GET'])
 @token_required
 def download_document(current_user, document_id):
     """Download de um documento"""
     document = Document.query.get_or_404(document_id)
+    file_path = document.caminho_ficheiro
+    
+    if is_content_key(document.caminho_ficheiro):
+        store = get_document_store()
+        file_path = store.local_path(document.caminho_ficheiro)
+        if file_path is None:
+            # Backend remoto (S3): o cliente descarrega diretamente, com suporte nativo de Range/ETag
+            return redirect(store.download_url(document.caminho_ficheiro, document.nome_original))
     
-    if not os.path.exists(document.caminho_ficheiro):
+    if not os.path.exists(file_path):
         return jsonify({'error': 'File not found on disk'}), 404
     
-    return send_file(
-        document.caminho_ficheiro,
+    # conditional=True faz o Werkzeug responder a Range (206) e If-None-Match (304)
+    # e enviar o ficheiro em blocos, sem o carregar para memória
+    response = send_file(
+        file_path,
         as_attachment=True,
-        download_name=document.nome_original
+        download_name=document.nome_original,
+        conditional=True,
+        etag=document.checksum_sha256 or True
     )
+    # Anunciar o suporte de Range também nas respostas completas, para que os clientes possam retomar
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
 
 @document_bp.route('/documents/<int:document_id>', methods=['DELETE'])
 @token_required
@@ -96,9 +242,8 @@ def delete_document(current_user, document_id):
     """Eliminar um documento"""
     document = Document.query.get_or_404(document_id)
     
-    # Eliminar o ficheiro do disco
-    if os.path.exists(document.caminho_ficheiro):
-        os.remove(document.caminho_ficheiro)
+    # Libertar o conteúdo (só é apagado quando nenhum outro documento o referencia)
+    release_document_content(document)
     
     # Eliminar o registo da base de dados
     db.session.delete(document)
@@ -128,6 +273,7 @@ def get_document_types(current_user):
         'relatorio_gps',
         'comunicacao_cliente',
         'fotografia',
+        'anexo_email',
         'outros'
     ]
     return jsonify(types)
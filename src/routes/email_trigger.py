@@ -3,38 +3,27 @@ from ..models.rent_a_car import EmailTrigger
 from ..models.user import db
 from .auth import token_required, admin_required
 from ..services.email_service import EmailService
+from ..services import email_jobs, job_queue
+from ..services.db_routing import replica_read
+from ..services.listings import EmailTriggerListing
+from ..services.serialization import InvalidFields
+from .job import job_accepted
 from datetime import datetime
-import os
 
 email_trigger_bp = Blueprint('email_trigger', __name__)
 
 @email_trigger_bp.route('/email-triggers', methods=['GET'])
 @token_required
+@replica_read
 def get_email_triggers(current_user):
-    """Obter todos os email triggers"""
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 10, type=int)
-    processed = request.args.get('processed')
+    """Obter todos os email triggers (fields= limita os campos devolvidos)"""
+    try:
+        listing = EmailTriggerListing(request.args)
+    except InvalidFields as e:
+        return jsonify({'error': str(e)}), 400
     
-    query = EmailTrigger.query
-    
-    if processed is not None:
-        processed = processed.lower() == 'true'
-        query = query.filter_by(processed=processed)
-    
-    # Ordenar por data de recebimento (mais recentes primeiro)
-    query = query.order_by(EmailTrigger.received_at.desc())
-    
-    # Paginação
-    pagination = query.paginate(page=page, per_page=per_page, error_out=False)
-    email_triggers = pagination.items
-    
-    return jsonify({
-        'email_triggers': [trigger.to_dict() for trigger in email_triggers],
-        'total': pagination.total,
-        'pages': pagination.pages,
-        'current_page': page
-    })
+    rows = db.session.execute(listing.statement()).all()
+    return jsonify(listing.response(rows, db.session.scalar(listing.count_statement())))
 
 @email_trigger_bp.route('/email-triggers/<int:trigger_id>', methods=['GET'])
 @token_required
@@ -53,10 +42,7 @@ def process_email_trigger(current_user, trigger_id):
         return jsonify({'message': 'Este email já foi processado'}), 400
     
     # Inicializar o serviço de email
-    email_service = EmailService(
-        email_address=os.environ.get('EMAIL_ADDRESS', 'seu_email@gmail.com'),
-        password=os.environ.get('EMAIL_PASSWORD', 'sua_senha')
-    )
+    email_service = EmailService.from_env()
     
     # Processar o email e criar veículo
     vehicle, message = email_service.create_vehicle_from_email(trigger_id)
@@ -73,60 +59,44 @@ def process_email_trigger(current_user, trigger_id):
             'email_trigger': trigger.to_dict()
         }), 400
 
+def _idempotency_key(kind):
+    key = request.headers.get('Idempotency-Key')
+    return f'{kind}:{key}'[:200] if key else None
+
 @email_trigger_bp.route('/email-triggers/check-new', methods=['POST'])
 @token_required
 @admin_required
 def check_new_emails(current_user):
-    """Verificar e processar novos emails"""
-    # Inicializar o serviço de email
-    email_service = EmailService(
-        email_address=os.environ.get('EMAIL_ADDRESS', 'seu_email@gmail.com'),
-        password=os.environ.get('EMAIL_PASSWORD', 'sua_senha')
+    """Agendar a verificação de novos emails (executada por job_worker.py)"""
+    # Processar apenas os emails novos desde o último checkpoint (full=true volta a ler todos os não lidos)
+    payload = {
+        'incremental': request.args.get('full', 'false').lower() != 'true',
+        'auto_process': request.args.get('auto_process', 'false').lower() == 'true'
+    }
+    job, created = job_queue.enqueue(
+        email_jobs.CHECK_NEW,
+        payload,
+        idempotency_key=_idempotency_key(email_jobs.CHECK_NEW),
+        created_by=current_user.id,
+        unique_active=True
     )
-    
-    # Processar emails não lidos
-    processed_count = email_service.process_emails()
-    
-    return jsonify({
-        'message': f'{processed_count} emails processados',
-        'processed_count': processed_count
-    })
+    return job_accepted(job, created, 'Verificação de emails agendada')
 
 @email_trigger_bp.route('/email-triggers/auto-process', methods=['POST'])
 @token_required
 @admin_required
 def auto_process_emails(current_user):
-    """Processar automaticamente todos os emails não processados"""
-    # Buscar todos os triggers não processados
-    unprocessed_triggers = EmailTrigger.query.filter_by(processed=False).all()
+    """Agendar o processamento automático de todos os emails não processados"""
+    # Os triggers são convertidos em lotes (um commit por lote); batch_size permite ajustar o tamanho
+    batch_size = request.args.get('batch_size', type=int)
+    if batch_size is not None and batch_size < 1:
+        return jsonify({'error': 'batch_size deve ser um número positivo'}), 400
     
-    # Inicializar o serviço de email
-    email_service = EmailService(
-        email_address=os.environ.get('EMAIL_ADDRESS', 'seu_email@gmail.com'),
-        password=os.environ.get('EMAIL_PASSWORD', 'sua_senha')
+    job, created = job_queue.enqueue(
+        email_jobs.AUTO_PROCESS,
+        {'batch_size': batch_size},
+        idempotency_key=_idempotency_key(email_jobs.AUTO_PROCESS),
+        created_by=current_user.id,
+        unique_active=True
     )
-    
-    results = {
-        'success': 0,
-        'failed': 0,
-        'details': []
-    }
-    
-    for trigger in unprocessed_triggers:
-        vehicle, message = email_service.create_vehicle_from_email(trigger.id)
-        
-        result = {
-            'trigger_id': trigger.id,
-            'message': message,
-            'success': vehicle is not None
-        }
-        
-        if vehicle:
-            result['vehicle_id'] = vehicle.id
-            results['success'] += 1
-        else:
-            results['failed'] += 1
-        
-        results['details'].append(result)
-    
-    return jsonify(results)
\ No newline at end of file
+    return job_accepted(job, created, 'Processamento automático agendado')
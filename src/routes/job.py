@@ -0,0 +1,71 @@
+from flask import Blueprint, jsonify, request
+from sqlalchemy.exc import IntegrityError
+from ..models.job import Job
+from ..models.user import db
+from .auth import token_required, admin_required
+from ..services import job_queue
+from ..services.serialization import JOB_SCHEMA, InvalidFields
+
+job_bp = Blueprint('job', __name__)
+
+# Tarefas cujo resultado não depende de quem as pediu (ex.: relatórios em cache, partilhados)
+SHARED_KINDS = ('report.generate',)
+
+def _can_view(current_user, job):
+    return current_user.role == 'admin' or job.created_by == current_user.id or job.kind in SHARED_KINDS
+
+@job_bp.route('/jobs', methods=['GET'])
+@token_required
+def get_jobs(current_user):
+    """Listar tarefas em segundo plano (os administradores veem todas)"""
+    limit = min(request.args.get('limit', 50, type=int), 200)
+    try:
+        fields = JOB_SCHEMA.parse_fields(request.args.get('fields'))
+    except InvalidFields as e:
+        return jsonify({'error': str(e)}), 400
+    query = JOB_SCHEMA.query(fields)
+    
+    if current_user.role != 'admin':
+        query = query.filter(Job.created_by == current_user.id)
+    if request.args.get('status'):
+        query = query.filter(Job.status == request.args['status'])
+    if request.args.get('kind'):
+        query = query.filter(Job.kind == request.args['kind'])
+    
+    rows = query.order_by(Job.id.desc()).limit(limit).all()
+    return jsonify({'jobs': JOB_SCHEMA.dump(rows, fields)})
+
+@job_bp.route('/jobs/<int:job_id>', methods=['GET'])
+@token_required
+def get_job(current_user, job_id):
+    """Obter o estado, progresso e resultado de uma tarefa"""
+    job = Job.query.get_or_404(job_id)
+    if not _can_view(current_user, job):
+        return jsonify({'error': 'Acesso negado'}), 403
+    return jsonify(job.to_dict())
+
+@job_bp.route('/jobs/<int:job_id>/retry', methods=['POST'])
+@token_required
+@admin_required
+def retry_job(current_user, job_id):
+    """Voltar a pôr na fila uma tarefa falhada"""
+    job = Job.query.get_or_404(job_id)
+    if job.status != 'failed':
+        return jsonify({'error': 'Só é possível repetir tarefas falhadas'}), 400
+    try:
+        job = job_queue.retry(job)
+    except IntegrityError:
+        # Tarefa unique_active com outra do mesmo tipo já na fila ou em execução
+        db.session.rollback()
+        return jsonify({'error': 'Já existe uma tarefa deste tipo na fila ou em execução'}), 409
+    return jsonify(job.to_dict())
+
+def job_accepted(job, created, message):
+    """Resposta 202 para uma tarefa agendada, com a URL onde acompanhar o estado"""
+    response = jsonify({
+        'message': message if created else 'Já existe uma tarefa igual em curso',
+        'job': job.to_dict()
+    })
+    response.status_code = 202
+    response.headers['Location'] = f'/api/jobs/{job.id}'
+    return response
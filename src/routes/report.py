@@ -0,0 +1,75 @@
+import os
+
+from flask import Blueprint, Response, jsonify, redirect, request, send_file
+from ..models.job import Job
+from .auth import token_required
+from .job import job_accepted
+from ..services import reports
+from ..services.document_storage import StorageNotShared, get_document_store, iter_blocks, require_shared_storage
+
+report_bp = Blueprint('report', __name__)
+
+@report_bp.route('/reports/generate', methods=['POST'])
+@token_required
+def generate_report(current_user):
+    """Agendar a geração de um relatório (executada por job_worker.py)
+
+    Corpo: type (summary, detailed, statistics, recovery, vehicles), date_range
+    (last_week, ..., last_year, all ou custom com start_date/end_date), status e
+    format (xlsx, csv, ndjson). Se o mesmo relatório já foi gerado e os dados não
+    mudaram, é devolvido de imediato (200) com o ficheiro em cache.
+    """
+    try:
+        params = reports.normalize_params(request.get_json(silent=True) or {})
+    except reports.ReportError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        # O ficheiro é gravado pelo worker (outro serviço) e descarregado através deste
+        require_shared_storage('relatórios')
+    except StorageNotShared as e:
+        return jsonify({'error': str(e)}), 503
+    
+    job, created = reports.request_report(params, created_by=current_user.id)
+    if job.status == 'succeeded':
+        return jsonify({
+            'message': 'Relatório já gerado (em cache)',
+            'job': job.to_dict(),
+            'download_url': f'/api/reports/{job.id}/download'
+        })
+    return job_accepted(job, created, 'Geração do relatório agendada')
+
+@report_bp.route('/reports/<int:job_id>/download', methods=['GET'])
+@token_required
+def download_report(current_user, job_id):
+    """Descarregar o ficheiro de um relatório gerado"""
+    job = Job.query.get_or_404(job_id)
+    if job.kind != reports.GENERATE:
+        return jsonify({'error': 'Relatório não encontrado'}), 404
+    if job.status != 'succeeded':
+        return jsonify({'error': 'O relatório ainda não está pronto', 'status': job.status}), 409
+    
+    artifact = job.result['artifact']
+    store = get_document_store()
+    file_path = store.local_path(artifact['content_key'])
+    if file_path is None:
+        url = store.download_url(artifact['content_key'], artifact['filename'])
+        if url:
+            return redirect(url)
+        return Response(
+            iter_blocks(store.open(artifact['content_key'])),
+            content_type=artifact['content_type'],
+            headers={'Content-Disposition': f'attachment; filename="{artifact["filename"]}"'}
+        )
+    
+    if not os.path.exists(file_path):
+        # Gravado noutro disco (worker sem armazenamento partilhado) ou já apagado
+        return jsonify({'error': 'O ficheiro do relatório já não existe'}), 410
+    
+    return send_file(
+        file_path,
+        mimetype=artifact['content_type'],
+        as_attachment=True,
+        download_name=artifact['filename'],
+        conditional=True,
+        etag=artifact['content_key'].split(':', 1)[1]
+    )
@@ -1,12 +1,17 @@
 from flask import Blueprint, jsonify, request
 from ..models.user import User, db
+from ..services.auth_cache import principal_cache
+from ..services.serialization import USER_SCHEMA, InvalidFields
 
 user_bp = Blueprint('user', __name__)
 
 @user_bp.route('/users', methods=['GET'])
 def get_users():
-    users = User.query.all()
-    return jsonify([user.to_dict() for user in users])
+    try:
+        fields = USER_SCHEMA.parse_fields(request.args.get('fields'))
+    except InvalidFields as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(USER_SCHEMA.dump(USER_SCHEMA.query(fields).all(), fields))
 
 @user_bp.route('/users', methods=['POST'])
 def create_user():
@@ -29,6 +34,7 @@ def update_user(user_id):
     user.username = data.get('username', user.username)
     user.email = data.get('email', user.email)
     db.session.commit()
+    principal_cache.invalidate_user(user.id)
     return jsonify(user.to_dict())
 
 @user_bp.route('/users/<int:user_id>', methods=['DELETE'])
@@ -36,4 +42,5 @@ def delete_user(user_id):
     user = User.query.get_or_404(user_id)
     db.session.delete(user)
     db.session.commit()
+    principal_cache.invalidate_user(user_id)
     return '', 204
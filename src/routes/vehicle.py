@@ -1,4 +1,4 @@
-from flask import Blueprint, jsonify, request, send_file
+from flask import Blueprint, Response, abort, jsonify, request, send_file, stream_with_context
 from ..models.user import db
 from ..models.vehicle import Vehicle, VehicleUpdate, Document
 # Importar diretamente do módulo específico
@@ -6,32 +6,89 @@ from ..models.car_model import CarBrand, CarModel
 # Usar importação relativa para evitar problemas no Render
 from ..models.store_location import StoreLocation
 from .auth import token_required
+from ..services.dashboard_stats import snapshot as dashboard_stats
+from ..services.db_routing import replica_read
+from ..services.document_storage import iter_blocks, release_document_content
+from ..services.dossier import dossier_data, dossier_filename, render_dossier
+from ..services.vehicle_detail import (
+    InvalidInclude, load_vehicle_detail, parse_include, parse_timeline_limit, timeline_page
+)
+from ..services.listings import VehicleListing, apply_vehicle_filters
+from ..services.vehicle_search import VehicleSearch
+from ..services.vehicle_import import VehicleImporter, VehicleImportError, iter_file_rows
+from ..services.vehicle_export import CSV_DELIMITERS, EXPORT_FORMATS, export_stream, stream_rows
+from ..services.pagination import (
+    InvalidCursor, decode_cursor, parse_page_size
+)
+from ..services.serialization import VEHICLE_SCHEMA, InvalidFields
 from datetime import datetime
 import os
+import tempfile
 import uuid
 from werkzeug.utils import secure_filename
 
 vehicle_bp = Blueprint('vehicle', __name__)
 
+# Tamanho até ao qual o dossiê em PDF é gerado em memória antes de passar para disco
+DOSSIER_SPOOL_SIZE = 8 * 1024 * 1024
+
 @vehicle_bp.route('/vehicles', methods=['GET'])
 @token_required
+@replica_read
 def get_vehicles(current_user):
-    """Obter todos os veículos com filtros opcionais"""
-    status = request.args.get('status')
-    marca = request.args.get('marca')
-    loja = request.args.get('loja')
+    """Obter veículos com filtros opcionais
+
+    Paginação por keyset sobre (created_at, id): limit= (50 por omissão, até
+    500) e cursor= com o next_cursor da página anterior; include_total=true
+    acrescenta a contagem total. all=true devolve a lista completa (uma lista,
+    sem paginação) a quem ainda precisa dela. fields= limita as colunas lidas
+    da base de dados.
+    """
+    try:
+        listing = VehicleListing(request.args)
+    except InvalidFields as e:
+        return jsonify({'error': str(e)}), 400
+    except InvalidCursor:
+        return jsonify({'error': 'Cursor inválido'}), 400
     
-    query = Vehicle.query
+    # As consultas são construídas em src/services/listings.py (partilhadas com o modo ASGI)
+    rows = db.session.execute(listing.statement()).all()
+    count_statement = listing.count_statement()
+    total = db.session.scalar(count_statement) if count_statement is not None else None
+    return jsonify(listing.response(rows, total))
+
+@vehicle_bp.route('/vehicles/search', methods=['GET'])
+@token_required
+def search_vehicles(current_user):
+    """Pesquisar veículos por matrícula (parcial), VIN, nome do cliente e observações
+
+    status= e marca= filtram os resultados como na listagem (GET /vehicles).
+    """
+    query = (request.args.get('q') or '').strip()
+    if len(query) < 2:
+        return jsonify({'error': 'O termo de pesquisa deve ter pelo menos 2 caracteres'}), 400
     
-    if status:
-        query = query.filter(Vehicle.status == status)
-    if marca:
-        query = query.filter(Vehicle.marca.ilike(f'%{marca}%'))
-    if loja:
-        query = query.filter(Vehicle.loja_aluguer.ilike(f'%{loja}%'))
+    limit = parse_page_size(request.args.get('limit'), default=20, maximum=100)
+    results = VehicleSearch().search(
+        query, limit=limit, status=request.args.get('status'), marca=request.args.get('marca')
+    )
     
-    vehicles = query.order_by(Vehicle.created_at.desc()).all()
-    return jsonify([vehicle.to_dict() for vehicle in vehicles])
+    return jsonify({
+        'query': query,
+        'results': results,
+        'count': len(results)
+    })
+
+@vehicle_bp.route('/vehicles/marcas', methods=['GET'])
+@token_required
+@replica_read
+def get_vehicle_marcas(current_user):
+    """Marcas distintas dos veículos registados (para o filtro da listagem)"""
+    marcas = db.session.scalars(
+        db.select(Vehicle.marca).where(Vehicle.marca.isnot(None), Vehicle.marca != '')
+        .distinct().order_by(Vehicle.marca)
+    ).all()
+    return jsonify({'marcas': marcas})
 
 @vehicle_bp.route('/vehicles', methods=['POST'])
 @token_required
@@ -72,21 +129,91 @@ def create_vehicle(current_user):
     db.session.commit()
     return jsonify(vehicle.to_dict()), 201
 
-@vehicle_bp.route('/vehicles/<int:vehicle_id>', methods=['GET'])
+@vehicle_bp.route('/vehicles/export', methods=['GET'])
 @token_required
-def get_vehicle(current_user, vehicle_id):
-    """Obter um veículo específico com todas as suas informações"""
-    vehicle = Vehicle.query.get_or_404(vehicle_id)
-    vehicle_data = vehicle.to_dict()
+def export_vehicles(current_user):
+    """Exportar veículos em CSV, NDJSON ou XLSX (format=), com os filtros da listagem
+
+    A resposta é gerada em streaming a partir de um cursor (yield_per), por isso
+    a memória usada é a mesma para 100 ou 500 mil veículos. fields= limita as
+    colunas exportadas; no CSV, delimiter= aceita ',', ';' ou 'tab'.
+    """
+    export_format = request.args.get('format', 'csv').lower()
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f"Formato inválido (valores aceites: {', '.join(EXPORT_FORMATS)})"}), 400
+    delimiter = CSV_DELIMITERS.get(request.args.get('delimiter', ','))
+    if delimiter is None:
+        return jsonify({'error': "Delimitador inválido (valores aceites: ',', ';', 'tab')"}), 400
+    try:
+        fields = VEHICLE_SCHEMA.parse_fields(request.args.get('fields')) or list(VEHICLE_SCHEMA.fields)
+    except InvalidFields as e:
+        return jsonify({'error': str(e)}), 400
     
-    # Adicionar atualizações
-    updates = VehicleUpdate.query.filter_by(vehicle_id=vehicle_id).order_by(VehicleUpdate.data_atualizacao.desc()).all()
-    vehicle_data['atualizacoes'] = [update.to_dict() for update in updates]
+    query = apply_vehicle_filters(VEHICLE_SCHEMA.query(fields), request.args) \
+        .order_by(Vehicle.created_at.desc().nulls_last(), Vehicle.id.desc())
     
-    # Adicionar documentos
-    documents = Document.query.filter_by(vehicle_id=vehicle_id).order_by(Document.data_upload.desc()).all()
-    vehicle_data['documentos'] = [doc.to_dict() for doc in documents]
+    filename = f"veiculos_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.{export_format}"
+    return Response(
+        stream_with_context(export_stream(export_format, fields, stream_rows(query), delimiter)),
+        content_type=EXPORT_FORMATS[export_format],
+        headers={
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            # Impedir que proxies (ex.: nginx) acumulem a resposta antes de a enviar
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+@vehicle_bp.route('/vehicles/import', methods=['POST'])
+@token_required
+def import_vehicles(current_user):
+    """Importar veículos de um ficheiro CSV ou XLSX (campo file)
+
+    A primeira linha tem os nomes das colunas (matricula e marca são obrigatórias).
+    As linhas inválidas e as matrículas já existentes são ignoradas e indicadas no
+    relatório; dry_run=true apenas valida o ficheiro.
+    """
+    file = request.files.get('file')
+    if file is None or file.filename == '':
+        return jsonify({'error': 'No file provided'}), 400
     
+    dry_run = request.args.get('dry_run', 'false').lower() == 'true'
+    try:
+        result = VehicleImporter(dry_run=dry_run).run(iter_file_rows(file.stream, file.filename))
+    except VehicleImportError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify(result), 200 if dry_run else 201
+
+@vehicle_bp.route('/vehicles/<int:vehicle_id>', methods=['GET'])
+@token_required
+def get_vehicle(current_user, vehicle_id):
+    """Obter um veículo específico com as relações pedidas
+
+    include: relações a expandir, separadas por vírgulas (atualizacoes,
+    documentos; por omissão ambas). A timeline vem paginada: timeline_limit
+    atualizações (50 por omissão), as seguintes em timeline_cursor ou em
+    GET /vehicles/<id>/updates?cursor=...
+    """
+    return _vehicle_detail_response(Vehicle.id == vehicle_id)
+
+def _vehicle_detail_response(criterion):
+    try:
+        include = parse_include(request.args.get('include'))
+        cursor = decode_cursor(request.args['timeline_cursor']) if request.args.get('timeline_cursor') else None
+    except InvalidInclude as e:
+        return jsonify({'error': str(e)}), 400
+    except InvalidCursor:
+        return jsonify({'error': 'Cursor inválido'}), 400
+    
+    vehicle_data = load_vehicle_detail(
+        criterion,
+        include=include,
+        timeline_limit=parse_timeline_limit(request.args.get('timeline_limit')),
+        timeline_cursor=cursor
+    )
+    if vehicle_data is None:
+        return jsonify({'error': 'Veículo não encontrado'}), 404
     return jsonify(vehicle_data)
 
 @vehicle_bp.route('/vehicles/<int:vehicle_id>', methods=['PUT'])
@@ -139,10 +266,30 @@ def update_vehicle(current_user, vehicle_id):
 def delete_vehicle(current_user, vehicle_id):
     """Eliminar um veículo"""
     vehicle = Vehicle.query.get_or_404(vehicle_id)
+    # Os documentos são eliminados em cascata; libertar antes as referências ao conteúdo
+    for document in vehicle.documentos:
+        release_document_content(document)
     db.session.delete(vehicle)
     db.session.commit()
     return '', 204
 
+@vehicle_bp.route('/vehicles/<int:vehicle_id>/updates', methods=['GET'])
+@token_required
+def list_vehicle_updates(current_user, vehicle_id):
+    """Listar a timeline de um veículo por páginas (mais recentes primeiro)"""
+    try:
+        cursor = decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+    except InvalidCursor:
+        return jsonify({'error': 'Cursor inválido'}), 400
+    
+    updates, next_cursor = timeline_page(vehicle_id, parse_timeline_limit(request.args.get('limit')), cursor)
+    if not updates and cursor is None and db.session.get(Vehicle, vehicle_id) is None:
+        return jsonify({'error': 'Veículo não encontrado'}), 404
+    return jsonify({
+        'items': updates,
+        'next_cursor': next_cursor
+    })
+
 @vehicle_bp.route('/vehicles/<int:vehicle_id>/updates', methods=['POST'])
 @token_required
 def add_vehicle_update(current_user, vehicle_id):
@@ -174,40 +321,20 @@ def delete_vehicle_update(current_user, vehicle_id, update_id):
 @vehicle_bp.route('/vehicles/<string:matricula>', methods=['GET'])
 @token_required
 def get_vehicle_by_matricula(current_user, matricula):
-    """Obter um veículo pela matrícula"""
-    vehicle = Vehicle.query.filter_by(matricula=matricula).first_or_404()
-    return jsonify(vehicle.to_dict())
+    """Obter um veículo pela matrícula (include= como em GET /vehicles/<id>, por omissão sem relações)"""
+    if request.args.get('include') is None:
+        vehicle = Vehicle.query.filter_by(matricula=matricula).first_or_404()
+        return jsonify(vehicle.to_dict())
+    return _vehicle_detail_response(Vehicle.matricula == matricula)
 
 @vehicle_bp.route('/dashboard/stats', methods=['GET'])
 @token_required
+@replica_read
 def get_dashboard_stats(current_user):
     """Obter estatísticas para o dashboard"""
     try:
-        total_vehicles = Vehicle.query.count()
-        em_tratamento = Vehicle.query.filter_by(status='em_tratamento').count()
-        submetidos = Vehicle.query.filter_by(status='submetido').count()
-        recuperados = Vehicle.query.filter_by(status='recuperado').count()
-        perdidos = Vehicle.query.filter_by(status='perdido').count()
-        
-        # Estatísticas por marca (usando apenas o campo marca para compatibilidade)
-        marca_stats = db.session.query(Vehicle.marca, db.func.count(Vehicle.id)).group_by(Vehicle.marca).all()
-        
-        # Estatísticas por loja (usando apenas o campo loja_aluguer para compatibilidade)
-        loja_stats = db.session.query(Vehicle.loja_aluguer, db.func.count(Vehicle.id)).filter(Vehicle.loja_aluguer.isnot(None)).group_by(Vehicle.loja_aluguer).all()
-        
-        # Valor total dos carros em falta (não recuperados)
-        valor_total = db.session.query(db.func.sum(Vehicle.valor)).filter(Vehicle.status != 'recuperado').scalar() or 0
-        
-        return jsonify({
-            'total_vehicles': total_vehicles,
-            'em_tratamento': em_tratamento,
-            'submetidos': submetidos,
-            'recuperados': recuperados,
-            'perdidos': perdidos,
-            'marca_stats': [{'marca': marca, 'count': count} for marca, count in marca_stats],
-            'loja_stats': [{'loja': loja, 'count': count} for loja, count in loja_stats],
-            'valor_total_em_falta': float(valor_total)
-        })
+        force_refresh = request.args.get('refresh', 'false').lower() == 'true'
+        return jsonify(dashboard_stats.get(force_refresh=force_refresh))
     except Exception as e:
         print(f"Erro ao obter estatísticas do dashboard: {str(e)}")
         return jsonify({
@@ -224,19 +351,40 @@ def get_dashboard_stats(current_user):
 @vehicle_bp.route('/reports/vehicle/<int:vehicle_id>', methods=['GET'])
 @token_required
 def generate_vehicle_report(current_user, vehicle_id):
-    """Gerar relatório completo de um veículo"""
-    vehicle = Vehicle.query.get_or_404(vehicle_id)
-    
-    # Obter todas as atualizações
-    updates = VehicleUpdate.query.filter_by(vehicle_id=vehicle_id).order_by(VehicleUpdate.data_atualizacao.asc()).all()
+    """Gerar relatório completo de um veículo (JSON, ou dossiê em PDF com format=pdf)"""
+    if request.args.get('format') == 'pdf':
+        # dossier_data lê o veículo (e ignora ids inexistentes)
+        dossiers = dossier_data([vehicle_id], generated_by=current_user.username)
+        if not dossiers:
+            abort(404)
+        data = dossiers[0]
+        # O PDF só fica completo no fim; até DOSSIER_SPOOL_SIZE fica em memória, acima disso em disco
+        output = tempfile.SpooledTemporaryFile(max_size=DOSSIER_SPOOL_SIZE)
+        render_dossier(data, output)
+        size = output.tell()
+        output.seek(0)
+        return Response(
+            iter_blocks(output),
+            content_type='application/pdf',
+            headers={
+                'Content-Disposition': f'attachment; filename="{dossier_filename(data["vehicle"])}"',
+                'Content-Length': str(size)
+            }
+        )
     
-    # Obter todos os documentos
-    documents = Document.query.filter_by(vehicle_id=vehicle_id).order_by(Document.data_upload.asc()).all()
+    # Veículo e documentos numa consulta, timeline completa noutra
+    vehicle_data = load_vehicle_detail(Vehicle.id == vehicle_id, timeline_limit=None)
+    if vehicle_data is None:
+        abort(404)
+    timeline = vehicle_data.pop('atualizacoes')
+    documents = vehicle_data.pop('documentos')
+    for name in ('atualizacoes_total', 'atualizacoes_next_cursor'):
+        vehicle_data.pop(name)
     
     report = {
-        'vehicle': vehicle.to_dict(),
-        'timeline': [update.to_dict() for update in updates],
-        'documents': [doc.to_dict() for doc in documents],
+        'vehicle': vehicle_data,
+        'timeline': timeline[::-1],
+        'documents': documents[::-1],
         'generated_at': datetime.utcnow().isoformat(),
         'generated_by': current_user.username
     }
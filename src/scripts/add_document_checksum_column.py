@@ -0,0 +1,47 @@
+import sys
+import os
+
+# Adicionar o diretório raiz ao path para importar os módulos corretamente
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from flask import Flask
+from src.models.user import db
+from sqlalchemy import text, inspect
+from dotenv import load_dotenv
+
+# Carregar variáveis de ambiente
+load_dotenv()
+
+def add_document_checksum_column():
+    """Adiciona a coluna checksum_sha256 (e o respetivo índice) à tabela 'document'"""
+    # Configuração do Flask e do banco de dados
+    app = Flask(__name__)
+    database_url = os.getenv('DATABASE_URL')
+    if database_url is None:
+        # Fallback para SQLite se DATABASE_URL não estiver definido
+        database_url = f"sqlite:///{os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'app.db')}"
+        print("AVISO: Usando SQLite como fallback. Configure DATABASE_URL para usar Neon.tech.")
+    
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    
+    # Inicializar o banco de dados com o app
+    db.init_app(app)
+    
+    with app.app_context():
+        try:
+            columns = [col['name'] for col in inspect(db.engine).get_columns('document')]
+            if 'checksum_sha256' in columns:
+                print("Coluna checksum_sha256 já existe na tabela document.")
+                return
+            
+            db.session.execute(text("ALTER TABLE document ADD COLUMN checksum_sha256 VARCHAR(64)"))
+            db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_document_checksum_sha256 ON document (checksum_sha256)"))
+            db.session.commit()
+            print("Coluna checksum_sha256 adicionada com sucesso à tabela document.")
+        except Exception as e:
+            print(f"Erro ao adicionar a coluna checksum_sha256: {str(e)}")
+            db.session.rollback()
+
+if __name__ == "__main__":
+    add_document_checksum_column()
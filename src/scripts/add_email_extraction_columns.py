@@ -0,0 +1,57 @@
+import sys
+import os
+
+# Adicionar o diretório raiz ao path para importar os módulos corretamente
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from flask import Flask
+from src.models.user import db
+from sqlalchemy import text, inspect
+from dotenv import load_dotenv
+
+# Carregar variáveis de ambiente
+load_dotenv()
+
+# (tabela, coluna, tipo em PostgreSQL, tipo em SQLite)
+COLUMNS = [
+    ('rent_a_car', 'email_domains', 'VARCHAR(500)', 'VARCHAR(500)'),
+    ('rent_a_car', 'email_template', 'JSON', 'JSON'),
+    ('email_trigger', 'rent_a_car_id', 'INTEGER REFERENCES rent_a_car (id)', 'INTEGER REFERENCES rent_a_car (id)'),
+    ('email_trigger', 'extraction_confidence', 'JSON', 'JSON'),
+]
+
+def add_email_extraction_columns():
+    """Adiciona as colunas dos modelos de extração por rent-a-car e da confiança dos campos extraídos"""
+    # Configuração do Flask e do banco de dados
+    app = Flask(__name__)
+    database_url = os.getenv('DATABASE_URL')
+    if database_url is None:
+        # Fallback para SQLite se DATABASE_URL não estiver definido
+        database_url = f"sqlite:///{os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'app.db')}"
+        print("AVISO: Usando SQLite como fallback. Configure DATABASE_URL para usar Neon.tech.")
+    
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    
+    # Inicializar o banco de dados com o app
+    db.init_app(app)
+    
+    with app.app_context():
+        try:
+            inspector = inspect(db.engine)
+            is_postgres = db.engine.dialect.name == 'postgresql'
+            for table, column, pg_type, sqlite_type in COLUMNS:
+                columns = [col['name'] for col in inspector.get_columns(table)]
+                if column in columns:
+                    print(f"Coluna {column} já existe na tabela {table}.")
+                    continue
+                column_type = pg_type if is_postgres else sqlite_type
+                db.session.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}"))
+                print(f"Coluna {column} adicionada à tabela {table}.")
+            db.session.commit()
+        except Exception as e:
+            print(f"Erro ao adicionar as colunas de extração: {str(e)}")
+            db.session.rollback()
+
+if __name__ == "__main__":
+    add_email_extraction_columns()
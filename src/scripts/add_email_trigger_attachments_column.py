@@ -0,0 +1,47 @@
+import sys
+import os
+
+# Adicionar o diretório raiz ao path para importar os módulos corretamente
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from flask import Flask
+from src.models.user import db
+from sqlalchemy import text, inspect
+from dotenv import load_dotenv
+
+# Carregar variáveis de ambiente
+load_dotenv()
+
+
+def add_email_trigger_attachments_column():
+    """Adiciona a coluna attachments (anexos descarregados dos emails) à tabela email_trigger"""
+    # Configuração do Flask e do banco de dados
+    app = Flask(__name__)
+    database_url = os.getenv('DATABASE_URL')
+    if database_url is None:
+        # Fallback para SQLite se DATABASE_URL não estiver definido
+        database_url = f"sqlite:///{os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'app.db')}"
+        print("AVISO: Usando SQLite como fallback. Configure DATABASE_URL para usar Neon.tech.")
+    
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    
+    # Inicializar o banco de dados com o app
+    db.init_app(app)
+    
+    with app.app_context():
+        try:
+            inspector = inspect(db.engine)
+            columns = [col['name'] for col in inspector.get_columns('email_trigger')]
+            if 'attachments' in columns:
+                print("Coluna attachments já existe na tabela email_trigger.")
+                return
+            db.session.execute(text("ALTER TABLE email_trigger ADD COLUMN attachments JSON"))
+            db.session.commit()
+            print("Coluna attachments adicionada à tabela email_trigger.")
+        except Exception as e:
+            print(f"Erro ao adicionar a coluna attachments: {str(e)}")
+            db.session.rollback()
+
+if __name__ == "__main__":
+    add_email_trigger_attachments_column()
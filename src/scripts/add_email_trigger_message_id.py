@@ -0,0 +1,85 @@
+import sys
+import os
+
+# Adicionar o diretório raiz ao path para importar os módulos corretamente
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from flask import Flask
+from src.models.user import db
+from src.services.email_service import EmailService
+from sqlalchemy import text, inspect
+from dotenv import load_dotenv
+
+# Carregar variáveis de ambiente
+load_dotenv()
+
+BATCH_SIZE = 1000
+
+def add_email_trigger_message_id():
+    """Adiciona a coluna message_id (com índice único) à tabela 'email_trigger'
+    
+    Os registos existentes recebem a chave sha256:<hex> calculada a partir do
+    remetente, assunto e corpo, a mesma usada para emails sem Message-ID.
+    """
+    # Configuração do Flask e do banco de dados
+    app = Flask(__name__)
+    database_url = os.getenv('DATABASE_URL')
+    if database_url is None:
+        # Fallback para SQLite se DATABASE_URL não estiver definido
+        database_url = f"sqlite:///{os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'app.db')}"
+        print("AVISO: Usando SQLite como fallback. Configure DATABASE_URL para usar Neon.tech.")
+    
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    
+    # Inicializar o banco de dados com o app
+    db.init_app(app)
+    
+    with app.app_context():
+        try:
+            columns = [col['name'] for col in inspect(db.engine).get_columns('email_trigger')]
+            if 'message_id' not in columns:
+                db.session.execute(text("ALTER TABLE email_trigger ADD COLUMN message_id VARCHAR(255)"))
+                db.session.commit()
+                print("Coluna message_id adicionada à tabela email_trigger.")
+            
+            # Preencher os registos antigos em lotes
+            seen = set()
+            updated = 0
+            last_id = 0
+            while True:
+                rows = db.session.execute(text(
+                    "SELECT id, email_from, email_subject, email_body FROM email_trigger "
+                    "WHERE message_id IS NULL AND id > :last_id ORDER BY id LIMIT :limit"
+                ), {'last_id': last_id, 'limit': BATCH_SIZE}).fetchall()
+                if not rows:
+                    break
+                
+                params = []
+                for row in rows:
+                    key = EmailService.message_key({
+                        'from': row.email_from, 'subject': row.email_subject, 'body': row.email_body
+                    })
+                    if key in seen:
+                        # Registos antigos duplicados ficam sem chave
+                        continue
+                    seen.add(key)
+                    params.append({'id': row.id, 'message_id': key})
+                
+                if params:
+                    db.session.execute(text("UPDATE email_trigger SET message_id = :message_id WHERE id = :id"), params)
+                db.session.commit()
+                updated += len(params)
+                last_id = rows[-1].id
+            
+            db.session.execute(text(
+                "CREATE UNIQUE INDEX IF NOT EXISTS ix_email_trigger_message_id ON email_trigger (message_id)"
+            ))
+            db.session.commit()
+            print(f"Índice único criado; {updated} registos existentes preenchidos com message_id.")
+        except Exception as e:
+            print(f"Erro ao adicionar a coluna message_id: {str(e)}")
+            db.session.rollback()
+
+if __name__ == "__main__":
+    add_email_trigger_message_id()
@@ -0,0 +1,44 @@
+import sys
+import os
+
+# Adicionar o diretório raiz ao path para importar os módulos corretamente
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from flask import Flask
+from src.models.user import db
+from src.models.job import Job
+from sqlalchemy import inspect
+from dotenv import load_dotenv
+
+# Carregar variáveis de ambiente
+load_dotenv()
+
+def create_job_table():
+    """Cria a tabela 'job' usada pela fila de tarefas em segundo plano"""
+    # Configuração do Flask e do banco de dados
+    app = Flask(__name__)
+    database_url = os.getenv('DATABASE_URL')
+    if database_url is None:
+        # Fallback para SQLite se DATABASE_URL não estiver definido
+        database_url = f"sqlite:///{os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'app.db')}"
+        print("AVISO: Usando SQLite como fallback. Configure DATABASE_URL para usar Neon.tech.")
+    
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    
+    # Inicializar o banco de dados com o app
+    db.init_app(app)
+    
+    with app.app_context():
+        try:
+            if inspect(db.engine).has_table('job'):
+                print("Tabela job já existe.")
+                return
+            
+            Job.__table__.create(bind=db.engine, checkfirst=True)
+            print("Tabela job criada com sucesso.")
+        except Exception as e:
+            print(f"Erro ao criar a tabela job: {str(e)}")
+
+if __name__ == "__main__":
+    create_job_table()
@@ -0,0 +1,56 @@
+import sys
+import os
+
+# Adicionar o diretório raiz ao path para importar os módulos corretamente
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from flask import Flask
+from src.models.user import db
+from src.models.recovery_rollup import RecoveryRollup, RecoveryRollupDirty
+from src.services.recovery_analytics import refresh_rollup
+from sqlalchemy import inspect
+from dotenv import load_dotenv
+
+# Carregar variáveis de ambiente
+load_dotenv()
+
+def create_recovery_rollup_tables(rebuild=False):
+    """Cria as tabelas dos agregados de recuperação e calcula-os para todo o histórico
+    
+    Com --rebuild os agregados são recalculados mesmo que as tabelas já existam.
+    """
+    # Configuração do Flask e do banco de dados
+    app = Flask(__name__)
+    database_url = os.getenv('DATABASE_URL')
+    if database_url is None:
+        # Fallback para SQLite se DATABASE_URL não estiver definido
+        database_url = f"sqlite:///{os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'app.db')}"
+        print("AVISO: Usando SQLite como fallback. Configure DATABASE_URL para usar Neon.tech.")
+    
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    
+    # Inicializar o banco de dados com o app
+    db.init_app(app)
+    
+    with app.app_context():
+        try:
+            created = False
+            for model in (RecoveryRollup, RecoveryRollupDirty):
+                if inspect(db.engine).has_table(model.__tablename__):
+                    print(f"Tabela {model.__tablename__} já existe.")
+                else:
+                    model.__table__.create(bind=db.engine, checkfirst=True)
+                    print(f"Tabela {model.__tablename__} criada com sucesso.")
+                    created = True
+            
+            if created or rebuild:
+                result = refresh_rollup(full=True)
+                print(f"Agregados calculados: {result['rows']} linhas para {result['months']} meses "
+                      f"em {result['seconds']}s.")
+        except Exception as e:
+            print(f"Erro ao criar as tabelas dos agregados de recuperação: {str(e)}")
+            db.session.rollback()
+
+if __name__ == "__main__":
+    create_recovery_rollup_tables(rebuild='--rebuild' in sys.argv[1:])
@@ -0,0 +1,43 @@
+import sys
+import os
+
+# Adicionar o diretório raiz ao path para importar os módulos corretamente
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from flask import Flask
+from src.models.user import db
+from dotenv import load_dotenv
+
+# Carregar variáveis de ambiente
+load_dotenv()
+
+def create_vehicle_search_index():
+    """Cria os índices de pesquisa de veículos (tsvector/pg_trgm em PostgreSQL, FTS5 em SQLite)"""
+    # Configuração do Flask e do banco de dados
+    app = Flask(__name__)
+    database_url = os.getenv('DATABASE_URL')
+    if database_url is None:
+        # Fallback para SQLite se DATABASE_URL não estiver definido
+        database_url = f"sqlite:///{os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'app.db')}"
+        print("AVISO: Usando SQLite como fallback. Configure DATABASE_URL para usar Neon.tech.")
+    
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    
+    # Inicializar o banco de dados com o app
+    db.init_app(app)
+    
+    with app.app_context():
+        # Importar depois de inicializar o db para evitar importações circulares
+        from src.services.vehicle_search import VehicleSearch
+        
+        try:
+            search = VehicleSearch()
+            search.ensure_indexes()
+            print(f"Índices de pesquisa criados com sucesso ({search.dialect}).")
+        except Exception as e:
+            print(f"Erro ao criar os índices de pesquisa: {str(e)}")
+            db.session.rollback()
+
+if __name__ == "__main__":
+    create_vehicle_search_index()
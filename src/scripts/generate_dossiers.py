@@ -0,0 +1,61 @@
+import sys
+import os
+import time
+
+# Adicionar o diretório raiz ao path para importar os módulos corretamente
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from flask import Flask
+from src.models.user import db
+from src.models.vehicle import Vehicle
+from src.services.dossier import OPEN_STATUSES, render_batch
+from dotenv import load_dotenv
+
+# Carregar variáveis de ambiente
+load_dotenv()
+
+def generate_dossiers(output_dir=None):
+    """Gerar o dossiê em PDF de todos os casos em aberto (em tratamento e submetidos)
+    
+    Pensado para correr todas as noites (cron); os PDFs ficam em
+    output_dir/AAAA-MM-DD, por omissão dentro de DOSSIER_OUTPUT_DIR.
+    """
+    # Configuração do Flask e do banco de dados
+    app = Flask(__name__)
+    database_url = os.getenv('DATABASE_URL')
+    if database_url is None:
+        # Fallback para SQLite se DATABASE_URL não estiver definido
+        database_url = f"sqlite:///{os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'app.db')}"
+        print("AVISO: Usando SQLite como fallback. Configure DATABASE_URL para usar Neon.tech.")
+    
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    
+    # Inicializar o banco de dados com o app
+    db.init_app(app)
+    
+    if output_dir is None:
+        output_dir = os.path.join(os.getenv('DOSSIER_OUTPUT_DIR', 'dossies'), time.strftime('%Y-%m-%d'))
+    
+    with app.app_context():
+        started = time.perf_counter()
+        try:
+            vehicle_ids = [vehicle_id for (vehicle_id,) in db.session.query(Vehicle.id)
+                           .filter(Vehicle.status.in_(OPEN_STATUSES)).order_by(Vehicle.id)]
+            results = render_batch(vehicle_ids, output_dir, generated_by='lote noturno')
+            
+            failed = [result for result in results if result.get('error')]
+            for result in failed:
+                print(f"Erro no dossiê de {result['matricula']}: {result['error']}")
+            elapsed = time.perf_counter() - started
+            print(f"{len(results) - len(failed)} dossiês gerados em {output_dir} em {elapsed:.1f}s "
+                  f"({len(failed)} com erro).")
+            return not failed
+        except Exception as e:
+            print(f"Erro ao gerar os dossiês: {str(e)}")
+            return False
+
+if __name__ == "__main__":
+    # Opcional: diretório de destino como primeiro argumento
+    success = generate_dossiers(sys.argv[1] if len(sys.argv) > 1 else None)
+    sys.exit(0 if success else 1)
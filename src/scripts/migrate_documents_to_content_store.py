@@ -0,0 +1,75 @@
+import sys
+import os
+import hashlib
+
+# Adicionar o diretório raiz ao path para importar os módulos corretamente
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from flask import Flask
+from src.models.user import db
+from dotenv import load_dotenv
+
+# Carregar variáveis de ambiente
+load_dotenv()
+
+def migrate_documents_to_content_store():
+    """Cria a tabela stored_blob e move os ficheiros antigos (uploads/<uuid>_nome) para o document store"""
+    # Configuração do Flask e do banco de dados
+    app = Flask(__name__)
+    database_url = os.getenv('DATABASE_URL')
+    if database_url is None:
+        # Fallback para SQLite se DATABASE_URL não estiver definido
+        database_url = f"sqlite:///{os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'app.db')}"
+        print("AVISO: Usando SQLite como fallback. Configure DATABASE_URL para usar Neon.tech.")
+    
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    
+    # Inicializar o banco de dados com o app
+    db.init_app(app)
+    
+    with app.app_context():
+        # Importar depois de inicializar o db para evitar importações circulares
+        import src.models
+        from src.models.stored_blob import StoredBlob
+        from src.models.vehicle import Document
+        from src.services.chunked_upload import copy_stream
+        from src.services.document_storage import get_document_store, is_content_key
+        
+        StoredBlob.__table__.create(bind=db.engine, checkfirst=True)
+        print("Tabela stored_blob verificada.")
+        
+        store = get_document_store()
+        migrated = 0
+        missing = 0
+        
+        for document in Document.query.order_by(Document.id).all():
+            if is_content_key(document.caminho_ficheiro):
+                continue
+            if not document.caminho_ficheiro or not os.path.exists(document.caminho_ficheiro):
+                print(f"Ficheiro em falta para o documento {document.id}: {document.caminho_ficheiro}")
+                missing += 1
+                continue
+            
+            try:
+                # Copiar para a área temporária (o original só é removido depois do commit)
+                staging_path = store.staging_file()
+                hasher = hashlib.sha256()
+                with open(document.caminho_ficheiro, 'rb') as source, open(staging_path, 'wb') as destination:
+                    size = copy_stream(source, destination, hasher)
+                
+                legacy_path = document.caminho_ficheiro
+                document.caminho_ficheiro = store.store_file(staging_path, hasher.hexdigest(), size)
+                document.checksum_sha256 = hasher.hexdigest()
+                document.tamanho_ficheiro = size
+                db.session.commit()
+                os.remove(legacy_path)
+                migrated += 1
+            except Exception as e:
+                print(f"Erro ao migrar o documento {document.id}: {str(e)}")
+                db.session.rollback()
+        
+        print(f"Migração concluída: {migrated} documentos migrados, {missing} ficheiros em falta.")
+
+if __name__ == "__main__":
+    migrate_documents_to_content_store()
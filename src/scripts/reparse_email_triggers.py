@@ -0,0 +1,76 @@
+import sys
+import os
+import time
+
+# Adicionar o diretório raiz ao path para importar os módulos corretamente
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from flask import Flask
+from src.models.user import db
+from src.models.rent_a_car import EmailTrigger
+from src.services.extraction import extraction_engine
+from sqlalchemy import update
+from dotenv import load_dotenv
+
+# Carregar variáveis de ambiente
+load_dotenv()
+
+BATCH_SIZE = 1000
+
+def reparse_email_triggers(include_processed=False):
+    """Voltar a extrair os dados dos EmailTriggers guardados (ex.: depois de alterar um modelo de extração)
+    
+    Por omissão só os triggers ainda não processados são atualizados; com --all
+    são atualizados todos.
+    """
+    # Configuração do Flask e do banco de dados
+    app = Flask(__name__)
+    database_url = os.getenv('DATABASE_URL')
+    if database_url is None:
+        # Fallback para SQLite se DATABASE_URL não estiver definido
+        database_url = f"sqlite:///{os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'app.db')}"
+        print("AVISO: Usando SQLite como fallback. Configure DATABASE_URL para usar Neon.tech.")
+    
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    
+    # Inicializar o banco de dados com o app
+    db.init_app(app)
+    
+    with app.app_context():
+        started = time.perf_counter()
+        updated = 0
+        last_id = 0
+        try:
+            while True:
+                query = db.session.query(EmailTrigger.id, EmailTrigger.email_from, EmailTrigger.email_body) \
+                    .filter(EmailTrigger.id > last_id)
+                if not include_processed:
+                    query = query.filter(EmailTrigger.processed == False)
+                rows = query.order_by(EmailTrigger.id).limit(BATCH_SIZE).all()
+                if not rows:
+                    break
+                
+                params = []
+                for trigger_id, email_from, email_body in rows:
+                    extraction = extraction_engine.extract(email_body, email_from)
+                    params.append({
+                        'id': trigger_id,
+                        'rent_a_car_id': extraction.rent_a_car_id,
+                        'extracted_data': extraction.data,
+                        'extraction_confidence': extraction.confidence
+                    })
+                # UPDATE em bloco pela chave primária
+                db.session.execute(update(EmailTrigger), params)
+                db.session.commit()
+                updated += len(params)
+                last_id = rows[-1][0]
+            
+            elapsed = time.perf_counter() - started
+            print(f"{updated} emails processados em {elapsed:.1f}s ({updated / max(elapsed, 1e-9):.0f} emails/s).")
+        except Exception as e:
+            print(f"Erro ao voltar a extrair os dados dos emails: {str(e)}")
+            db.session.rollback()
+
+if __name__ == "__main__":
+    reparse_email_triggers(include_processed='--all' in sys.argv[1:])
@@ -0,0 +1,69 @@
+"""Trabalho adiado até ao commit da transação principal de uma sessão
+
+Os serviços guardam ações em filas por chave (session.info) e registam a função
+que as executa. As filas só são executadas quando a transação de topo é
+confirmada: o commit de um savepoint (begin_nested) não as executa, o rollback
+de um savepoint descarta apenas o que foi acrescentado dentro dele e um
+rollback completo descarta tudo.
+"""
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+_QUEUES_KEY = 'after_commit_queues'
+_SAVEPOINTS_KEY = 'after_commit_savepoints'
+
+_handlers = {}
+
+
+def register(key, handler):
+    """Registar a função que recebe a lista de itens de uma fila depois do commit"""
+    _handlers[key] = handler
+
+
+def defer(session, key, *items):
+    """Acrescentar itens à fila key da sessão"""
+    session.info.setdefault(_QUEUES_KEY, {}).setdefault(key, []).extend(items)
+
+
+def discard(session):
+    session.info.pop(_QUEUES_KEY, None)
+    session.info.pop(_SAVEPOINTS_KEY, None)
+
+
+@event.listens_for(Session, 'after_transaction_create')
+def _mark_savepoint(session, transaction):
+    if transaction.nested:
+        queues = session.info.get(_QUEUES_KEY, {})
+        session.info.setdefault(_SAVEPOINTS_KEY, {})[transaction] = {
+            key: len(items) for key, items in queues.items()
+        }
+
+
+@event.listens_for(Session, 'after_commit')
+def _run_queues(session):
+    # after_commit também é emitido ao libertar um savepoint
+    if session.in_nested_transaction():
+        return
+    queues = session.info.pop(_QUEUES_KEY, {})
+    session.info.pop(_SAVEPOINTS_KEY, None)
+    for key, items in queues.items():
+        handler = _handlers.get(key)
+        if handler is None or not items:
+            continue
+        try:
+            handler(items)
+        except Exception as e:
+            print(f"Erro ao executar '{key}' depois do commit: {str(e)}")
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _rollback_queues(session, previous_transaction):
+    if previous_transaction.nested:
+        marks = session.info.get(_SAVEPOINTS_KEY, {}).pop(previous_transaction, None)
+        if marks is None:
+            return
+        for key, items in session.info.get(_QUEUES_KEY, {}).items():
+            del items[marks.get(key, 0):]
+    elif previous_transaction.parent is None:
+        discard(session)
@@ -0,0 +1,94 @@
+"""Engines assíncronos do modo ASGI (asyncpg em PostgreSQL, aiosqlite em SQLite)
+
+Só servem as leituras das rotas assíncronas de src/asgi.py: enquanto uma
+consulta espera pelo Neon, o mesmo processo continua a atender outros pedidos.
+Usam as mesmas variáveis de ambiente do engine síncrono (src/services/db_engine.py):
+tamanho e reciclagem do pool, pre-ping, connect_timeout, statement_timeout e o
+modo PgBouncer; em SQLite, as mesmas PRAGMAs com query_only.
+
+As réplicas de leitura (DATABASE_REPLICA_URLS) têm também um engine assíncrono;
+as rotas escolhem-nas com replica_engine(), que respeita a janela em que quem
+acabou de escrever lê do principal.
+"""
+
+import random
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.services.db_engine import (
+    APPLICATION_NAME, configure_sqlite_engine, connect_timeout, engine_options, instrument_engine,
+    is_sqlite_file, replica_urls, sqlite_engine_options, statement_timeout_ms, uses_pgbouncer
+)
+from src.services.db_routing import is_pinned_to_primary
+
+ASYNC_DRIVERS = {'postgresql': 'asyncpg', 'sqlite': 'aiosqlite'}
+# sslmode da libpq -> ssl do asyncpg (os restantes parâmetros só existem na libpq)
+LIBPQ_ONLY_PARAMS = ('sslmode', 'channel_binding', 'connect_timeout', 'application_name', 'options')
+
+
+class UnsupportedDatabase(ValueError):
+    """Base de dados sem driver assíncrono configurado"""
+
+
+def async_engine_options(database_url):
+    """URL com o driver assíncrono e opções do engine para o DATABASE_URL"""
+    url = make_url(database_url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise UnsupportedDatabase(f'Sem driver assíncrono para {backend}')
+    async_url = url.set(drivername=f'{backend}+{ASYNC_DRIVERS[backend]}')
+
+    if backend == 'sqlite':
+        options = sqlite_engine_options()
+        options['connect_args'].pop('check_same_thread')
+        return async_url, options
+
+    options = engine_options(database_url)
+    options.pop('connect_args', None)
+    connect_args = {'timeout': connect_timeout(), 'server_settings': {'application_name': APPLICATION_NAME}}
+    sslmode = url.query.get('sslmode')
+    if sslmode:
+        connect_args['ssl'] = sslmode
+    async_url = async_url.difference_update_query(LIBPQ_ONLY_PARAMS)
+    timeout = statement_timeout_ms()
+    if uses_pgbouncer(database_url):
+        # Sem prepared statements em cache (não sobrevivem à troca de ligação no PgBouncer);
+        # o statement_timeout é aplicado com SET LOCAL por instrument_engine
+        connect_args['statement_cache_size'] = 0
+        async_url = async_url.update_query_dict({'prepared_statement_cache_size': '0'})
+    elif timeout:
+        connect_args['server_settings']['statement_timeout'] = str(timeout)
+    options['connect_args'] = connect_args
+    return async_url, options
+
+
+def create_read_engine(database_url, name):
+    """Engine assíncrono só de leitura, com as métricas do pool em GET /admin/db-pool"""
+    url, options = async_engine_options(database_url)
+    engine = create_async_engine(url, **options)
+    if is_sqlite_file(database_url):
+        configure_sqlite_engine(engine.sync_engine, read_only=True)
+    instrument_engine(engine.sync_engine, name)
+    return engine
+
+
+class AsyncEngines:
+    """Engine assíncrono do principal e das réplicas de leitura"""
+
+    def __init__(self, database_url):
+        self.primary = create_read_engine(database_url, 'async_primary')
+        self.replicas = [
+            create_read_engine(url, f'async_replica_{number}')
+            for number, url in enumerate(replica_urls(), start=1)
+        ]
+
+    def replica_engine(self, pin_cookie, authorization):
+        """Engine para um endpoint só de leitura: uma réplica, salvo se o utilizador acabou de escrever"""
+        if not self.replicas or is_pinned_to_primary(pin_cookie, authorization):
+            return self.primary
+        return random.choice(self.replicas)
+
+    async def dispose(self):
+        for engine in [self.primary, *self.replicas]:
+            await engine.dispose()
@@ -0,0 +1,116 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Tamanho máximo e validade (segundos) das entradas da cache de autenticação.
+# Cada processo (worker do gunicorn/uvicorn) tem a sua própria cache e
+# invalidate_user só limpa a do processo que tratou o pedido: nos restantes, um
+# utilizador desativado ou com o papel alterado continua aceite com os dados
+# antigos até a entrada expirar. Por isso a validade é curta; 0 desliga a cache.
+AUTH_CACHE_SIZE = int(os.getenv('AUTH_CACHE_SIZE', '2048'))
+AUTH_CACHE_TTL = int(os.getenv('AUTH_CACHE_TTL', '10'))
+
+
+class AuthPrincipal:
+    """Representação leve do utilizador autenticado, sem ligação à sessão do SQLAlchemy"""
+
+    __slots__ = ('id', 'username', 'email', 'role', 'rent_a_car_id', 'created_at', 'is_active')
+
+    def __init__(self, id, username, email, role, rent_a_car_id, created_at, is_active):
+        self.id = id
+        self.username = username
+        self.email = email
+        self.role = role
+        self.rent_a_car_id = rent_a_car_id
+        self.created_at = created_at
+        self.is_active = is_active
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(user.id, user.username, user.email, user.role, user.rent_a_car_id,
+                   user.created_at, user.is_active)
+
+    def __repr__(self):
+        return f'<AuthPrincipal {self.username}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'username': self.username,
+            'email': self.email,
+            'role': self.role,
+            'rent_a_car_id': self.rent_a_car_id,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'is_active': self.is_active
+        }
+
+
+class PrincipalCache:
+    """Cache LRU com validade que associa um token JWT ao utilizador autenticado
+
+    Uma entrada nunca vive mais do que o próprio token (exp), pelo que um token
+    presente na cache pode ser aceite sem voltar a verificar a assinatura. A
+    invalidação é local ao processo (ver AUTH_CACHE_TTL).
+    """
+
+    def __init__(self, maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._tokens_by_user = {}
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        entry = self._entries.get(token)
+        if entry is None:
+            return None
+        principal, expires_at = entry
+        if expires_at <= time.monotonic():
+            with self._lock:
+                self._remove(token)
+            return None
+        with self._lock:
+            if token in self._entries:
+                self._entries.move_to_end(token)
+        return principal
+
+    def set(self, token, principal, token_exp=None):
+        """Guardar o utilizador de um token; token_exp é o claim exp (epoch em segundos)"""
+        if self.ttl <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl
+        if token_exp is not None:
+            expires_at = min(expires_at, time.monotonic() + (token_exp - time.time()))
+        with self._lock:
+            self._remove(token)
+            self._entries[token] = (principal, expires_at)
+            self._tokens_by_user.setdefault(principal.id, set()).add(token)
+            while len(self._entries) > self.maxsize:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+
+    def invalidate_user(self, user_id):
+        """Remover todos os tokens em cache de um utilizador (ex.: desativado ou eliminado)"""
+        with self._lock:
+            for token in list(self._tokens_by_user.get(user_id, ())):
+                self._remove(token)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tokens_by_user.clear()
+
+    def _remove(self, token):
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        user_id = entry[0].id
+        tokens = self._tokens_by_user.get(user_id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[user_id]
+
+
+principal_cache = PrincipalCache()
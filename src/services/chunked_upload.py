@@ -0,0 +1,262 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows (desenvolvimento local)
+    fcntl = None
+
+# Tamanho dos blocos lidos do pedido/ficheiro; nunca se guarda mais do que isto em memória
+BLOCK_SIZE = 1024 * 1024
+CHUNK_SIZE = int(os.getenv('DOCUMENT_CHUNK_SIZE', 8 * 1024 * 1024))
+MAX_UPLOAD_SIZE = int(os.getenv('DOCUMENT_MAX_SIZE', 2 * 1024 * 1024 * 1024))
+# Uploads sem blocos novos há mais do que isto são considerados abandonados e apagados
+UPLOAD_TTL_HOURS = float(os.getenv('DOCUMENT_UPLOAD_TTL_HOURS', '24'))
+
+_CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+_UPLOAD_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+# Estado do SHA-256 dos uploads em curso neste processo. Se um bloco chegar a
+# outro worker (ou depois de um reinício), o estado é reconstruído lendo a parte
+# já gravada em disco uma única vez.
+_hashers = {}
+_hashers_lock = threading.Lock()
+
+
+class UploadError(Exception):
+    """Erro num upload por blocos; status é o código HTTP a devolver"""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+def copy_stream(source, destination, hasher=None, limit=None):
+    """Copiar source para destination em blocos, atualizando o hash na mesma passagem
+
+    Devolve o número de bytes copiados.
+    """
+    copied = 0
+    while True:
+        block = source.read(BLOCK_SIZE)
+        if not block:
+            break
+        copied += len(block)
+        if limit is not None and copied > limit:
+            raise UploadError('O bloco excede o tamanho indicado', 400)
+        destination.write(block)
+        if hasher is not None:
+            hasher.update(block)
+    return copied
+
+
+def parse_content_range(header):
+    """Interpretar um cabeçalho Content-Range (bytes início-fim/total)"""
+    match = _CONTENT_RANGE_RE.match((header or '').strip())
+    if not match:
+        raise UploadError('Cabeçalho Content-Range inválido (esperado: bytes início-fim/total)')
+    start, end, total = (int(value) for value in match.groups())
+    if end < start or end >= total:
+        raise UploadError('Intervalo do Content-Range inválido')
+    return start, end, total
+
+
+class ChunkedUpload:
+    """Upload resumível de um documento, gravado em blocos numa pasta temporária
+
+    Os metadados ficam num ficheiro JSON ao lado da parte já recebida, pelo que
+    qualquer worker pode continuar o upload. O offset atual é o tamanho da parte.
+    """
+
+    def __init__(self, upload_id, directory, metadata):
+        self.upload_id = upload_id
+        self.directory = directory
+        self.metadata = metadata
+
+    @staticmethod
+    def incoming_folder(upload_root):
+        path = os.path.join(upload_root, '.incoming')
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    @classmethod
+    def create(cls, upload_root, vehicle_id, filename, total_size, tipo_documento, uploaded_by):
+        if total_size <= 0 or total_size > MAX_UPLOAD_SIZE:
+            raise UploadError(f'Tamanho do ficheiro inválido (máximo {MAX_UPLOAD_SIZE} bytes)')
+
+        purge_stale_uploads(upload_root)
+        directory = cls.incoming_folder(upload_root)
+        upload = cls(uuid.uuid4().hex, directory, {
+            'vehicle_id': vehicle_id,
+            'filename': filename,
+            'total_size': total_size,
+            'tipo_documento': tipo_documento,
+            'uploaded_by': uploaded_by,
+            'created_at': datetime.utcnow().isoformat()
+        })
+        with open(upload.metadata_path, 'w') as f:
+            json.dump(upload.metadata, f)
+        open(upload.part_path, 'wb').close()
+        with _hashers_lock:
+            _hashers[upload.upload_id] = (hashlib.sha256(), 0)
+        return upload
+
+    @classmethod
+    def load(cls, upload_root, upload_id):
+        if not _UPLOAD_ID_RE.match(upload_id or ''):
+            raise UploadError('Upload não encontrado', 404)
+        directory = cls.incoming_folder(upload_root)
+        try:
+            with open(os.path.join(directory, f'{upload_id}.json')) as f:
+                metadata = json.load(f)
+        except FileNotFoundError:
+            raise UploadError('Upload não encontrado', 404)
+        return cls(upload_id, directory, metadata)
+
+    @property
+    def part_path(self):
+        return os.path.join(self.directory, f'{self.upload_id}.part')
+
+    @property
+    def metadata_path(self):
+        return os.path.join(self.directory, f'{self.upload_id}.json')
+
+    @property
+    def total_size(self):
+        return self.metadata['total_size']
+
+    @property
+    def offset(self):
+        try:
+            return os.path.getsize(self.part_path)
+        except FileNotFoundError:
+            return 0
+
+    @property
+    def complete(self):
+        return self.offset == self.total_size
+
+    def to_dict(self):
+        return {
+            'upload_id': self.upload_id,
+            'vehicle_id': self.metadata['vehicle_id'],
+            'filename': self.metadata['filename'],
+            'offset': self.offset,
+            'total_size': self.total_size,
+            'chunk_size': CHUNK_SIZE,
+            'complete': self.complete
+        }
+
+    def _hasher_at(self, offset):
+        """Obter o hash acumulado até offset, relendo a parte em disco se necessário"""
+        with _hashers_lock:
+            state = _hashers.get(self.upload_id)
+        if state is not None and state[1] == offset:
+            return state[0]
+
+        hasher = hashlib.sha256()
+        with open(self.part_path, 'rb') as f:
+            remaining = offset
+            while remaining:
+                block = f.read(min(BLOCK_SIZE, remaining))
+                if not block:
+                    break
+                hasher.update(block)
+                remaining -= len(block)
+        return hasher
+
+    def append(self, stream, content_range):
+        """Gravar um bloco recebido; o início tem de coincidir com o offset atual"""
+        start, end, total = parse_content_range(content_range)
+        if total != self.total_size:
+            raise UploadError('O tamanho total não corresponde ao do upload')
+
+        with open(self.part_path, 'ab') as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                offset = os.fstat(f.fileno()).st_size
+                if start != offset:
+                    raise UploadError('Offset inesperado; retome a partir do offset indicado', 409, offset)
+
+                hasher = self._hasher_at(offset)
+                expected = end - start + 1
+                try:
+                    written = copy_stream(stream, f, hasher, limit=expected)
+                    if written != expected:
+                        raise UploadError('Bloco incompleto', 400, offset)
+                except Exception:
+                    # Descartar o que foi escrito deste bloco para o cliente o poder repetir
+                    f.flush()
+                    f.truncate(offset)
+                    with _hashers_lock:
+                        _hashers.pop(self.upload_id, None)
+                    raise
+                f.flush()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+        with _hashers_lock:
+            _hashers[self.upload_id] = (hasher, offset + written)
+        return offset + written
+
+    def checksum(self):
+        return self._hasher_at(self.offset).hexdigest()
+
+    def finish(self, destination):
+        """Mover o ficheiro completo para destination e devolver o SHA-256"""
+        if not self.complete:
+            raise UploadError('Upload incompleto', 409, self.offset)
+        checksum = self.checksum()
+        shutil.move(self.part_path, destination)
+        self.discard()
+        return checksum
+
+    def discard(self):
+        for path in (self.part_path, self.metadata_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        with _hashers_lock:
+            _hashers.pop(self.upload_id, None)
+
+
+def purge_stale_uploads(upload_root, max_age_hours=None):
+    """Apagar os uploads abandonados (parte e metadados) e o hash guardado; devolve quantos foram apagados
+
+    A última atividade de um upload é a data de modificação mais recente dos
+    seus ficheiros (cada bloco recebido atualiza a parte).
+    """
+    directory = ChunkedUpload.incoming_folder(upload_root)
+    limit = time.time() - 3600 * (max_age_hours or UPLOAD_TTL_HOURS)
+    last_activity = {}
+    for name in os.listdir(directory):
+        upload_id, extension = os.path.splitext(name)
+        if extension not in ('.part', '.json') or not _UPLOAD_ID_RE.match(upload_id):
+            continue
+        try:
+            modified = os.path.getmtime(os.path.join(directory, name))
+        except FileNotFoundError:
+            continue
+        last_activity[upload_id] = max(modified, last_activity.get(upload_id, 0))
+
+    stale = [upload_id for upload_id, modified in last_activity.items() if modified < limit]
+    for upload_id in stale:
+        ChunkedUpload(upload_id, directory, None).discard()
+
+    # Hashes de uploads que já não existem (concluídos ou cancelados noutro worker); se um
+    # upload acabado de criar for apanhado aqui, o hash é apenas reconstruído a partir do disco
+    with _hashers_lock:
+        for upload_id in [upload_id for upload_id in _hashers if upload_id not in last_activity]:
+            del _hashers[upload_id]
+    return len(stale)
@@ -0,0 +1,184 @@
+import os
+import threading
+import time
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import case, event, inspect
+from sqlalchemy.orm import Session
+
+from src.models.user import db
+from src.models.vehicle import Vehicle
+from src.services import after_commit
+from src.services.db_routing import primary_reads
+
+STATUSES = ('em_tratamento', 'submetido', 'recuperado', 'perdido')
+
+# Idade máxima do snapshot antes de ser reconstruído. Cada worker do gunicorn
+# mantém o seu próprio snapshot, por isso este valor limita o tempo durante o
+# qual alterações feitas noutro worker podem não aparecer no dashboard.
+MAX_AGE_SECONDS = int(os.getenv('DASHBOARD_STATS_MAX_AGE', '60'))
+
+_PENDING_KEY = 'dashboard_stats_deltas'
+
+
+def _empty_bucket():
+    return {'count': 0, 'valor_em_falta': Decimal('0'), **{status: 0 for status in STATUSES}}
+
+
+def _to_decimal(value):
+    if value is None or value == '':
+        return Decimal('0')
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+
+class DashboardStatsSnapshot:
+    """Snapshot em memória das estatísticas do dashboard
+
+    Os contadores são guardados por (marca, loja_aluguer) e mantidos de forma
+    incremental a partir dos eventos do ORM sobre Vehicle; uma reconstrução
+    completa só acontece no primeiro pedido, quando o snapshot expira ou
+    depois de invalidate() (usado por escritas em massa que não passam pelo ORM).
+    """
+
+    def __init__(self, max_age=MAX_AGE_SECONDS):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._buckets = None
+        self._built_at = None
+        self._built_monotonic = None
+
+    def invalidate(self):
+        with self._lock:
+            self._buckets = None
+
+    def rebuild(self):
+        """Recalcular todos os contadores numa única passagem de agregação condicional"""
+        columns = [
+            Vehicle.marca,
+            Vehicle.loja_aluguer,
+            db.func.count(Vehicle.id),
+            *[db.func.sum(case((Vehicle.status == status, 1), else_=0)) for status in STATUSES],
+            db.func.sum(case((Vehicle.status != 'recuperado', Vehicle.valor), else_=None)),
+        ]
+        # O snapshot serve os pedidos seguintes e recebe os deltas das escritas deste processo:
+        # tem de partir do principal e não de uma réplica atrasada (/dashboard/stats é @replica_read)
+        with primary_reads():
+            rows = db.session.query(*columns).group_by(Vehicle.marca, Vehicle.loja_aluguer).all()
+
+        buckets = {}
+        for row in rows:
+            marca, loja, count = row[0], row[1], row[2]
+            bucket = _empty_bucket()
+            bucket['count'] = count
+            for index, status in enumerate(STATUSES):
+                bucket[status] = int(row[3 + index] or 0)
+            bucket['valor_em_falta'] = _to_decimal(row[-1])
+            buckets[(marca, loja)] = bucket
+
+        with self._lock:
+            self._buckets = buckets
+            self._built_at = datetime.utcnow()
+            self._built_monotonic = time.monotonic()
+
+    def apply(self, deltas):
+        """Aplicar contribuições (+1/-1) de veículos criados, alterados ou eliminados"""
+        with self._lock:
+            if self._buckets is None:
+                return
+            for sign, (marca, loja, status, valor) in deltas:
+                bucket = self._buckets.setdefault((marca, loja), _empty_bucket())
+                bucket['count'] += sign
+                if status in bucket:
+                    bucket[status] += sign
+                if status != 'recuperado':
+                    bucket['valor_em_falta'] += sign * _to_decimal(valor)
+                if bucket['count'] <= 0:
+                    del self._buckets[(marca, loja)]
+
+    def age(self):
+        if self._built_monotonic is None:
+            return None
+        return time.monotonic() - self._built_monotonic
+
+    def get(self, force_refresh=False):
+        """Obter as estatísticas no formato devolvido por /dashboard/stats"""
+        age = self.age()
+        if force_refresh or self._buckets is None or age is None or age > self.max_age:
+            self.rebuild()
+
+        with self._lock:
+            buckets = dict(self._buckets)
+            built_at = self._built_at
+            age = self.age()
+
+        totals = _empty_bucket()
+        marca_counts = {}
+        loja_counts = {}
+        for (marca, loja), bucket in buckets.items():
+            for key in totals:
+                totals[key] += bucket[key]
+            marca_counts[marca] = marca_counts.get(marca, 0) + bucket['count']
+            if loja is not None:
+                loja_counts[loja] = loja_counts.get(loja, 0) + bucket['count']
+
+        return {
+            'total_vehicles': totals['count'],
+            'em_tratamento': totals['em_tratamento'],
+            'submetidos': totals['submetido'],
+            'recuperados': totals['recuperado'],
+            'perdidos': totals['perdido'],
+            'marca_stats': [{'marca': marca, 'count': count} for marca, count in marca_counts.items()],
+            'loja_stats': [{'loja': loja, 'count': count} for loja, count in loja_counts.items()],
+            'valor_total_em_falta': float(totals['valor_em_falta']),
+            'snapshot_built_at': built_at.isoformat() if built_at else None,
+            'snapshot_age_seconds': round(age, 3) if age is not None else None
+        }
+
+
+snapshot = DashboardStatsSnapshot()
+
+
+def _contribution(target, use_old_values=False):
+    """Obter a chave (marca, loja, status, valor) de um veículo, opcionalmente com os valores anteriores"""
+    if not use_old_values:
+        return (target.marca, target.loja_aluguer, target.status, target.valor)
+
+    state = inspect(target)
+    values = []
+    for name in ('marca', 'loja_aluguer', 'status', 'valor'):
+        history = state.attrs[name].history
+        if history.deleted:
+            values.append(history.deleted[0])
+        elif history.unchanged:
+            values.append(history.unchanged[0])
+        else:
+            values.append(getattr(target, name))
+    return tuple(values)
+
+
+def _queue(connection, target, deltas):
+    session = Session.object_session(target)
+    if session is not None:
+        after_commit.defer(session, _PENDING_KEY, *deltas)
+
+
+@event.listens_for(Vehicle, 'after_insert')
+def _vehicle_inserted(mapper, connection, target):
+    _queue(connection, target, [(1, _contribution(target))])
+
+
+@event.listens_for(Vehicle, 'after_update')
+def _vehicle_updated(mapper, connection, target):
+    old = _contribution(target, use_old_values=True)
+    new = _contribution(target)
+    if old != new:
+        _queue(connection, target, [(-1, old), (1, new)])
+
+
+@event.listens_for(Vehicle, 'after_delete')
+def _vehicle_deleted(mapper, connection, target):
+    _queue(connection, target, [(-1, _contribution(target, use_old_values=True))])
+
+
+after_commit.register(_PENDING_KEY, snapshot.apply)
@@ -0,0 +1,307 @@
+"""Configuração do engine da base de dados (pool de ligações) e métricas do pool
+
+Pensado para o Neon (PostgreSQL serverless): o compute suspende-se ao fim de
+alguns minutos sem atividade e as ligações inativas são cortadas. Sem
+configuração, a primeira consulta depois de um período parado recebia uma
+ligação morta do pool e falhava ou esperava pelo timeout de TCP. Aqui:
+
+- pool_pre_ping testa a ligação antes de a entregar e substitui-a se estiver morta;
+- pool_recycle renova as ligações antes de o Neon/proxies as cortarem;
+- o pool é LIFO, reutilizando as ligações mais recentes (as restantes envelhecem
+  e são recicladas em vez de ficarem todas "frias" ao mesmo tempo);
+- connect_timeout e keepalives de TCP limitam a espera por um compute que
+  está a arrancar ou por uma ligação que desapareceu;
+- statement_timeout impede que uma consulta presa ocupe uma ligação do pool.
+
+Com o endpoint com PgBouncer do Neon (host ep-...-pooler) o PgBouncer está em
+modo transaction: o parâmetro options não é aceite no arranque da ligação, pelo
+que o statement_timeout é aplicado com SET LOCAL em cada transação (uma ida à
+base de dados a mais; com DB_STATEMENT_TIMEOUT_MS=0 pode ser definido no role
+com ALTER ROLE ... SET statement_timeout), e os prepared statements do lado do
+servidor são desligados nos drivers que os usam (psycopg 3). O psycopg2 não
+usa prepared statements, por isso é compatível sem alterações.
+
+Variáveis de ambiente:
+    DB_POOL_SIZE (5; 0 usa NullPool, uma ligação por pedido), DB_MAX_OVERFLOW (10),
+    DB_POOL_TIMEOUT (30 s), DB_POOL_RECYCLE (240 s), DB_POOL_PRE_PING (true),
+    DB_CONNECT_TIMEOUT (10 s), DB_STATEMENT_TIMEOUT_MS (30000; 0 desliga),
+    DB_USE_NEON_POOLER (false; usa o endpoint -pooler do Neon),
+    DB_PGBOUNCER (auto, true ou false; auto deteta o endpoint -pooler)
+
+Modo SQLite (sem DATABASE_URL, ou com um sqlite:///ficheiro): cada ligação é
+configurada com journal_mode=WAL (as leituras não bloqueiam a escrita e
+vice-versa), synchronous=NORMAL, busy_timeout, cache_size e mmap_size. As
+leituras e as escritas usam engines separados sobre o mesmo ficheiro: o de
+leitura (bind SQLITE_READ_BIND_KEY, PRAGMA query_only) serve as consultas e o de
+escrita abre as transações com BEGIN IMMEDIATE, pelo que os escritores de vários
+processos/threads esperam pela vez (até ao busy_timeout) em vez de falharem com
+"database is locked" a meio da transação. A escolha do engine por consulta é
+feita pela sessão (src/services/db_routing.py).
+
+Réplicas de leitura (ex.: read replicas do Neon): DATABASE_REPLICA_URLS, uma ou
+mais URLs separadas por vírgulas, cria um bind por réplica (replica_1, ...)
+com as mesmas opções de pool do engine principal. Só os endpoints marcados como
+só de leitura as usam (src/services/db_routing.py).
+
+    SQLITE_BUSY_TIMEOUT_MS (10000), SQLITE_CACHE_SIZE_KB (65536), SQLITE_MMAP_SIZE_MB (256),
+    SQLITE_SYNCHRONOUS (NORMAL), SQLITE_READ_SPLIT (true; false usa um só engine)
+"""
+
+import os
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool
+
+NEON_POOLER_SUFFIX = '-pooler'
+APPLICATION_NAME = 'rec'
+SQLITE_READ_BIND_KEY = 'sqlite_reader'
+REPLICA_BIND_PREFIX = 'replica_'
+
+
+def _env_int(name, default):
+    return int(os.getenv(name, str(default)))
+
+
+def _env_bool(name, default):
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def is_postgres(database_url):
+    return make_url(database_url).get_backend_name() == 'postgresql'
+
+
+def neon_pooled_url(database_url):
+    """Endereço do endpoint com PgBouncer do Neon (ep-xxx-pooler.<região>.neon.tech)"""
+    url = make_url(database_url)
+    endpoint, _, domain = (url.host or '').partition('.')
+    if not domain.endswith('neon.tech') or endpoint.endswith(NEON_POOLER_SUFFIX):
+        return database_url
+    return url.set(host=f'{endpoint}{NEON_POOLER_SUFFIX}.{domain}').render_as_string(hide_password=False)
+
+
+def uses_pgbouncer(database_url):
+    """Se a ligação passa por um PgBouncer em modo transaction"""
+    setting = os.getenv('DB_PGBOUNCER', 'auto').strip().lower()
+    if setting != 'auto':
+        return setting in ('1', 'true', 'yes', 'on')
+    endpoint = (make_url(database_url).host or '').partition('.')[0]
+    return endpoint.endswith(NEON_POOLER_SUFFIX)
+
+
+def resolve_database_url(database_url):
+    """Normalizar o DATABASE_URL (postgres:// é rejeitado pelo SQLAlchemy 2) e escolher o endpoint"""
+    if database_url.startswith('postgres://'):
+        database_url = 'postgresql://' + database_url[len('postgres://'):]
+    if is_postgres(database_url) and _env_bool('DB_USE_NEON_POOLER', False):
+        database_url = neon_pooled_url(database_url)
+    return database_url
+
+
+def is_sqlite_file(database_url):
+    """SQLite num ficheiro (uma base de dados em memória não pode ser partilhada entre engines)"""
+    url = make_url(database_url)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+def statement_timeout_ms():
+    return _env_int('DB_STATEMENT_TIMEOUT_MS', 30000)
+
+
+def connect_timeout():
+    return _env_int('DB_CONNECT_TIMEOUT', 10)
+
+
+def sqlite_busy_timeout_ms():
+    return _env_int('SQLITE_BUSY_TIMEOUT_MS', 10000)
+
+
+def sqlite_engine_options():
+    # timeout do sqlite3 (segundos) = busy_timeout; o PRAGMA em configure_sqlite_engine repete-o
+    return {'connect_args': {'timeout': sqlite_busy_timeout_ms() / 1000, 'check_same_thread': False}}
+
+
+def sqlite_binds(database_url):
+    """SQLALCHEMY_BINDS com o engine só de leitura do modo SQLite ({} se não se aplicar)"""
+    if not is_sqlite_file(database_url) or not _env_bool('SQLITE_READ_SPLIT', True):
+        return {}
+    return {SQLITE_READ_BIND_KEY: {'url': database_url, **sqlite_engine_options()}}
+
+
+def replica_urls():
+    """URLs das réplicas de leitura (DATABASE_REPLICA_URLS, separadas por vírgulas)"""
+    return [resolve_database_url(url.strip())
+            for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+
+
+def replica_binds():
+    """SQLALCHEMY_BINDS das réplicas de leitura ({} sem DATABASE_REPLICA_URLS)"""
+    return {
+        f'{REPLICA_BIND_PREFIX}{number}': {'url': url, **engine_options(url)}
+        for number, url in enumerate(replica_urls(), start=1)
+    }
+
+
+def configure_sqlite_engine(engine, read_only=False):
+    """PRAGMAs por ligação e controlo das transações de um engine SQLite"""
+    pragmas = [
+        'journal_mode=WAL',
+        f"synchronous={os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL').upper()}",
+        f'busy_timeout={sqlite_busy_timeout_ms()}',
+        # Valor negativo = tamanho em KiB (por ligação)
+        f"cache_size=-{_env_int('SQLITE_CACHE_SIZE_KB', 65536)}",
+        f"mmap_size={_env_int('SQLITE_MMAP_SIZE_MB', 256) * 1024 * 1024}",
+        'temp_store=MEMORY',
+    ]
+    if read_only:
+        pragmas.append('query_only=ON')
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        # O módulo sqlite3 abre as transações por conta própria (e só antes de um INSERT/UPDATE);
+        # desligado, o BEGIN passa a ser emitido no evento begin abaixo
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(f'PRAGMA {pragma}')
+        cursor.close()
+
+    @event.listens_for(engine, 'begin')
+    def begin(connection):
+        # O escritor reserva o lock de escrita logo no início: com BEGIN simples a transação que
+        # leu e depois escreve recebe SQLITE_BUSY sem esperar se outro escritor se adiantou
+        connection.exec_driver_sql('BEGIN' if read_only else 'BEGIN IMMEDIATE')
+
+
+def engine_options(database_url):
+    """Opções do engine (SQLALCHEMY_ENGINE_OPTIONS) para o DATABASE_URL"""
+    url = make_url(database_url)
+    if is_sqlite_file(database_url):
+        return sqlite_engine_options()
+    if url.get_backend_name() != 'postgresql':
+        return {}
+
+    options = {
+        'pool_pre_ping': _env_bool('DB_POOL_PRE_PING', True),
+    }
+    pool_size = _env_int('DB_POOL_SIZE', 5)
+    if pool_size == 0:
+        options['poolclass'] = NullPool
+    else:
+        options.update({
+            'pool_size': pool_size,
+            'max_overflow': _env_int('DB_MAX_OVERFLOW', 10),
+            'pool_timeout': _env_int('DB_POOL_TIMEOUT', 30),
+            'pool_recycle': _env_int('DB_POOL_RECYCLE', 240),
+            'pool_use_lifo': True,
+        })
+
+    connect_args = {
+        'connect_timeout': connect_timeout(),
+        'application_name': APPLICATION_NAME,
+        'keepalives': 1,
+        'keepalives_idle': 30,
+        'keepalives_interval': 10,
+        'keepalives_count': 3,
+    }
+    timeout = statement_timeout_ms()
+    if uses_pgbouncer(database_url):
+        if url.get_driver_name() == 'psycopg':
+            # Sem prepared statements do lado do servidor (não sobrevivem à troca de ligação no PgBouncer)
+            connect_args['prepare_threshold'] = None
+    elif timeout:
+        connect_args['options'] = f'-c statement_timeout={timeout}'
+    options['connect_args'] = connect_args
+    return options
+
+
+class PoolMetrics:
+    """Contadores dos eventos do pool de um engine"""
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.connect_time_total = 0.0
+        self.connect_time_max = 0.0
+        self.checkouts = 0
+        self.invalidations = 0
+        self.closes = 0
+
+    def record_connect(self, elapsed):
+        with self._lock:
+            self.connects += 1
+            self.connect_time_total += elapsed
+            self.connect_time_max = max(self.connect_time_max, elapsed)
+
+    def increment(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def snapshot(self, pool):
+        with self._lock:
+            data = {
+                'connects': self.connects,
+                'connect_ms_avg': round(self.connect_time_total / self.connects * 1000, 1) if self.connects else None,
+                'connect_ms_max': round(self.connect_time_max * 1000, 1),
+                'checkouts': self.checkouts,
+                'invalidations': self.invalidations,
+                'closes': self.closes,
+            }
+        data['pool'] = type(pool).__name__
+        # NullPool não tem tamanho nem ligações em espera
+        for key, method in (('size', 'size'), ('checked_in', 'checkedin'),
+                            ('checked_out', 'checkedout'), ('overflow', 'overflow')):
+            if hasattr(pool, method):
+                data[key] = getattr(pool, method)()
+        return data
+
+
+_engines = {}
+
+
+def instrument_engine(engine, name='primary'):
+    """Registar as métricas do pool e, atrás de um PgBouncer, o statement_timeout por transação"""
+    if name in _engines:
+        return _engines[name][1]
+    metrics = PoolMetrics(name)
+
+    @event.listens_for(engine, 'do_connect')
+    def timed_connect(dialect, conn_rec, cargs, cparams):
+        # O tempo de ligação mostra os arranques a frio do compute do Neon
+        started = time.perf_counter()
+        connection = dialect.connect(*cargs, **cparams)
+        metrics.record_connect(time.perf_counter() - started)
+        return connection
+
+    event.listen(engine, 'checkout', lambda *args: metrics.increment('checkouts'))
+    event.listen(engine, 'invalidate', lambda *args: metrics.increment('invalidations'))
+    event.listen(engine, 'close', lambda *args: metrics.increment('closes'))
+
+    timeout = statement_timeout_ms()
+    if engine.dialect.name == 'postgresql' and timeout and uses_pgbouncer(engine.url.render_as_string(hide_password=False)):
+        @event.listens_for(engine, 'begin')
+        def set_statement_timeout(connection):
+            connection.exec_driver_sql(f'SET LOCAL statement_timeout = {int(timeout)}')
+
+    _engines[name] = (engine, metrics)
+    return metrics
+
+
+def configure_engines(engines):
+    """Configurar os engines da aplicação (db.engines): modo SQLite e métricas do pool"""
+    for key, engine in engines.items():
+        if engine.dialect.name == 'sqlite' and is_sqlite_file(engine.url.render_as_string()):
+            # Só o engine principal escreve; o leitor do modo SQLite e as réplicas ficam query_only
+            configure_sqlite_engine(engine, read_only=key is not None)
+        instrument_engine(engine, 'primary' if key is None else key)
+
+
+def pool_metrics():
+    """Estado e contadores do pool de cada engine instrumentado"""
+    return {name: metrics.snapshot(engine.pool) for name, (engine, metrics) in _engines.items()}
@@ -0,0 +1,178 @@
+"""Escolha do engine de leitura ou de escrita por consulta na sessão
+
+A sessão da aplicação (db.session) envia as consultas SELECT para um engine de
+leitura, quando existe, e tudo o resto para o engine principal: os flush do
+ORM, INSERT/UPDATE/DELETE, SELECT ... FOR UPDATE, SQL em texto e
+session.connection(). Depois de a transação da sessão escrever, todas as
+consultas seguintes vão para o principal até ao commit/rollback, para que a
+própria transação veja o que já escreveu.
+
+Há dois tipos de engine de leitura:
+
+- o leitor do modo SQLite (mesmo ficheiro, WAL), sempre consistente com o
+  principal, usado em qualquer pedido;
+- as réplicas de leitura (DATABASE_REPLICA_URLS), com algum atraso em relação
+  ao principal, usadas só nos endpoints marcados com @replica_read.
+
+Para que um operador veja logo o que acabou de gravar (read-your-writes), um
+pedido que confirma escritas fixa quem o fez ao principal durante
+DB_REPLICA_PIN_SECONDS: no processo atual, pelo token do pedido, e nos restantes
+workers através de um cookie com o fim da janela.
+"""
+
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+from src.services.db_engine import REPLICA_BIND_PREFIX, SQLITE_READ_BIND_KEY
+
+REPLICA_PIN_SECONDS = float(os.getenv('DB_REPLICA_PIN_SECONDS', '10'))
+PIN_COOKIE = 'rec_primary_until'
+
+# Chaves em session.info
+WROTE = 'wrote'
+REPLICA = 'replica'
+
+
+def _is_plain_select(clause):
+    return (
+        clause is not None
+        and getattr(clause, 'is_select', False)
+        and getattr(clause, '_for_update_arg', None) is None
+    )
+
+
+class PrimaryPins:
+    """Fim da janela em que cada token lê do principal (por processo)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._until = {}
+
+    def pin(self, key, seconds):
+        now = time.time()
+        with self._lock:
+            # Limpar as entradas expiradas de vez em quando para o dicionário não crescer
+            if len(self._until) > 1024:
+                self._until = {k: until for k, until in self._until.items() if until > now}
+            self._until[key] = now + seconds
+
+    def is_pinned(self, key):
+        with self._lock:
+            return self._until.get(key, 0) > time.time()
+
+
+primary_pins = PrimaryPins()
+
+
+def _pin_key():
+    return request.headers.get('Authorization')
+
+
+def is_pinned_to_primary(pin_cookie, authorization):
+    """Se quem envia este cookie/token escreveu há menos de DB_REPLICA_PIN_SECONDS"""
+    try:
+        if float(pin_cookie or 0) > time.time():
+            return True
+    except ValueError:
+        pass
+    return authorization is not None and primary_pins.is_pinned(authorization)
+
+
+def _pinned_to_primary():
+    return is_pinned_to_primary(request.cookies.get(PIN_COOKIE), _pin_key())
+
+
+def replica_read(f):
+    """Marcar um endpoint só de leitura: as consultas podem ir para uma réplica"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        g.read_from_replica = not _pinned_to_primary()
+        return f(*args, **kwargs)
+
+    return decorated
+
+
+@contextmanager
+def primary_reads():
+    """Ler do principal, mesmo num endpoint @replica_read
+
+    Para dados que ficam em memória e servem os pedidos seguintes (ex.: o snapshot
+    do dashboard), que não podem ser construídos a partir de uma réplica atrasada.
+    """
+    if not has_request_context():
+        yield
+        return
+    previous = g.get('read_from_replica', False)
+    g.read_from_replica = False
+    try:
+        yield
+    finally:
+        g.read_from_replica = previous
+
+
+class RoutingSession(Session):
+    """Session da Flask-SQLAlchemy que encaminha as leituras para um engine de leitura"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None:
+            return engine
+        engines = self._db.engines
+        if engine is not engines.get(None):
+            return engine
+        if self._flushing or not _is_plain_select(clause):
+            self.info[WROTE] = True
+            return engine
+        if self.info.get(WROTE):
+            return engine
+        return self._reader(engines) or engine
+
+    def _reader(self, engines):
+        if has_request_context() and g.get('read_from_replica'):
+            key = self.info.get(REPLICA)
+            if key is None:
+                replicas = [name for name in engines if name and name.startswith(REPLICA_BIND_PREFIX)]
+                if replicas:
+                    # Uma réplica por transação, para que as leituras do pedido sejam coerentes
+                    key = self.info[REPLICA] = random.choice(replicas)
+            if key is not None:
+                return engines[key]
+        return engines.get(SQLITE_READ_BIND_KEY)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _pin_after_write(session):
+    if session.info.get(WROTE) and has_request_context():
+        g.wrote_to_primary = True
+        key = _pin_key()
+        if key is not None:
+            primary_pins.pin(key, REPLICA_PIN_SECONDS)
+
+
+@event.listens_for(RoutingSession, 'after_transaction_end')
+def _reset_routing(session, transaction):
+    if transaction.parent is None:
+        session.info.pop(WROTE, None)
+        session.info.pop(REPLICA, None)
+
+
+def init_read_routing(app):
+    """Registar o cookie que fixa ao principal quem acabou de escrever (só com réplicas)"""
+    if not any(key and key.startswith(REPLICA_BIND_PREFIX) for key in app.config.get('SQLALCHEMY_BINDS', {})):
+        return
+
+    @app.after_request
+    def set_pin_cookie(response):
+        if g.get('wrote_to_primary'):
+            until = time.time() + REPLICA_PIN_SECONDS
+            response.set_cookie(PIN_COOKIE, f'{until:.3f}', max_age=int(REPLICA_PIN_SECONDS) + 1,
+                                httponly=True, samesite='Lax')
+        return response
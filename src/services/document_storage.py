@@ -0,0 +1,362 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+from sqlalchemy import select, text
+from sqlalchemy.exc import IntegrityError
+
+from src.models.user import db
+from src.models.stored_blob import StoredBlob
+from src.services import after_commit
+from src.services.chunked_upload import BLOCK_SIZE, copy_stream
+
+CONTENT_KEY_PREFIX = 'sha256:'
+
+DEFAULT_LOCAL_ROOT = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'uploads', 'blobs')
+
+_PURGE_KEY = 'document_store_purge'
+
+ALLOWED_EXTENSIONS = {'pdf', 'doc', 'docx', 'jpg', 'jpeg', 'png', 'txt', 'csv', 'gpx', 'kml', 'zip', 'mp4', 'mov'}
+
+
+def allowed_file(filename):
+    return '.' in filename and \
+           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+
+def content_key_for(checksum):
+    return f'{CONTENT_KEY_PREFIX}{checksum}'
+
+
+def is_content_key(value):
+    """Distinguir chaves de conteúdo de caminhos de ficheiros antigos (uploads/<uuid>_nome)"""
+    return bool(value) and value.startswith(CONTENT_KEY_PREFIX)
+
+
+def checksum_of(content_key):
+    return content_key[len(CONTENT_KEY_PREFIX):]
+
+
+class ContentMissing(RuntimeError):
+    """O conteúdo enviado com upload_staged foi apagado antes de ter uma referência"""
+
+
+class StorageNotShared(RuntimeError):
+    """O backend configurado não é visível para todos os serviços (web e worker)"""
+
+
+class StorageBackend:
+    """Interface dos backends onde o conteúdo dos documentos é guardado"""
+
+    name = None
+    # Se o conteúdo gravado por um serviço (ex.: o worker) é visível para os outros (o web)
+    shared = False
+
+    def exists(self, content_key):
+        raise NotImplementedError
+
+    def put_file(self, local_path, content_key):
+        """Guardar um ficheiro local (que pode ser movido/consumido) sob content_key"""
+        raise NotImplementedError
+
+    def open(self, content_key):
+        """Abrir o conteúdo para leitura em blocos"""
+        raise NotImplementedError
+
+    def delete(self, content_key):
+        raise NotImplementedError
+
+    def local_path(self, content_key):
+        """Caminho em disco, quando o backend é local (permite usar send_file com Range)"""
+        return None
+
+    def download_url(self, content_key, filename, expires_in=300):
+        """URL temporário para download direto, quando o backend o suporta"""
+        return None
+
+
+class LocalStorageBackend(StorageBackend):
+    """Guarda cada conteúdo em <root>/ab/cd/<sha256>"""
+
+    name = 'local'
+
+    def __init__(self, root=None):
+        self.root = root or os.getenv('DOCUMENT_STORAGE_PATH', DEFAULT_LOCAL_ROOT)
+        os.makedirs(self.root, exist_ok=True)
+        # O disco local só é partilhado quando o web e o worker correm na mesma máquina
+        # (ou montam o mesmo volume); no Render são serviços com discos separados e o
+        # render.yaml define DOCUMENT_STORAGE_LOCAL_SHARED=false
+        self.shared = os.getenv('DOCUMENT_STORAGE_LOCAL_SHARED', 'true').strip().lower() in ('1', 'true', 'yes', 'on')
+
+    def local_path(self, content_key):
+        checksum = checksum_of(content_key)
+        return os.path.join(self.root, checksum[:2], checksum[2:4], checksum)
+
+    def exists(self, content_key):
+        return os.path.exists(self.local_path(content_key))
+
+    def put_file(self, local_path, content_key):
+        destination = self.local_path(content_key)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        shutil.move(local_path, destination)
+
+    def open(self, content_key):
+        return open(self.local_path(content_key), 'rb')
+
+    def delete(self, content_key):
+        try:
+            os.remove(self.local_path(content_key))
+        except FileNotFoundError:
+            pass
+
+
+class S3StorageBackend(StorageBackend):
+    """Backend compatível com S3 (AWS, Cloudflare R2, MinIO local via S3_ENDPOINT_URL)"""
+
+    name = 's3'
+    shared = True
+
+    def __init__(self, bucket=None, prefix=None, endpoint_url=None, region=None):
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError('O backend S3 requer o pacote boto3 (pip install boto3)')
+
+        self.bucket = bucket or os.getenv('S3_BUCKET')
+        if not self.bucket:
+            raise RuntimeError('S3_BUCKET não está definido')
+        self.prefix = (prefix if prefix is not None else os.getenv('S3_PREFIX', 'documents/')).lstrip('/')
+        self.client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url or os.getenv('S3_ENDPOINT_URL'),
+            region_name=region or os.getenv('S3_REGION'),
+            aws_access_key_id=os.getenv('S3_ACCESS_KEY_ID'),
+            aws_secret_access_key=os.getenv('S3_SECRET_ACCESS_KEY')
+        )
+
+    def _object_key(self, content_key):
+        checksum = checksum_of(content_key)
+        return f'{self.prefix}{checksum[:2]}/{checksum}'
+
+    def exists(self, content_key):
+        from botocore.exceptions import ClientError
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._object_key(content_key))
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def put_file(self, local_path, content_key):
+        # upload_file usa multipart upload em blocos, sem ler o ficheiro inteiro para memória
+        self.client.upload_file(local_path, self.bucket, self._object_key(content_key))
+        os.remove(local_path)
+
+    def open(self, content_key):
+        return self.client.get_object(Bucket=self.bucket, Key=self._object_key(content_key))['Body']
+
+    def delete(self, content_key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(content_key))
+
+    def download_url(self, content_key, filename, expires_in=300):
+        return self.client.generate_presigned_url(
+            'get_object',
+            Params={
+                'Bucket': self.bucket,
+                'Key': self._object_key(content_key),
+                'ResponseContentDisposition': f'attachment; filename="{filename}"'
+            },
+            ExpiresIn=expires_in
+        )
+
+
+BACKENDS = {
+    'local': LocalStorageBackend,
+    's3': S3StorageBackend,
+}
+
+
+class DocumentStore:
+    """Armazenamento de documentos endereçado por conteúdo, com contagem de referências
+
+    O mesmo ficheiro anexado a vários veículos é guardado uma só vez; cada
+    Document aponta para a chave sha256:<hex> em caminho_ficheiro.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.staging_dir = os.path.join(tempfile.gettempdir(), 'rec-document-staging')
+        if isinstance(backend, LocalStorageBackend):
+            # Na mesma partição que os blobs, para que a mudança final seja um simples rename
+            self.staging_dir = os.path.join(backend.root, '.staging')
+        os.makedirs(self.staging_dir, exist_ok=True)
+
+    def staging_file(self):
+        """Criar um ficheiro temporário onde gravar conteúdo antes de o guardar"""
+        fd, path = tempfile.mkstemp(dir=self.staging_dir)
+        os.close(fd)
+        return path
+
+    def store_stream(self, stream):
+        """Gravar um stream em blocos, calculando o SHA-256 na mesma passagem
+
+        Devolve (content_key, tamanho).
+        """
+        path = self.staging_file()
+        hasher = hashlib.sha256()
+        try:
+            with open(path, 'wb') as destination:
+                size = copy_stream(stream, destination, hasher)
+            return self.store_file(path, hasher.hexdigest(), size), size
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def store_file(self, path, checksum, size):
+        """Guardar um ficheiro já com hash calculado e acrescentar uma referência
+
+        Se o conteúdo já existir, o ficheiro temporário é descartado. A alteração
+        ao StoredBlob fica na sessão atual e é confirmada com o Document. path pode
+        ser None quando o conteúdo já foi enviado com upload_staged; se entretanto
+        foi apagado (a última referência foi libertada), lança ContentMissing.
+        """
+        content_key = content_key_for(checksum)
+        _lock_content(db.session.connection(), content_key)
+        blob = db.session.get(StoredBlob, content_key, with_for_update=self._lock_rows(), populate_existing=True)
+        if blob is None:
+            if not self.backend.exists(content_key):
+                if path is None:
+                    raise ContentMissing(f'O conteúdo {content_key} já não existe no armazenamento')
+                self.backend.put_file(path, content_key)
+            blob = StoredBlob(content_key=content_key, size=size, ref_count=0, backend=self.backend.name)
+            try:
+                with db.session.begin_nested():
+                    db.session.add(blob)
+                    db.session.flush()
+            except IntegrityError:
+                # Outro pedido guardou o mesmo conteúdo entretanto
+                blob = db.session.get(StoredBlob, content_key, with_for_update=self._lock_rows())
+        blob.ref_count = StoredBlob.ref_count + 1
+        if path and os.path.exists(path):
+            os.remove(path)
+        return content_key
+
+    def upload_staged(self, path, checksum):
+        """Enviar um ficheiro temporário para o backend, sem tocar na base de dados
+
+        Permite enviar vários ficheiros em paralelo (em threads sem sessão); o
+        store_file feito depois na sessão só cria a referência, porque o conteúdo
+        já existe no backend. Devolve a chave de conteúdo.
+        """
+        content_key = content_key_for(checksum)
+        if self.backend.exists(content_key):
+            os.remove(path)
+        else:
+            self.backend.put_file(path, content_key)
+        return content_key
+
+    def release(self, content_key):
+        """Remover uma referência; apaga o conteúdo quando já ninguém o usa"""
+        # session.connection() fixa a transação ao engine de escrita: com o leitor do modo
+        # SQLite (ou uma réplica) o ref_count lido podia estar desatualizado
+        _lock_content(db.session.connection(), content_key)
+        blob = db.session.get(StoredBlob, content_key, with_for_update=self._lock_rows(), populate_existing=True)
+        if blob is None:
+            return False
+        if blob.ref_count > 1:
+            blob.ref_count = StoredBlob.ref_count - 1
+            return False
+        db.session.delete(blob)
+        db.session.flush()
+        # O conteúdo só é apagado do backend depois do commit, para que um rollback não deixe
+        # registos a apontar para ficheiros inexistentes
+        after_commit.defer(db.session, _PURGE_KEY, (self.backend, content_key))
+        return True
+
+    def open(self, content_key):
+        return self.backend.open(content_key)
+
+    def local_path(self, content_key):
+        return self.backend.local_path(content_key)
+
+    def download_url(self, content_key, filename):
+        return self.backend.download_url(content_key, filename)
+
+    def _lock_rows(self):
+        # SELECT ... FOR UPDATE serializa incrementos/decrementos concorrentes em PostgreSQL
+        return db.session.get_bind().dialect.name == 'postgresql'
+
+
+def release_document_content(document):
+    """Libertar o conteúdo de um Document antes de o eliminar (inclui ficheiros antigos fora do store)"""
+    if is_content_key(document.caminho_ficheiro):
+        get_document_store().release(document.caminho_ficheiro)
+    elif document.caminho_ficheiro and os.path.exists(document.caminho_ficheiro):
+        os.remove(document.caminho_ficheiro)
+
+
+_store = None
+
+
+def get_document_store():
+    """Obter o DocumentStore configurado por DOCUMENT_STORAGE_BACKEND (local ou s3)"""
+    global _store
+    if _store is None:
+        backend_name = os.getenv('DOCUMENT_STORAGE_BACKEND', 'local')
+        if backend_name not in BACKENDS:
+            raise RuntimeError(f'Backend de armazenamento desconhecido: {backend_name}')
+        _store = DocumentStore(BACKENDS[backend_name]())
+    return _store
+
+
+def require_shared_storage(purpose):
+    """Garantir que o que é gravado por purpose (num serviço) pode ser servido pelos outros"""
+    backend = get_document_store().backend
+    if not backend.shared:
+        raise StorageNotShared(
+            f"O armazenamento de documentos '{backend.name}' não é partilhado entre o web e o worker: "
+            f"{purpose} gravados pelo worker não poderiam ser descarregados. Configure "
+            f"DOCUMENT_STORAGE_BACKEND=s3 (ou DOCUMENT_STORAGE_LOCAL_SHARED=true se ambos usam o mesmo disco)."
+        )
+
+
+def _lock_content(connection, content_key):
+    """Serializar a criação e a remoção do mesmo conteúdo até ao fim da transação
+
+    Em PostgreSQL com um advisory lock da transação (não há linha para bloquear
+    quando o StoredBlob ainda não existe); em SQLite a transação no engine de
+    escrita (BEGIN IMMEDIATE) já exclui os outros escritores.
+    """
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text('SELECT pg_advisory_xact_lock(hashtext(:key))'), {'key': content_key})
+
+
+def _purge_released(items):
+    for backend, content_key in items:
+        try:
+            # Entre o commit e este ponto outro pedido pode ter voltado a referenciar o
+            # mesmo conteúdo (store_file sem reenviar o ficheiro): só apagar se continuar
+            # sem StoredBlob, com o mesmo lock de store_file
+            with db.engine.begin() as connection:
+                _lock_content(connection, content_key)
+                if connection.scalar(select(StoredBlob.content_key).where(StoredBlob.content_key == content_key)) is None:
+                    backend.delete(content_key)
+        except Exception as e:
+            print(f"Erro ao apagar o conteúdo {content_key}: {str(e)}")
+
+
+after_commit.register(_PURGE_KEY, _purge_released)
+
+
+def iter_blocks(stream, block_size=BLOCK_SIZE):
+    """Ler um stream em blocos (para respostas em streaming)"""
+    try:
+        while True:
+            block = stream.read(block_size)
+            if not block:
+                break
+            yield block
+    finally:
+        stream.close()
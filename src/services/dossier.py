@@ -0,0 +1,389 @@
+"""Dossiê em PDF de um veículo (dados, timeline, documentos e miniaturas das imagens)
+
+O modelo do documento (estilos, tabelas, secções e rótulos) é construído uma vez
+por processo em get_template() e reutilizado em todos os dossiês. Para gerar
+muitos dossiês de uma vez (ex.: todos os casos em aberto para a polícia),
+render_batch carrega os dados na base de dados em blocos e distribui a geração
+dos PDFs por um pool de processos; os processos não acedem à base de dados, só
+ao document store (para as miniaturas).
+"""
+
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import partial
+from xml.sax.saxutils import escape
+
+from reportlab import rl_config
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import cm
+from reportlab.platypus import Image, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+from werkzeug.utils import secure_filename
+
+from src.models.user import User
+from src.models.vehicle import Document, Vehicle, VehicleUpdate
+from src.services.document_storage import get_document_store, is_content_key
+
+# Processos usados na geração em lote
+DOSSIER_WORKERS = int(os.getenv('DOSSIER_WORKERS', str(os.cpu_count() or 2)))
+# Veículos carregados da base de dados de cada vez na geração em lote
+DOSSIER_BATCH_SIZE = int(os.getenv('DOSSIER_BATCH_SIZE', '100'))
+# Máximo de miniaturas por dossiê e tamanho máximo das imagens lidas para as gerar
+DOSSIER_MAX_THUMBNAILS = int(os.getenv('DOSSIER_MAX_THUMBNAILS', '12'))
+DOSSIER_MAX_IMAGE_SIZE = 20 * 1024 * 1024
+
+# Casos em aberto (os que seguem para a polícia no lote noturno)
+OPEN_STATUSES = ('em_tratamento', 'submetido')
+
+IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+THUMBNAIL_SIZE = (320, 240)  # píxeis; desenhadas a 5,5 cm de largura no máximo
+
+STATUS_LABELS = {
+    'em_tratamento': 'Em Tratamento',
+    'submetido': 'Submetido',
+    'recuperado': 'Recuperado',
+    'perdido': 'Perdido',
+}
+
+VEHICLE_FIELDS = (
+    ('Matrícula', 'matricula', 'text'),
+    ('Marca', 'marca', 'text'),
+    ('Modelo', 'modelo', 'text'),
+    ('VIN', 'vin', 'text'),
+    ('Valor', 'valor', 'money'),
+    ('Estado', 'status', 'status'),
+    ('Data de desaparecimento', 'data_desaparecimento', 'date'),
+    ('Data de submissão', 'data_submissao', 'date'),
+    ('Data de recuperação', 'data_recuperacao', 'date'),
+    ('Loja de aluguer', 'loja_aluguer', 'text'),
+    ('Queixa (NUIPC)', 'nuipc_numero', 'text'),
+    ('Pedido de GPS ativo', 'gps_ativo', 'bool'),
+    ('Observações', 'observacoes', 'text'),
+)
+CLIENT_FIELDS = (
+    ('Nome', 'cliente_nome', 'text'),
+    ('Contacto', 'cliente_contacto', 'text'),
+    ('Morada', 'cliente_morada', 'text'),
+    ('Email', 'cliente_email', 'text'),
+    ('Observações', 'cliente_observacoes', 'text'),
+)
+
+
+def _format_date(value):
+    if not value:
+        return ''
+    try:
+        return datetime.fromisoformat(value).strftime('%d/%m/%Y %H:%M')
+    except ValueError:
+        return value
+
+
+def _format_size(size):
+    if not size:
+        return ''
+    if size < 1024 * 1024:
+        return f'{size / 1024:.0f} KB'
+    return f'{size / (1024 * 1024):.1f} MB'
+
+
+_FORMATTERS = {
+    'text': lambda value: '' if value is None else str(value),
+    'money': lambda value: '' if value is None else f'{value:,.2f} €'.replace(',', ' ').replace('.', ','),
+    'status': lambda value: STATUS_LABELS.get(value, value or ''),
+    'date': _format_date,
+    'bool': lambda value: 'Sim' if value else 'Não',
+}
+
+
+class DossierTemplate:
+    """Estilos e estrutura do dossiê, construídos uma vez e partilhados por todos os PDFs"""
+
+    def __init__(self):
+        # Imagens gravadas em binário em vez de ASCII85: PDFs mais pequenos e menos tempo a codificar
+        rl_config.useA85 = 0
+        base = getSampleStyleSheet()
+        self.title = ParagraphStyle('DossierTitle', parent=base['Title'], fontSize=18, spaceAfter=4)
+        self.subtitle = ParagraphStyle('DossierSubtitle', parent=base['Normal'], fontSize=10,
+                                       textColor=colors.grey, alignment=1, spaceAfter=12)
+        self.heading = ParagraphStyle('DossierHeading', parent=base['Heading2'], fontSize=13,
+                                      spaceBefore=12, spaceAfter=6)
+        self.label = ParagraphStyle('DossierLabel', parent=base['Normal'], fontSize=9,
+                                    fontName='Helvetica-Bold', leading=11)
+        self.cell = ParagraphStyle('DossierCell', parent=base['Normal'], fontSize=9, leading=11)
+        self.caption = ParagraphStyle('DossierCaption', parent=base['Normal'], fontSize=7,
+                                      leading=9, alignment=1, textColor=colors.grey)
+        self.empty = ParagraphStyle('DossierEmpty', parent=base['Italic'], fontSize=9, textColor=colors.grey)
+
+        # Secções de campos: (título, [(rótulo, chave, formatador)])
+        self.sections = tuple(
+            (title, tuple((label, key, _FORMATTERS[kind]) for label, key, kind in fields))
+            for title, fields in (('Veículo', VEHICLE_FIELDS), ('Cliente', CLIENT_FIELDS))
+        )
+        self.field_widths = (5 * cm, 12 * cm)
+        self.field_style = TableStyle([
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('LINEBELOW', (0, 0), (-1, -1), 0.25, colors.lightgrey),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
+        ])
+        self.list_style = TableStyle([
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#e5e7eb')),
+            ('LINEBELOW', (0, 0), (-1, -1), 0.25, colors.lightgrey),
+            ('ROWBACKGROUNDS', (0, 1), (-1, -1), (colors.white, colors.HexColor('#f9fafb'))),
+        ])
+        self.timeline_widths = (3 * cm, 2.5 * cm, 8.5 * cm, 3 * cm)
+        self.documents_widths = (7 * cm, 3 * cm, 3 * cm, 2 * cm, 2 * cm)
+        self.thumbnail_width = 5.5 * cm
+        self.thumbnail_columns = 3
+        self.thumbnail_style = TableStyle([
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ])
+
+    def paragraph(self, text, style=None):
+        text = escape('' if text is None else str(text)).replace('\n', '<br/>')
+        return Paragraph(text, style or self.cell)
+
+    def render(self, data, output):
+        """Escrever o dossiê de um veículo (dados de dossier_data) em output (caminho ou ficheiro)"""
+        vehicle = data['vehicle']
+        document = SimpleDocTemplate(
+            output, pagesize=A4,
+            leftMargin=2 * cm, rightMargin=2 * cm, topMargin=2 * cm, bottomMargin=2 * cm,
+            title=f"Dossiê {vehicle['matricula']}", author='REC'
+        )
+        on_page = partial(self._decorate_page, vehicle['matricula'], _format_date(data['generated_at']))
+        document.build(self._story(data), onFirstPage=on_page, onLaterPages=on_page)
+
+    def _story(self, data):
+        vehicle = data['vehicle']
+        story = [
+            self.paragraph(f"Dossiê do veículo {vehicle['matricula']}", self.title),
+            self.paragraph(
+                f"Gerado em {_format_date(data['generated_at'])}"
+                + (f" por {data['generated_by']}" if data.get('generated_by') else ''),
+                self.subtitle
+            ),
+        ]
+
+        for title, fields in self.sections:
+            story.append(self.paragraph(title, self.heading))
+            rows = [
+                [self.paragraph(label, self.label), self.paragraph(formatter(vehicle.get(key)))]
+                for label, key, formatter in fields
+            ]
+            story.append(Table(rows, colWidths=self.field_widths, style=self.field_style))
+
+        story.append(self.paragraph(f"Timeline ({len(data['timeline'])})", self.heading))
+        if data['timeline']:
+            rows = [[self.paragraph(h, self.label) for h in ('Data', 'Tipo', 'Descrição', 'Localização')]]
+            for update in data['timeline']:
+                description = update['descricao']
+                if update.get('autor'):
+                    description = f"{description}\n— {update['autor']}"
+                rows.append([
+                    self.paragraph(_format_date(update['data_atualizacao'])),
+                    self.paragraph(update['tipo']),
+                    self.paragraph(description),
+                    self.paragraph(update.get('localizacao')),
+                ])
+            story.append(Table(rows, colWidths=self.timeline_widths, style=self.list_style, repeatRows=1))
+        else:
+            story.append(self.paragraph('Sem atualizações registadas.', self.empty))
+
+        story.append(self.paragraph(f"Documentos ({len(data['documents'])})", self.heading))
+        if data['documents']:
+            rows = [[self.paragraph(h, self.label) for h in ('Ficheiro', 'Tipo', 'Data', 'Tamanho', 'Origem')]]
+            for doc in data['documents']:
+                rows.append([
+                    self.paragraph(doc['nome_original']),
+                    self.paragraph(doc['tipo_documento']),
+                    self.paragraph(_format_date(doc['data_upload'])),
+                    self.paragraph(_format_size(doc.get('tamanho_ficheiro'))),
+                    self.paragraph('Email' if doc.get('origem') == 'email_automatico' else 'Manual'),
+                ])
+            story.append(Table(rows, colWidths=self.documents_widths, style=self.list_style, repeatRows=1))
+        else:
+            story.append(self.paragraph('Sem documentos.', self.empty))
+
+        thumbnails = self._thumbnails(data['documents'])
+        if thumbnails:
+            story.append(self.paragraph('Imagens', self.heading))
+            cells = [[image, self.paragraph(name, self.caption)] for image, name in thumbnails]
+            rows = [
+                cells[index:index + self.thumbnail_columns]
+                for index in range(0, len(cells), self.thumbnail_columns)
+            ]
+            rows[-1] += [''] * (self.thumbnail_columns - len(rows[-1]))
+            width = 17 * cm / self.thumbnail_columns
+            story.append(Spacer(1, 4))
+            story.append(Table(rows, colWidths=[width] * self.thumbnail_columns, style=self.thumbnail_style))
+        return story
+
+    def _thumbnails(self, documents):
+        images = []
+        for doc in documents:
+            if len(images) >= DOSSIER_MAX_THUMBNAILS:
+                break
+            extension = doc['nome_original'].rsplit('.', 1)[-1].lower() if '.' in doc['nome_original'] else ''
+            if extension not in IMAGE_EXTENSIONS:
+                continue
+            if (doc.get('tamanho_ficheiro') or 0) > DOSSIER_MAX_IMAGE_SIZE:
+                continue
+            try:
+                buffer, width, height = make_thumbnail(doc['caminho_ficheiro'])
+            except Exception as e:
+                # Uma imagem ilegível ou em falta não impede o dossiê
+                print(f"Erro ao gerar a miniatura de {doc['nome_original']}: {str(e)}")
+                continue
+            scale = self.thumbnail_width / max(width, height * 4 / 3)
+            images.append((Image(buffer, width=width * scale, height=height * scale), doc['nome_original']))
+        return images
+
+    @staticmethod
+    def _decorate_page(matricula, generated_at, canvas, document):
+        canvas.saveState()
+        canvas.setFont('Helvetica', 8)
+        canvas.setFillColor(colors.grey)
+        canvas.drawString(2 * cm, 1.2 * cm, f'REC - Dossiê {matricula} - {generated_at}')
+        canvas.drawRightString(A4[0] - 2 * cm, 1.2 * cm, f'Página {document.page}')
+        canvas.restoreState()
+
+
+def make_thumbnail(path):
+    """Miniatura JPEG de uma imagem guardada (content key ou caminho antigo): (buffer, largura, altura)"""
+    from PIL import Image as PILImage
+
+    if is_content_key(path):
+        store = get_document_store()
+        local = store.local_path(path)
+        if local is None:
+            # Backend remoto: o PIL precisa de um ficheiro posicionável
+            with store.open(path) as stream:
+                source = io.BytesIO(stream.read(DOSSIER_MAX_IMAGE_SIZE + 1))
+        else:
+            source = local
+    else:
+        source = path
+
+    with PILImage.open(source) as image:
+        # Em JPEG, descodificar já numa escala reduzida (muito mais rápido que reduzir depois)
+        image.draft('RGB', THUMBNAIL_SIZE)
+        image.thumbnail(THUMBNAIL_SIZE)
+        image = image.convert('RGB')
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=80)
+    buffer.seek(0)
+    return buffer, image.width, image.height
+
+
+_template = None
+
+
+def get_template():
+    """Obter o modelo do dossiê deste processo (construído na primeira utilização)"""
+    global _template
+    if _template is None:
+        _template = DossierTemplate()
+    return _template
+
+
+def dossier_data(vehicle_ids, generated_by=None):
+    """Carregar os dados dos dossiês de vários veículos com uma consulta por tabela
+
+    Devolve uma lista de dicionários (serializáveis, para enviar aos processos)
+    pela ordem de vehicle_ids; veículos inexistentes são ignorados.
+    """
+    vehicle_ids = list(vehicle_ids)
+    if not vehicle_ids:
+        return []
+
+    vehicles = {vehicle.id: vehicle for vehicle in Vehicle.query.filter(Vehicle.id.in_(vehicle_ids))}
+    generated_at = datetime.utcnow().isoformat()
+    dossiers = {
+        vehicle_id: {
+            'vehicle': vehicle.to_dict(),
+            'timeline': [],
+            'documents': [],
+            'generated_at': generated_at,
+            'generated_by': generated_by,
+        }
+        for vehicle_id, vehicle in vehicles.items()
+    }
+
+    updates = VehicleUpdate.query.filter(VehicleUpdate.vehicle_id.in_(dossiers)) \
+        .order_by(VehicleUpdate.vehicle_id, VehicleUpdate.data_atualizacao.asc(), VehicleUpdate.id).all()
+    author_ids = {update.created_by for update in updates if update.created_by}
+    authors = dict(User.query.with_entities(User.id, User.username).filter(User.id.in_(author_ids))) \
+        if author_ids else {}
+    for update in updates:
+        item = update.to_dict()
+        item['autor'] = authors.get(update.created_by)
+        dossiers[update.vehicle_id]['timeline'].append(item)
+
+    documents = Document.query.filter(Document.vehicle_id.in_(dossiers)) \
+        .order_by(Document.vehicle_id, Document.data_upload.asc(), Document.id).all()
+    for doc in documents:
+        dossiers[doc.vehicle_id]['documents'].append(doc.to_dict())
+
+    return [dossiers[vehicle_id] for vehicle_id in vehicle_ids if vehicle_id in dossiers]
+
+
+def render_dossier(data, output):
+    """Gerar o PDF de um dossiê para um caminho ou ficheiro aberto em modo binário"""
+    get_template().render(data, output)
+
+
+def dossier_filename(vehicle):
+    return f"dossie_{secure_filename(vehicle['matricula']) or vehicle['id']}.pdf"
+
+
+def _init_worker():
+    # Construir o modelo logo no arranque do processo, antes do primeiro dossiê
+    get_template()
+
+
+def _render_to_file(data, output_dir):
+    vehicle = data['vehicle']
+    path = os.path.join(output_dir, dossier_filename(vehicle))
+    partial_path = f'{path}.part'
+    result = {'vehicle_id': vehicle['id'], 'matricula': vehicle['matricula'], 'path': path}
+    try:
+        render_dossier(data, partial_path)
+        os.replace(partial_path, path)
+        result['size'] = os.path.getsize(path)
+    except Exception as e:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        result['error'] = str(e)[:500]
+    return result
+
+
+def render_batch(vehicle_ids, output_dir, workers=None, batch_size=None, generated_by=None):
+    """Gerar os dossiês de vários veículos em output_dir, em paralelo (tem de correr num app context)
+
+    Enquanto os processos geram os PDFs de um bloco, o bloco seguinte é lido da
+    base de dados. Cada ficheiro é escrito com um nome temporário e só depois
+    renomeado, pelo que não ficam PDFs incompletos no diretório. Devolve um
+    resultado por veículo: vehicle_id, matricula, path e size, ou error.
+    """
+    vehicle_ids = list(vehicle_ids)
+    batch_size = batch_size or DOSSIER_BATCH_SIZE
+    os.makedirs(output_dir, exist_ok=True)
+
+    results = []
+    # spawn: os processos não herdam as ligações à base de dados nem a clientes do document store
+    with ProcessPoolExecutor(max_workers=workers or DOSSIER_WORKERS, initializer=_init_worker,
+                             mp_context=multiprocessing.get_context('spawn')) as pool:
+        pending = []
+        for start in range(0, len(vehicle_ids), batch_size):
+            batch = dossier_data(vehicle_ids[start:start + batch_size], generated_by=generated_by)
+            submitted = [pool.submit(_render_to_file, data, output_dir) for data in batch]
+            results.extend(future.result() for future in pending)
+            pending = submitted
+        results.extend(future.result() for future in pending)
+    return results
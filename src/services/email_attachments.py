@@ -0,0 +1,122 @@
+"""Descarga dos anexos dos emails para o document store
+
+Cada anexo é lido do servidor IMAP em blocos (BODY.PEEK[parte]<início.tamanho>),
+descodificado à medida que chega e gravado num ficheiro temporário enquanto se
+calcula o SHA-256, pelo que um anexo de 20MB nunca está inteiro em memória. Os
+anexos são descarregados em paralelo por várias threads, cada uma com a sua
+ligação IMAP (uma ligação imaplib não pode ser partilhada entre threads).
+"""
+
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.utils import secure_filename
+
+from src.services.chunked_upload import MAX_UPLOAD_SIZE
+from src.services.document_storage import allowed_file, get_document_store
+
+# Número de anexos descarregados ao mesmo tempo (e de ligações IMAP abertas para isso)
+ATTACHMENT_WORKERS = int(os.getenv('EMAIL_ATTACHMENT_WORKERS', '4'))
+# Bytes (codificados) pedidos ao servidor em cada FETCH parcial
+ATTACHMENT_CHUNK_SIZE = int(os.getenv('EMAIL_ATTACHMENT_CHUNK_SIZE', str(1024 * 1024)))
+
+
+def attachment_filename(part):
+    """Nome seguro do anexo, ou None se o tipo de ficheiro não for aceite"""
+    filename = secure_filename(part.get('filename') or '')
+    if not filename or not allowed_file(filename):
+        return None
+    return filename
+
+
+class AttachmentPipeline:
+    """Descarregar anexos em paralelo para o document store
+
+    connection_factory devolve um EmailService novo (ainda sem ligação); cada
+    thread cria o seu na primeira utilização e reutiliza-o nos anexos seguintes.
+    As threads só escrevem ficheiros e enviam o conteúdo para o backend; as
+    referências (StoredBlob) são criadas depois, na sessão de quem chamou.
+    """
+
+    def __init__(self, connection_factory, store=None, workers=None, chunk_size=None):
+        self.connection_factory = connection_factory
+        self.store = store or get_document_store()
+        self.workers = workers or ATTACHMENT_WORKERS
+        self.chunk_size = chunk_size or ATTACHMENT_CHUNK_SIZE
+
+    def download(self, attachments):
+        """Descarregar uma lista de anexos {uid, folder, part, encoding, filename, content_type, size}
+
+        Devolve, pela mesma ordem, um dicionário por anexo com filename, content_type,
+        size, checksum e content_key, ou com error se não foi possível descarregá-lo.
+        O conteúdo já está no backend, mas ainda sem referência: cada resultado sem
+        erro tem de ser registado com store.store_file(None, checksum, size).
+        """
+        if not attachments:
+            return []
+
+        local = threading.local()
+        connections = []
+        lock = threading.Lock()
+
+        def connection(folder):
+            service = getattr(local, 'service', None)
+            if service is None:
+                service = self.connection_factory()
+                if not service.connect():
+                    raise ConnectionError('Não foi possível ligar ao servidor IMAP')
+                local.service = service
+                local.folder = None
+                with lock:
+                    connections.append(service)
+            if local.folder != folder:
+                service.select_folder(folder)
+                local.folder = folder
+            return service
+
+        def run(attachment):
+            try:
+                return self._download_one(connection(attachment['folder']), attachment)
+            except Exception as e:
+                # Uma ligação que falhou a meio não é reutilizada
+                local.service = None
+                print(f"Erro ao descarregar o anexo {attachment.get('filename')} "
+                      f"(UID {attachment.get('uid')}): {str(e)}")
+                return self._result(attachment, error=str(e)[:500])
+
+        try:
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(attachments))) as pool:
+                return list(pool.map(run, attachments))
+        finally:
+            for service in connections:
+                service.disconnect()
+
+    def _download_one(self, service, attachment):
+        if attachment.get('size') and attachment['size'] > MAX_UPLOAD_SIZE * 4 // 3 + 4096:
+            return self._result(attachment, error='Anexo demasiado grande')
+
+        path = self.store.staging_file()
+        hasher = hashlib.sha256()
+        try:
+            with open(path, 'wb') as destination:
+                size = service.stream_part(
+                    attachment['uid'], attachment['part'], attachment['encoding'],
+                    destination, hasher, chunk_size=self.chunk_size
+                )
+            checksum = hasher.hexdigest()
+            content_key = self.store.upload_staged(path, checksum)
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+        return self._result(attachment, size=size, checksum=checksum, content_key=content_key)
+
+    @staticmethod
+    def _result(attachment, **values):
+        result = {
+            'filename': attachment['filename'],
+            'content_type': attachment.get('content_type'),
+        }
+        result.update(values)
+        return result
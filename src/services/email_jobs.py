@@ -0,0 +1,48 @@
+"""Tarefas em segundo plano da receção de emails (executadas por job_worker.py)"""
+
+from src.models.rent_a_car import EmailTrigger
+from src.services.email_service import EmailService
+from src.services.job_queue import job_handler, report_progress
+
+CHECK_NEW = 'email.check_new'
+AUTO_PROCESS = 'email.auto_process'
+
+
+def _auto_process(job, service, batch_size=None, start=0):
+    total = EmailTrigger.query.filter_by(processed=False).count()
+    done = [0]
+
+    def on_batch(results):
+        done[0] += len(results)
+        report_progress(job, start + (99 - start) * done[0] / max(total, done[0], 1),
+                        f'{done[0]} de {total} emails convertidos em veículos')
+
+    details = service.create_vehicles_from_emails(batch_size=batch_size, on_batch=on_batch)
+    success = sum(1 for result in details if result['success'])
+    return {'success': success, 'failed': len(details) - success, 'details': details}
+
+
+@job_handler(CHECK_NEW)
+def check_new_emails(job, payload):
+    """Sincronizar a caixa de email e, opcionalmente, criar os veículos dos emails novos"""
+    service = EmailService.from_env()
+    try:
+        report_progress(job, 5, 'A sincronizar a caixa de email')
+        processed_count = service.process_emails(
+            folder=payload.get('folder', 'INBOX'),
+            incremental=payload.get('incremental', True)
+        )
+        result = {'processed_count': processed_count}
+        report_progress(job, 50, f'{processed_count} emails processados')
+
+        if payload.get('auto_process') and processed_count > 0:
+            result['auto_process'] = _auto_process(job, service, payload.get('batch_size'), start=50)
+        return result
+    finally:
+        service.disconnect()
+
+
+@job_handler(AUTO_PROCESS)
+def auto_process_emails(job, payload):
+    """Converter em veículos todos os EmailTriggers ainda não processados"""
+    return _auto_process(job, EmailService.from_env(), payload.get('batch_size'))
@@ -1,25 +1,77 @@
+import hashlib
 import imaplib
 import email
+import os
 import re
 import json
+import select
+import threading
+import time
+import uuid
 from datetime import datetime
 from email.header import decode_header
 from src.models.rent_a_car import EmailTrigger
-from src.models.vehicle import Vehicle
+from src.models.mailbox_checkpoint import MailboxCheckpoint
+from src.models.vehicle import Vehicle, Document
 from src.models.user import db
+from src.services.imap_protocol import (
+    StreamDecoder, chunked, compress_uids, decode_part, fetch_item, find_attachments, find_body_part,
+    parse_fetch_response
+)
+from src.services.email_attachments import ATTACHMENT_CHUNK_SIZE, AttachmentPipeline, attachment_filename
+from src.services.document_storage import ContentMissing, get_document_store
+from src.services.extraction import extraction_engine, html_to_text
+from sqlalchemy.dialects import postgresql, sqlite
+
+# Número de mensagens pedidas por cada UID FETCH
+FETCH_BATCH_SIZE = int(os.getenv('EMAIL_FETCH_BATCH_SIZE', '200'))
+HEADER_FIELDS = 'SUBJECT FROM DATE MESSAGE-ID'
+# Número de chaves por cada consulta IN / INSERT ao gravar EmailTriggers
+TRIGGER_BATCH_SIZE = 500
+# Número de EmailTriggers convertidos em veículos por cada commit
+EMAIL_PROCESS_BATCH_SIZE = int(os.getenv('EMAIL_PROCESS_BATCH_SIZE', '100'))
+MESSAGE_ID_MAX_LENGTH = 255
+
+# O RFC 2177 pede que o IDLE seja renovado antes de 30 minutos de inatividade
+IDLE_TIMEOUT = int(os.getenv('EMAIL_IDLE_TIMEOUT', str(29 * 60)))
+# Intervalo de verificação quando o servidor não suporta IDLE
+POLL_INTERVAL = int(os.getenv('EMAIL_POLL_INTERVAL', '60'))
+MAX_RECONNECT_DELAY = 300
+
+_CHANGE_RE = re.compile(rb'^\* \d+ (EXISTS|RECENT)\b', re.IGNORECASE)
 
 class EmailService:
-    def __init__(self, email_address, password, imap_server='imap.gmail.com', imap_port=993):
+    def __init__(self, email_address, password, imap_server='imap.gmail.com', imap_port=993, use_ssl=True):
         self.email_address = email_address
         self.password = password
         self.imap_server = imap_server
         self.imap_port = imap_port
+        self.use_ssl = use_ssl  # False apenas para servidores IMAP locais de teste
         self.mail = None
+        self.folder = None
+        self._idle_buffer = b''
+        self._attachment_pipeline = None
+    
+    @classmethod
+    def from_env(cls):
+        """Criar o serviço com a configuração das variáveis EMAIL_* (ver setup_email_config.py)"""
+        return cls(
+            email_address=os.environ.get('EMAIL_ADDRESS', 'seu_email@gmail.com'),
+            password=os.environ.get('EMAIL_PASSWORD', 'sua_senha'),
+            imap_server=os.environ.get('EMAIL_IMAP_SERVER', 'imap.gmail.com'),
+            imap_port=int(os.environ.get('EMAIL_IMAP_PORT', '993')),
+            use_ssl=os.environ.get('EMAIL_IMAP_SSL', 'true').lower() != 'false'
+        )
+    
+    def clone(self):
+        """Novo serviço com as mesmas credenciais (para ligações paralelas)"""
+        return EmailService(self.email_address, self.password, self.imap_server, self.imap_port, self.use_ssl)
     
     def connect(self):
         """Conectar ao servidor IMAP"""
         try:
-            self.mail = imaplib.IMAP4_SSL(self.imap_server, self.imap_port)
+            imap_class = imaplib.IMAP4_SSL if self.use_ssl else imaplib.IMAP4
+            self.mail = imap_class(self.imap_server, self.imap_port)
             self.mail.login(self.email_address, self.password)
             return True
         except Exception as e:
@@ -33,58 +85,306 @@ class EmailService:
                 self.mail.logout()
             except:
                 pass
+            self.mail = None
+            self.folder = None
     
-    def fetch_unread_emails(self, folder="INBOX"):
-        """Buscar emails não lidos da caixa de entrada"""
+    def fetch_unread_emails(self, folder="INBOX", mark_seen=True):
+        """Buscar emails não lidos da caixa de entrada
+
+        As mensagens são pedidas em lotes de UIDs: primeiro os cabeçalhos e o
+        BODYSTRUCTURE, depois apenas a parte text/plain de cada uma com BODY.PEEK
+        (sem descarregar anexos). As mensagens são marcadas como lidas num único
+        STORE no fim, ou mais tarde com mark_seen() se mark_seen=False.
+        """
         if not self.mail:
             if not self.connect():
                 return []
         
         try:
-            self.mail.select(folder)
-            status, messages = self.mail.search(None, '(UNSEEN)')
-            email_ids = messages[0].split()
+            self.select_folder(folder)
+            status, data = self.mail.uid('SEARCH', None, 'UNSEEN')
+            uids = [int(uid) for uid in data[0].split()] if data and data[0] else []
             
-            emails = []
-            for e_id in email_ids:
-                status, data = self.mail.fetch(e_id, '(RFC822)')
-                raw_email = data[0][1]
-                msg = email.message_from_bytes(raw_email)
-                
-                # Processar o email
-                subject = self.decode_email_header(msg['Subject'])
-                from_addr = self.decode_email_header(msg['From'])
-                date_str = self.decode_email_header(msg['Date'])
-                
-                # Extrair o corpo do email
-                body = ""
-                if msg.is_multipart():
-                    for part in msg.walk():
-                        content_type = part.get_content_type()
-                        content_disposition = str(part.get("Content-Disposition"))
-                        
-                        if content_type == "text/plain" and "attachment" not in content_disposition:
-                            body = part.get_payload(decode=True).decode()
-                            break
-                else:
-                    body = msg.get_payload(decode=True).decode()
-                
-                emails.append({
-                    'id': e_id,
-                    'subject': subject,
-                    'from': from_addr,
-                    'date': date_str,
-                    'body': body
-                })
-                
-                # Marcar como lido
-                self.mail.store(e_id, '+FLAGS', '\\Seen')
+            emails = self.fetch_messages(uids)
+            
+            if mark_seen:
+                self.mark_seen([email_data['id'] for email_data in emails])
             
             return emails
         except Exception as e:
             print(f"Erro ao buscar emails: {str(e)}")
             return []
     
+    def select_folder(self, folder="INBOX"):
+        """Selecionar uma pasta e devolver (UIDVALIDITY, UIDNEXT) anunciados pelo servidor"""
+        status, data = self.mail.select(folder)
+        if status != 'OK':
+            raise imaplib.IMAP4.error(f"Não foi possível selecionar a pasta {folder}: {data}")
+        self.folder = folder
+        return self._response_int('UIDVALIDITY'), self._response_int('UIDNEXT')
+    
+    def _response_int(self, name):
+        status, data = self.mail.response(name)
+        try:
+            return int(data[-1]) if data and data[-1] is not None else None
+        except (TypeError, ValueError):
+            return None
+    
+    def get_checkpoint(self, folder="INBOX"):
+        """Obter (ou criar na sessão) o ponto de sincronização desta conta e pasta"""
+        checkpoint = MailboxCheckpoint.query.filter_by(account=self.email_address, mailbox=folder).first()
+        if checkpoint is None:
+            checkpoint = MailboxCheckpoint(account=self.email_address, mailbox=folder, last_uid=0)
+            db.session.add(checkpoint)
+        return checkpoint
+    
+    def fetch_new_emails(self, checkpoint, folder="INBOX"):
+        """Buscar apenas as mensagens que chegaram desde o último ponto de sincronização
+        
+        Devolve (emails, estado), em que estado tem o uidvalidity, last_uid e uidnext a
+        gravar no checkpoint depois de os emails estarem guardados. Se o UIDVALIDITY
+        mudou (ou na primeira sincronização) os UIDs antigos deixam de ser válidos e
+        são processados os emails não lidos, como na verificação completa.
+        """
+        if not self.mail:
+            if not self.connect():
+                return [], None
+        
+        uidvalidity, uidnext = self.select_folder(folder)
+        last_uid = checkpoint.last_uid or 0
+        
+        if checkpoint.uidvalidity is None or checkpoint.uidvalidity != uidvalidity:
+            status, data = self.mail.uid('SEARCH', None, 'UNSEEN')
+            uids = [int(uid) for uid in data[0].split()] if data and data[0] else []
+            highest = uidnext - 1 if uidnext else self._highest_uid()
+            last_uid = 0
+        elif uidnext is not None and uidnext <= last_uid + 1:
+            # Nada de novo desde a última sincronização: nem é preciso fazer SEARCH
+            uids = []
+            highest = last_uid
+        else:
+            status, data = self.mail.uid('SEARCH', None, 'UID', f'{last_uid + 1}:*')
+            # "n:*" devolve sempre a última mensagem, mesmo que o UID dela seja menor que n
+            uids = [int(uid) for uid in data[0].split() if int(uid) > last_uid] if data and data[0] else []
+            highest = uidnext - 1 if uidnext else last_uid
+        
+        emails = self.fetch_messages(uids)
+        state = {
+            'uidvalidity': uidvalidity,
+            'last_uid': max([last_uid, highest or 0] + uids),
+            'uidnext': uidnext
+        }
+        return emails, state
+    
+    def _highest_uid(self):
+        status, data = self.mail.uid('SEARCH', None, 'UID', '*')
+        uids = [int(uid) for uid in data[0].split()] if data and data[0] else []
+        return max(uids) if uids else 0
+    
+    def fetch_messages(self, uids):
+        """Obter cabeçalhos e corpo de texto de uma lista de UIDs da pasta selecionada
+        
+        Os anexos não são descarregados aqui: cada email traz em attachments as
+        partes (do BODYSTRUCTURE) a descarregar depois com stream_part.
+        """
+        emails = []
+        for batch in chunked(sorted(uids), FETCH_BATCH_SIZE):
+            status, data = self.mail.uid(
+                'FETCH', compress_uids(batch),
+                f'(UID BODYSTRUCTURE BODY.PEEK[HEADER.FIELDS ({HEADER_FIELDS})])'
+            )
+            
+            batch_emails = {}
+            text_parts = {}
+            for message in parse_fetch_response(data):
+                if b'UID' not in message:
+                    continue
+                uid = int(message[b'UID'])
+                headers = email.message_from_bytes(fetch_item(message, b'BODY[HEADER') or b'')
+                batch_emails[uid] = {
+                    'id': uid,
+                    'message_id': (headers.get('Message-ID') or '').strip() or None,
+                    'subject': self.decode_email_header(headers['Subject']),
+                    'from': self.decode_email_header(headers['From']),
+                    'date': self.decode_email_header(headers['Date']),
+                    'body': '',
+                    'folder': self.folder,
+                    'attachments': []
+                }
+                
+                # Emails só com HTML: usar a parte text/html, convertida em texto depois
+                structure = message.get(b'BODYSTRUCTURE')
+                part = find_body_part(structure) or find_body_part(structure, 'text/html')
+                batch_emails[uid]['attachments'] = find_attachments(structure, part)
+                if part:
+                    text_parts.setdefault(part['part'], {})[uid] = part
+            
+            # Um FETCH por especificação de parte (normalmente só "1" e "1.1") para todo o lote
+            for spec, parts in text_parts.items():
+                status, data = self.mail.uid('FETCH', compress_uids(parts), f'(UID BODY.PEEK[{spec}])')
+                item = f'BODY[{spec}]'.encode()
+                for message in parse_fetch_response(data):
+                    if b'UID' not in message or int(message[b'UID']) not in parts:
+                        continue
+                    uid = int(message[b'UID'])
+                    part = parts[uid]
+                    body = decode_part(fetch_item(message, item), part['encoding'], part['charset'])
+                    if part['content_type'] == 'text/html':
+                        body = html_to_text(body)
+                    batch_emails[uid]['body'] = body
+            
+            emails.extend(batch_emails[uid] for uid in sorted(batch_emails))
+        
+        return emails
+    
+    def stream_part(self, uid, part, encoding, destination, hasher=None, chunk_size=ATTACHMENT_CHUNK_SIZE):
+        """Copiar uma parte de uma mensagem para destination, em blocos e já descodificada
+        
+        Cada bloco é pedido com um FETCH parcial BODY.PEEK[parte]<início.tamanho>, pelo
+        que só um bloco de cada vez está em memória. Devolve o tamanho descodificado.
+        """
+        decoder = StreamDecoder(encoding)
+        item = f'BODY[{part}]'.encode()
+        offset = 0
+        size = 0
+        
+        def write(data):
+            nonlocal size
+            if data:
+                destination.write(data)
+                if hasher is not None:
+                    hasher.update(data)
+                size += len(data)
+        
+        while True:
+            status, data = self.mail.uid('FETCH', str(uid), f'(BODY.PEEK[{part}]<{offset}.{chunk_size}>)')
+            if status != 'OK':
+                raise imaplib.IMAP4.error(f"Erro ao obter a parte {part} do UID {uid}: {data}")
+            messages = [message for message in parse_fetch_response(data) if b'UID' in message]
+            if not messages:
+                raise imaplib.IMAP4.error(f"A mensagem com UID {uid} já não existe")
+            chunk = fetch_item(messages[0], item) or b''
+            write(decoder.decode(chunk))
+            offset += len(chunk)
+            if len(chunk) < chunk_size:
+                break
+        write(decoder.flush())
+        return size
+    
+    def attachment_pipeline(self):
+        if self._attachment_pipeline is None:
+            self._attachment_pipeline = AttachmentPipeline(self.clone)
+        return self._attachment_pipeline
+    
+    def mark_seen(self, uids):
+        """Marcar mensagens como lidas num único STORE"""
+        if not uids:
+            return
+        self.mail.uid('STORE', compress_uids(uids), '+FLAGS.SILENT', '(\\Seen)')
+    
+    def supports_idle(self):
+        # As capacidades anunciadas antes do login podem não incluir IDLE (ex.: Gmail)
+        if 'IDLE' in self.mail.capabilities:
+            return True
+        status, data = self.mail.capability()
+        return status == 'OK' and any(b'IDLE' in line.upper().split() for line in data if line)
+    
+    def idle(self, timeout=IDLE_TIMEOUT, stop_event=None):
+        """Esperar por mensagens novas na pasta selecionada com IMAP IDLE (RFC 2177)
+        
+        Devolve True assim que o servidor anuncia EXISTS/RECENT, ou False se o
+        timeout expirar (ou stop_event for ativado) sem alterações.
+        """
+        tag = self.mail._new_tag()
+        self._idle_buffer = b''
+        self.mail.send(tag + b' IDLE\r\n')
+        
+        line = self._read_idle_line(time.monotonic() + 30)
+        if line is None or not line.startswith(b'+'):
+            raise imaplib.IMAP4.abort(f"O servidor recusou o IDLE: {line!r}")
+        
+        changed = False
+        deadline = time.monotonic() + timeout
+        try:
+            while not changed and time.monotonic() < deadline:
+                if stop_event is not None and stop_event.is_set():
+                    break
+                # Esperar em fatias curtas para reagir ao stop_event
+                line = self._read_idle_line(min(deadline, time.monotonic() + 5))
+                if line is not None and _CHANGE_RE.match(line):
+                    changed = True
+        finally:
+            self.mail.send(b'DONE\r\n')
+            while True:
+                line = self._read_idle_line(time.monotonic() + 30)
+                if line is None:
+                    raise imaplib.IMAP4.abort("Sem resposta do servidor ao terminar o IDLE")
+                if line.startswith(tag):
+                    break
+                if _CHANGE_RE.match(line):
+                    changed = True
+        return changed
+    
+    def _read_idle_line(self, deadline):
+        """Ler uma linha do socket durante o IDLE; None se o prazo expirar
+        
+        Lê diretamente do socket com select(): o ficheiro do imaplib não pode ser
+        usado com timeouts sem ficar inutilizável.
+        """
+        sock = self.mail.socket()
+        while b'\n' not in self._idle_buffer:
+            # Em SSL pode haver bytes já decifrados que o select() não vê
+            pending = sock.pending() if hasattr(sock, 'pending') else 0
+            if not pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                readable, _, _ = select.select([sock], [], [], remaining)
+                if not readable:
+                    return None
+            data = sock.recv(65536)
+            if not data:
+                raise imaplib.IMAP4.abort("Ligação IMAP fechada durante o IDLE")
+            self._idle_buffer += data
+        line, _, self._idle_buffer = self._idle_buffer.partition(b'\n')
+        return line + b'\n'
+    
+    def listen(self, on_change, folder="INBOX", idle_timeout=IDLE_TIMEOUT, poll_interval=POLL_INTERVAL,
+               stop_event=None):
+        """Ficar à escuta da pasta e chamar on_change(service, folder) quando chegam mensagens
+        
+        Usa IMAP IDLE quando o servidor o suporta e, caso contrário, verifica a cada
+        poll_interval segundos. on_change é também chamado a cada (re)ligação, para
+        apanhar o que chegou entretanto. Erros de ligação levam a nova tentativa
+        com espera crescente.
+        """
+        stop_event = stop_event or threading.Event()
+        delay = 1
+        while not stop_event.is_set():
+            try:
+                if not self.mail and not self.connect():
+                    raise imaplib.IMAP4.abort("Não foi possível ligar ao servidor IMAP")
+                self.select_folder(folder)
+                on_change(self, folder)
+                delay = 1
+                
+                while not stop_event.is_set():
+                    if self.supports_idle():
+                        changed = self.idle(idle_timeout, stop_event)
+                    else:
+                        changed = not stop_event.wait(poll_interval)
+                    if changed:
+                        on_change(self, folder)
+                    elif not stop_event.is_set():
+                        # Manter a ligação ativa entre ciclos de IDLE
+                        self.mail.noop()
+            except (imaplib.IMAP4.error, OSError) as e:
+                print(f"Erro na ligação IMAP, a tentar novamente em {delay}s: {str(e)}")
+                self.disconnect()
+                stop_event.wait(delay)
+                delay = min(delay * 2, MAX_RECONNECT_DELAY)
+        self.disconnect()
+    
     def decode_email_header(self, header):
         """Decodificar cabeçalhos de email"""
         if header is None:
@@ -102,124 +402,358 @@ class EmailService:
         
         return " ".join(header_parts)
     
-    def extract_vehicle_data(self, email_body):
-        """Extrair dados do veículo do corpo do email"""
-        data = {}
-        
-        # Padrões de expressão regular para extrair informações
-        patterns = {
-            'matricula': r'Matrícula[:\s]+(\w+-\w+-\w+|\w+\s\w+\s\w+|\w+\-\w+\-\w+)',
-            'marca': r'Marca[:\s]+(\w+)',
-            'modelo': r'Modelo[:\s]+([\w\s]+)',
-            'vin': r'VIN[:\s]+(\w+)',
-            'data_desaparecimento': r'Data[\s\w]*desaparecimento[:\s]+(\d{2}[/\-]\d{2}[/\-]\d{4})',
-            'cliente_nome': r'Nome[\s\w]*cliente[:\s]+([\w\s]+)',
-            'cliente_contacto': r'Contacto[:\s]+(\+?\d+|\d+[\s\-]\d+)',
-            'loja_aluguer': r'Loja[:\s]+([\w\s]+)'
-        }
+    def extract_vehicle_data(self, email_body, sender=None):
+        """Extrair dados do veículo do corpo do email (com o modelo da rent-a-car do remetente, se existir)"""
+        return extraction_engine.extract(email_body, sender).data
+    
+    def process_emails(self, folder="INBOX", incremental=True):
+        """Processar emails novos e criar registros no banco de dados
         
-        for key, pattern in patterns.items():
-            match = re.search(pattern, email_body, re.IGNORECASE)
-            if match:
-                data[key] = match.group(1).strip()
+        Com incremental=True só são pedidas ao servidor as mensagens posteriores ao
+        checkpoint da pasta; com incremental=False são lidos todos os não lidos.
+        """
+        # Só marcar como lidos (e avançar o checkpoint) depois de gravados, para não perder
+        # emails se algo falhar
+        checkpoint = state = None
+        if incremental:
+            checkpoint = self.get_checkpoint(folder)
+            emails, state = self.fetch_new_emails(checkpoint, folder)
+        else:
+            emails = self.fetch_unread_emails(folder, mark_seen=False)
+        processed_count = self.store_email_triggers(emails)
+        
+        if checkpoint is not None and state is not None:
+            checkpoint.uidvalidity = state['uidvalidity']
+            checkpoint.last_uid = state['last_uid']
+            checkpoint.uidnext = state['uidnext']
+            checkpoint.last_synced_at = datetime.utcnow()
+            db.session.commit()
+        
+        try:
+            self.mark_seen([email_data['id'] for email_data in emails])
+        except Exception as e:
+            print(f"Erro ao marcar emails como lidos: {str(e)}")
         
-        return data
+        return processed_count
     
-    def process_emails(self):
-        """Processar emails não lidos e criar registros no banco de dados"""
-        emails = self.fetch_unread_emails()
-        processed_count = 0
+    @staticmethod
+    def message_key(email_data):
+        """Chave de deduplicação de um email: o Message-ID ou, na falta dele, um hash do conteúdo"""
+        message_id = (email_data.get('message_id') or '').strip()
+        if message_id and len(message_id) <= MESSAGE_ID_MAX_LENGTH:
+            return message_id
+        content = '\x00'.join([
+            email_data.get('from') or '',
+            email_data.get('subject') or '',
+            email_data.get('body') or ''
+        ])
+        return 'sha256:' + hashlib.sha256(content.encode('utf-8', errors='replace')).hexdigest()
+    
+    def store_email_triggers(self, emails):
+        """Gravar os emails como EmailTriggers, ignorando os que já foram registados
         
+        A existência é verificada com uma consulta IN por lote sobre a coluna única
+        message_id; os novos são inseridos num único INSERT ... ON CONFLICT DO NOTHING,
+        para que dois processos a sincronizar ao mesmo tempo não criem duplicados.
+        Devolve o número de emails registados ou atualizados.
+        """
+        # O mesmo email pode aparecer duas vezes no lote (ex.: copiado para outra pasta)
+        by_key = {}
         for email_data in emails:
-            # Verificar se o email já foi processado
-            existing = EmailTrigger.query.filter_by(
-                email_from=email_data['from'],
-                email_subject=email_data['subject']
-            ).first()
+            by_key.setdefault(self.message_key(email_data), email_data)
+        
+        processed_count = 0
+        keys = list(by_key)
+        for batch in chunked(keys, TRIGGER_BATCH_SIZE):
+            existing = {
+                trigger.message_id: trigger
+                for trigger in EmailTrigger.query.filter(EmailTrigger.message_id.in_(batch))
+            }
             
-            if existing and existing.processed:
-                continue
+            rows = []
+            for key in batch:
+                email_data = by_key[key]
+                extraction = extraction_engine.extract(email_data['body'], email_data['from'])
+                trigger = existing.get(key)
+                if trigger is None:
+                    rows.append({
+                        'message_id': key,
+                        'email_from': (email_data['from'] or '')[:120],
+                        'email_subject': (email_data['subject'] or '')[:200],
+                        'email_body': email_data['body'],
+                        'rent_a_car_id': extraction.rent_a_car_id,
+                        'extracted_data': extraction.data,
+                        'extraction_confidence': extraction.confidence,
+                        'attachments': None
+                    })
+                elif not trigger.processed:
+                    trigger.email_body = email_data['body']
+                    trigger.rent_a_car_id = extraction.rent_a_car_id
+                    trigger.extracted_data = extraction.data
+                    trigger.extraction_confidence = extraction.confidence
+                    processed_count += 1
             
-            # Extrair dados do veículo
-            extracted_data = self.extract_vehicle_data(email_data['body'])
-            
-            # Criar ou atualizar o registro de EmailTrigger
-            if not existing:
-                email_trigger = EmailTrigger(
-                    email_from=email_data['from'],
-                    email_subject=email_data['subject'],
-                    email_body=email_data['body'],
-                    extracted_data=extracted_data
-                )
-                db.session.add(email_trigger)
-            else:
-                existing.email_body = email_data['body']
-                existing.extracted_data = extracted_data
+            self._store_attachments(rows, by_key)
+            inserted = self._insert_new_triggers(rows)
+            processed_count += len(inserted)
             
+            # Emails registados entretanto por outro processo: as referências aos anexos
+            # descarregados para eles não vão ser usadas
+            store = get_document_store()
+            for row in rows:
+                if row['message_id'] not in inserted:
+                    for attachment in row['attachments'] or []:
+                        if attachment.get('content_key'):
+                            store.release(attachment['content_key'])
             db.session.commit()
-            processed_count += 1
         
         return processed_count
     
+    def _store_attachments(self, rows, by_key):
+        """Descarregar os anexos dos emails novos para o document store
+        
+        Os anexos de todo o lote são descarregados em paralelo (ver AttachmentPipeline)
+        e cada um fica com uma referência no document store, guardada no trigger até o
+        veículo ser criado e o anexo passar a ser um Document.
+        """
+        pending = []
+        for row in rows:
+            email_data = by_key[row['message_id']]
+            if not email_data.get('folder'):
+                continue
+            for part in email_data.get('attachments') or []:
+                filename = attachment_filename(part)
+                if filename is None:
+                    continue
+                pending.append((row, dict(part, filename=filename, uid=email_data['id'], folder=email_data['folder'])))
+        if not pending:
+            return
+        
+        store = get_document_store()
+        results = self.attachment_pipeline().download([attachment for _, attachment in pending])
+        for (row, _), result in zip(pending, results):
+            if result.get('content_key'):
+                try:
+                    store.store_file(None, result['checksum'], result['size'])
+                except ContentMissing as e:
+                    # Apagado por uma libertação concorrente depois do envio: o anexo fica com erro
+                    result = dict(result, content_key=None, error=str(e))
+            row['attachments'] = (row['attachments'] or []) + [result]
+    
+    def _insert_new_triggers(self, rows):
+        """Inserir os triggers novos; devolve o conjunto das chaves efetivamente inseridas"""
+        if not rows:
+            return set()
+        dialect = db.session.get_bind().dialect.name
+        if dialect == 'postgresql':
+            statement = postgresql.insert(EmailTrigger).values(rows).on_conflict_do_nothing(index_elements=['message_id'])
+        elif dialect == 'sqlite':
+            statement = sqlite.insert(EmailTrigger).values(rows).on_conflict_do_nothing(index_elements=['message_id'])
+        else:
+            db.session.add_all(EmailTrigger(**row) for row in rows)
+            db.session.flush()
+            return {row['message_id'] for row in rows}
+        return set(db.session.execute(statement.returning(EmailTrigger.message_id)).scalars())
+    
     def create_vehicle_from_email(self, email_trigger_id):
         """Criar um veículo a partir dos dados extraídos do email"""
-        email_trigger = EmailTrigger.query.get(email_trigger_id)
+        result = self.create_vehicles_from_emails([email_trigger_id])[0]
+        vehicle = db.session.get(Vehicle, result['vehicle_id']) if result.get('vehicle_id') else None
+        return vehicle, result['message']
+    
+    def create_vehicles_from_emails(self, trigger_ids=None, batch_size=None, on_batch=None):
+        """Criar veículos a partir de vários EmailTriggers, em lotes
         
-        if not email_trigger or not email_trigger.extracted_data:
-            return None, "Dados insuficientes para criar veículo"
+        Sem trigger_ids são processados todos os triggers ainda não processados.
+        Em cada lote as matrículas são procuradas numa única consulta IN, os
+        veículos novos são inseridos de uma vez e há um único commit. Se a inserção
+        em bloco falhar, os veículos são inseridos um a um, cada um no seu savepoint,
+        para que um email com dados inválidos não impeça os restantes.
         
-        data = email_trigger.extracted_data
+        Devolve uma lista com o resultado de cada trigger (trigger_id, success,
+        message e vehicle_id). on_batch, se indicado, é chamado com os resultados
+        de cada lote depois do respetivo commit.
+        """
+        batch_size = batch_size or EMAIL_PROCESS_BATCH_SIZE
+        results = []
         
-        # Verificar campos obrigatórios
-        if 'matricula' not in data or 'marca' not in data or 'modelo' not in data:
-            email_trigger.error_message = "Campos obrigatórios ausentes"
-            db.session.commit()
-            return None, "Campos obrigatórios ausentes (matrícula, marca, modelo)"
-        
-        # Verificar se o veículo já existe
-        existing_vehicle = Vehicle.query.filter_by(matricula=data['matricula']).first()
-        if existing_vehicle:
-            email_trigger.vehicle_id = existing_vehicle.id
-            email_trigger.processed = True
-            email_trigger.processed_at = datetime.utcnow()
-            email_trigger.error_message = "Veículo já existe"
-            db.session.commit()
-            return existing_vehicle, "Veículo já existe"
+        if trigger_ids is not None:
+            requested = list(dict.fromkeys(trigger_ids))
+            for batch_ids in chunked(requested, batch_size):
+                triggers = {
+                    trigger.id: trigger
+                    for trigger in EmailTrigger.query.filter(EmailTrigger.id.in_(batch_ids))
+                }
+                batch_results = {
+                    item['trigger_id']: item
+                    for item in self._create_vehicles_batch([triggers[i] for i in batch_ids if i in triggers])
+                }
+                if on_batch:
+                    on_batch(list(batch_results.values()))
+                for trigger_id in batch_ids:
+                    results.append(batch_results.get(trigger_id) or self._result(
+                        trigger_id, False, "Dados insuficientes para criar veículo"
+                    ))
+            return results
         
-        # Processar data de desaparecimento
-        data_desaparecimento = None
-        if 'data_desaparecimento' in data:
-            try:
-                # Tentar diferentes formatos de data
-                for fmt in ['%d/%m/%Y', '%d-%m-%Y', '%Y-%m-%d']:
-                    try:
-                        data_desaparecimento = datetime.strptime(data['data_desaparecimento'], fmt)
-                        break
-                    except ValueError:
-                        continue
-            except Exception:
-                pass
+        # Percorrer os triggers por id, para não carregar milhares de uma só vez
+        last_id = 0
+        while True:
+            triggers = EmailTrigger.query.filter(
+                EmailTrigger.processed == False,
+                EmailTrigger.id > last_id
+            ).order_by(EmailTrigger.id).limit(batch_size).all()
+            if not triggers:
+                break
+            last_id = triggers[-1].id
+            batch_results = self._create_vehicles_batch(triggers)
+            results.extend(batch_results)
+            if on_batch:
+                on_batch(batch_results)
+        return results
+    
+    @staticmethod
+    def _result(trigger_id, success, message, vehicle_id=None):
+        result = {'trigger_id': trigger_id, 'success': success, 'message': message}
+        if vehicle_id is not None:
+            result['vehicle_id'] = vehicle_id
+        return result
+    
+    def _create_vehicles_batch(self, triggers):
+        results = {}
+        candidates = []
+        for trigger in triggers:
+            data = trigger.extracted_data
+            if trigger.processed:
+                results[trigger.id] = self._result(trigger.id, True, "Este email já foi processado", trigger.vehicle_id)
+            elif not data:
+                results[trigger.id] = self._result(trigger.id, False, "Dados insuficientes para criar veículo")
+            elif 'matricula' not in data or 'marca' not in data or 'modelo' not in data:
+                trigger.error_message = "Campos obrigatórios ausentes"
+                results[trigger.id] = self._result(trigger.id, False, "Campos obrigatórios ausentes (matrícula, marca, modelo)")
+            else:
+                candidates.append(trigger)
+        
+        # Uma única consulta para todas as matrículas do lote
+        plates = {trigger.extracted_data['matricula'] for trigger in candidates}
+        existing = dict(
+            db.session.query(Vehicle.matricula, Vehicle.id).filter(Vehicle.matricula.in_(plates)).all()
+        ) if plates else {}
+        
+        new_vehicles = {}
+        for trigger in candidates:
+            plate = trigger.extracted_data['matricula']
+            if plate not in existing and plate not in new_vehicles:
+                new_vehicles[plate] = self._vehicle_from_data(trigger.extracted_data)
+        
+        failed = self._insert_vehicles(new_vehicles)
+        
+        now = datetime.utcnow()
+        attached = []
+        for trigger in candidates:
+            plate = trigger.extracted_data['matricula']
+            if plate in failed:
+                trigger.error_message = failed[plate]
+                results[trigger.id] = self._result(trigger.id, False, f"Erro ao criar veículo: {failed[plate]}")
+                continue
+            
+            created = plate in new_vehicles
+            vehicle_id = new_vehicles[plate].id if created else existing[plate]
+            trigger.vehicle_id = vehicle_id
+            attached.extend(self._attachment_documents(trigger, vehicle_id))
+            trigger.processed = True
+            trigger.processed_at = now
+            if created:
+                trigger.error_message = None
+                # Outros emails do lote com a mesma matrícula ficam associados ao veículo criado
+                existing[plate] = vehicle_id
+                del new_vehicles[plate]
+                results[trigger.id] = self._result(trigger.id, True, "Veículo criado com sucesso", vehicle_id)
+            else:
+                trigger.error_message = "Veículo já existe"
+                results[trigger.id] = self._result(trigger.id, True, "Veículo já existe", vehicle_id)
+        
+        if attached:
+            db.session.flush()
+            for trigger, index, document in attached:
+                # Reatribuir a lista, para que a alteração à coluna JSON seja detetada
+                attachments = [dict(attachment) for attachment in trigger.attachments]
+                attachments[index]['document_id'] = document.id
+                trigger.attachments = attachments
+        
+        db.session.commit()
+        return [results[trigger.id] for trigger in triggers]
+    
+    def _attachment_documents(self, trigger, vehicle_id):
+        """Criar os Documents dos anexos do trigger no veículo
         
-        # Criar novo veículo
-        vehicle = Vehicle(
+        A referência ao conteúdo, criada quando o anexo foi descarregado, passa do
+        trigger para o Document. Devolve [(trigger, índice do anexo, documento)].
+        """
+        created = []
+        for index, attachment in enumerate(trigger.attachments or []):
+            if not attachment.get('content_key') or attachment.get('document_id'):
+                continue
+            document = Document(
+                vehicle_id=vehicle_id,
+                nome_ficheiro=f"{uuid.uuid4()}_{attachment['filename']}",
+                nome_original=attachment['filename'],
+                tipo_documento='anexo_email',
+                caminho_ficheiro=attachment['content_key'],
+                tamanho_ficheiro=attachment.get('size'),
+                checksum_sha256=attachment.get('checksum'),
+                origem='email_automatico'
+            )
+            db.session.add(document)
+            created.append((trigger, index, document))
+        return created
+    
+    def _insert_vehicles(self, vehicles):
+        """Inserir os veículos novos; devolve {matrícula: erro} dos que não puderam ser criados"""
+        if not vehicles:
+            return {}
+        try:
+            with db.session.begin_nested():
+                db.session.add_all(vehicles.values())
+                db.session.flush()
+            return {}
+        except Exception:
+            pass
+        
+        # A inserção em bloco falhou: isolar os veículos inválidos com um savepoint cada
+        failed = {}
+        for plate, vehicle in vehicles.items():
+            try:
+                with db.session.begin_nested():
+                    db.session.add(vehicle)
+                    db.session.flush()
+            except Exception as e:
+                if vehicle in db.session:
+                    db.session.expunge(vehicle)
+                failed[plate] = str(getattr(e, 'orig', None) or e).strip().splitlines()[0][:500]
+        return failed
+    
+    @staticmethod
+    def _parse_date(value):
+        """Processar data de desaparecimento (tentar diferentes formatos)"""
+        if not value:
+            return None
+        for fmt in ['%d/%m/%Y', '%d-%m-%Y', '%Y-%m-%d']:
+            try:
+                return datetime.strptime(value, fmt)
+            except ValueError:
+                continue
+        return None
+    
+    def _vehicle_from_data(self, data):
+        return Vehicle(
             matricula=data['matricula'],
             marca=data['marca'],
             modelo=data['modelo'],
             vin=data.get('vin'),
             status='em_tratamento',
-            data_desaparecimento=data_desaparecimento,
+            data_desaparecimento=self._parse_date(data.get('data_desaparecimento')),
             loja_aluguer=data.get('loja_aluguer'),
             cliente_nome=data.get('cliente_nome'),
             cliente_contacto=data.get('cliente_contacto')
         )
-        
-        db.session.add(vehicle)
-        db.session.flush()  # Para obter o ID do veículo
-        
-        # Atualizar o EmailTrigger
-        email_trigger.vehicle_id = vehicle.id
-        email_trigger.processed = True
-        email_trigger.processed_at = datetime.utcnow()
-        
-        db.session.commit()
-        return vehicle, "Veículo criado com sucesso"
\ No newline at end of file
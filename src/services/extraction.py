@@ -0,0 +1,305 @@
+"""Extração dos dados do veículo a partir do corpo dos emails
+
+Cada modelo (template) de extração é compilado uma única vez numa expressão
+regular combinada, que percorre o corpo do email numa só passagem. Há um modelo
+por omissão e cada RentACar pode acrescentar etiquetas ou padrões próprios
+(coluna email_template), escolhidos pelo domínio do remetente.
+"""
+
+import re
+import threading
+import time
+from datetime import datetime
+from email.utils import parseaddr
+from html import unescape
+
+# Intervalo entre recarregamentos dos modelos das rent-a-cars a partir da base de dados
+TEMPLATE_CACHE_TTL = 60
+
+# Valor de texto: até ao fim da linha ou até à etiqueta seguinte na mesma linha ("Marca: Fiat Modelo: Punto")
+_TEXT_VALUE = r'\w[^\n:]*?(?=[ \t]*(?:\r?\n|$)|[ \t]+[^\s:]+[ \t]*:)'
+
+# Separador entre a etiqueta e o valor, na mesma linha ("Matrícula: X", "Matrícula X" em tabelas HTML)
+_SEPARATOR = r'(?:[ \t]*:[ \t]*|[ \t]+)'
+
+# Campo: (etiquetas por omissão, padrão do valor, validador usado na confiança)
+DEFAULT_FIELDS = {
+    'matricula': ([r'Matr[íi]cula'], r'\w+(?:-\w+){2}|\w+ \w+ \w+|\w{4,8}', 'matricula'),
+    'marca': ([r'Marca'], _TEXT_VALUE, 'texto'),
+    'modelo': ([r'Modelo'], _TEXT_VALUE, 'texto'),
+    'vin': ([r'VIN'], r'\w+', 'vin'),
+    'data_desaparecimento': ([r'Data[ \t\w]*desaparecimento'],
+                             r'\d{2}[/\-]\d{2}[/\-]\d{4}|\d{4}-\d{2}-\d{2}', 'data'),
+    'cliente_nome': ([r'Nome[ \t\w]*cliente'], _TEXT_VALUE, 'texto'),
+    'cliente_contacto': ([r'Contacto'], r'\+?\d[\d \-]*\d', 'contacto'),
+    'loja_aluguer': ([r'Loja'], _TEXT_VALUE, 'texto'),
+}
+
+_PLATE_RE = re.compile(r'^[A-Z0-9]{2}-[A-Z0-9]{2}-[A-Z0-9]{2}$')
+_VIN_RE = re.compile(r'^[A-HJ-NPR-Z0-9]{17}$')
+_HTML_RE = re.compile(r'<(?:html|body|div|p|table|tr|td|br|span|font)\b', re.IGNORECASE)
+DATE_FORMATS = ('%d/%m/%Y', '%d-%m-%Y', '%Y-%m-%d')
+
+
+def _score_matricula(value):
+    return 1.0 if _PLATE_RE.match(value.upper()) else 0.7
+
+
+def _score_vin(value):
+    return 1.0 if _VIN_RE.match(value.upper()) else 0.5
+
+
+def _score_data(value):
+    for fmt in DATE_FORMATS:
+        try:
+            datetime.strptime(value, fmt)
+            return 1.0
+        except ValueError:
+            continue
+    return 0.3
+
+
+def _score_contacto(value):
+    digits = sum(character.isdigit() for character in value)
+    return 1.0 if 9 <= digits <= 15 else 0.6
+
+
+def _score_texto(value):
+    return 0.9 if 2 <= len(value) <= 60 else 0.6
+
+
+VALIDATORS = {
+    'matricula': _score_matricula,
+    'vin': _score_vin,
+    'data': _score_data,
+    'contacto': _score_contacto,
+    'texto': _score_texto,
+}
+
+
+class ExtractionResult:
+    __slots__ = ('data', 'confidence', 'template', 'rent_a_car_id')
+
+    def __init__(self, data, confidence, template, rent_a_car_id=None):
+        self.data = data
+        self.confidence = confidence
+        self.template = template
+        self.rent_a_car_id = rent_a_car_id
+
+
+def _first_chars(labels):
+    """Conjunto das primeiras letras possíveis das etiquetas, ou None se alguma começar por um padrão"""
+    chars = set()
+    for label in labels:
+        if label[:1] == '\\' and len(label) > 1 and not label[1].isalnum():
+            first = label[1]
+        elif label[:1] and label[0] not in '([.\\^$|?*+{':
+            first = label[0]
+        else:
+            return None
+        chars.update((first.lower(), first.upper()))
+    return chars
+
+
+class CompiledTemplate:
+    """Modelo de extração compilado numa única expressão regular
+
+    Cada campo é uma alternativa com grupos nomeados; finditer percorre o texto
+    uma vez e a primeira ocorrência de cada campo ganha, como no re.search
+    campo a campo. Ocorrências posteriores com valores diferentes baixam a
+    confiança do campo.
+    """
+
+    def __init__(self, name, fields, weight=0.9):
+        self.name = name
+        self.weight = weight
+        self._fields = []
+        alternatives = []
+        for index, (field, (labels, value_pattern, validator)) in enumerate(fields.items()):
+            label = '|'.join(f'(?:{pattern})' for pattern in labels)
+            alternatives.append(f'(?:{label}){_SEPARATOR}(?P<v{index}>{value_pattern})')
+            self._fields.append((f'v{index}', field, VALIDATORS.get(validator, _score_texto)))
+        # O lookahead com as primeiras letras das etiquetas deixa o motor de regex saltar
+        # rapidamente as posições onde nenhuma etiqueta pode começar
+        first_chars = _first_chars(label for labels, _, _ in fields.values() for label in labels)
+        prefilter = f'(?=[{re.escape("".join(sorted(first_chars)))}])' if first_chars else ''
+        try:
+            self._regex = re.compile(
+                prefilter + r'(?<!\w)(?:' + '|'.join(f'(?P<f{i}>{alt})' for i, alt in enumerate(alternatives)) + ')',
+                re.IGNORECASE
+            )
+        except re.error as e:
+            raise ValueError(f'Padrão de extração inválido no modelo {name}: {e}')
+        self._groups = {f'f{i}': self._fields[i] for i in range(len(self._fields))}
+
+    def extract(self, text, source_factor=1.0):
+        data = {}
+        conflicts = set()
+        for match in self._regex.finditer(text):
+            value_group, field, _ = self._groups[match.lastgroup]
+            value = match.group(value_group).strip()
+            if not value:
+                continue
+            if field not in data:
+                data[field] = value
+            elif data[field] != value:
+                conflicts.add(field)
+
+        confidence = {}
+        for value_group, field, validator in self._fields:
+            if field in data:
+                score = self.weight * validator(data[field]) * source_factor
+                if field in conflicts:
+                    score *= 0.6
+                confidence[field] = round(score, 2)
+        return data, confidence
+
+
+def build_template(name, template=None, weight=0.9):
+    """Compilar um modelo a partir do JSON de RentACar.email_template
+
+    Formato: {"fields": {"matricula": {"labels": ["Plate"], "pattern": "..."}},
+    "replace_default": false}. As etiquetas são texto literal e juntam-se às do
+    modelo por omissão (a menos que replace_default seja true); "pattern"
+    substitui a expressão do valor.
+    """
+    template = template or {}
+    if not isinstance(template, dict):
+        raise ValueError('O modelo de extração deve ser um objeto JSON')
+    replace_default = bool(template.get('replace_default'))
+    fields = {}
+    for field, (labels, value_pattern, validator) in DEFAULT_FIELDS.items():
+        fields[field] = (list(labels), value_pattern, validator)
+
+    custom_fields = template.get('fields') or {}
+    if not isinstance(custom_fields, dict):
+        raise ValueError('"fields" deve ser um objeto JSON')
+    for field, spec in custom_fields.items():
+        if not isinstance(spec, dict):
+            raise ValueError(f'Definição inválida para o campo {field}')
+        labels, value_pattern, validator = fields.get(field, ([], _TEXT_VALUE, 'texto'))
+        custom_labels = [re.escape(label) for label in spec.get('labels') or [] if label]
+        if custom_labels:
+            labels = custom_labels if replace_default else custom_labels + labels
+        if spec.get('pattern'):
+            value_pattern = spec['pattern']
+        if not labels:
+            raise ValueError(f'O campo {field} não tem etiquetas')
+        fields[field] = (labels, value_pattern, validator)
+    return CompiledTemplate(name, fields, weight)
+
+
+_SKIP_BLOCK_RE = re.compile(r'<(script|style|head)\b.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+_BLOCK_TAG_RE = re.compile(r'<\s*/?\s*(?:br|p|div|tr|li|table|h[1-6]|hr)\b[^>]*>', re.IGNORECASE)
+_CELL_TAG_RE = re.compile(r'<\s*(?:td|th)\b[^>]*>', re.IGNORECASE)
+_TAG_RE = re.compile(r'<[^>]*>|<!--.*?-->', re.DOTALL)
+_SPACES_RE = re.compile(r'[ \t\r\f\v\xa0]+')
+
+
+def html_to_text(html):
+    """Converter HTML em texto simples, com uma linha por bloco e células de tabela separadas por espaços"""
+    text = _SKIP_BLOCK_RE.sub(' ', html)
+    text = _BLOCK_TAG_RE.sub('\n', text)
+    text = _CELL_TAG_RE.sub(' ', text)
+    text = unescape(_TAG_RE.sub('', text))
+    lines = (_SPACES_RE.sub(' ', line).strip() for line in text.split('\n'))
+    return '\n'.join(line for line in lines if line)
+
+
+def looks_like_html(text):
+    return bool(text) and _HTML_RE.search(text, 0, 4096) is not None
+
+
+def sender_domain(sender):
+    address = parseaddr(sender or '')[1].lower()
+    return address.rpartition('@')[2] if '@' in address else None
+
+
+class ExtractionEngine:
+    """Escolhe e aplica o modelo de extração de cada email
+
+    Os modelos das rent-a-cars são compilados uma vez e reutilizados enquanto a
+    RentACar não for alterada (updated_at); o mapa domínio -> RentACar é
+    recarregado no máximo a cada TEMPLATE_CACHE_TTL segundos.
+    """
+
+    def __init__(self, ttl=TEMPLATE_CACHE_TTL):
+        self.ttl = ttl
+        self.default_template = build_template('default')
+        self._lock = threading.Lock()
+        self._compiled = {}
+        self._senders = {}
+        self._loaded_at = None
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def _load(self):
+        from src.models.rent_a_car import RentACar
+
+        rows = RentACar.query.with_entities(
+            RentACar.id, RentACar.contacto_email, RentACar.email_domains,
+            RentACar.email_template, RentACar.updated_at
+        ).filter(RentACar.is_active == True).all()
+
+        senders = {}
+        compiled = {}
+        for rac_id, contacto_email, email_domains, email_template, updated_at in rows:
+            domains = [domain.strip().lower().lstrip('@') for domain in (email_domains or '').split(',')]
+            if contacto_email:
+                domains.append(sender_domain(contacto_email))
+            for domain in filter(None, domains):
+                senders.setdefault(domain, rac_id)
+
+            previous = self._compiled.get(rac_id)
+            if previous and previous[0] == updated_at:
+                compiled[rac_id] = previous
+                continue
+            try:
+                template = build_template(f'rent_a_car:{rac_id}', email_template, weight=0.95) \
+                    if email_template else None
+            except ValueError as e:
+                print(f"Modelo de extração inválido na rent-a-car {rac_id}: {str(e)}")
+                template = None
+            compiled[rac_id] = (updated_at, template)
+
+        self._senders = senders
+        self._compiled = compiled
+        self._loaded_at = time.monotonic()
+
+    def _refresh(self):
+        if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl:
+            return
+        with self._lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.ttl:
+                try:
+                    self._load()
+                except Exception as e:
+                    # Sem contexto da aplicação ou base de dados indisponível: usar só o modelo por omissão
+                    print(f"Erro ao carregar os modelos de extração: {str(e)}")
+                    self._loaded_at = time.monotonic()
+
+    def resolve(self, sender=None, rent_a_car_id=None):
+        """Devolver (rent_a_car_id, modelo) para um remetente"""
+        if sender is not None or rent_a_car_id is not None:
+            self._refresh()
+        if rent_a_car_id is None:
+            domain = sender_domain(sender)
+            rent_a_car_id = self._senders.get(domain) if domain else None
+        entry = self._compiled.get(rent_a_car_id)
+        template = entry[1] if entry and entry[1] else self.default_template
+        return rent_a_car_id, template
+
+    def extract(self, body, sender=None, rent_a_car_id=None):
+        rent_a_car_id, template = self.resolve(sender, rent_a_car_id)
+        source_factor = 1.0
+        text = body or ''
+        if looks_like_html(text):
+            text = html_to_text(text)
+            source_factor = 0.95
+        data, confidence = template.extract(text, source_factor)
+        return ExtractionResult(data, confidence, template.name, rent_a_car_id)
+
+
+extraction_engine = ExtractionEngine()
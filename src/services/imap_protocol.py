@@ -0,0 +1,254 @@
+"""Utilitários para interpretar respostas FETCH do imaplib (BODYSTRUCTURE, partes, conjuntos de UIDs)"""
+
+import base64
+import binascii
+import email.message
+import quopri
+import re
+
+_LITERAL_RE = re.compile(rb'\{(\d+)\}$')
+_TOKEN_RE = re.compile(rb'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|([^\s()"\[]+(?:\[[^\]]*\](?:<\d+>)?)?))')
+
+
+class Literal(bytes):
+    """Conteúdo enviado pelo servidor como literal {n}"""
+
+
+def _tokens(data):
+    """Converter a lista devolvida pelo imaplib (bytes e tuplos com literais) em tokens"""
+    for item in data:
+        if isinstance(item, tuple):
+            text, literal = item[0], item[1]
+            text = _LITERAL_RE.sub(b'', text.rstrip())
+            yield from _text_tokens(text)
+            yield Literal(literal)
+        elif item:
+            yield from _text_tokens(item)
+
+
+def _text_tokens(text):
+    position = 0
+    length = len(text)
+    while position < length:
+        match = _TOKEN_RE.match(text, position)
+        if not match or match.end() == position:
+            break
+        position = match.end()
+        if match.group(1):
+            yield b'('
+        elif match.group(2):
+            yield b')'
+        elif match.group(3) is not None:
+            yield Literal(re.sub(rb'\\(.)', rb'\1', match.group(3)))
+        elif match.group(4):
+            atom = match.group(4)
+            yield None if atom.upper() == b'NIL' else atom
+
+
+def _parse_list(tokens):
+    items = []
+    for token in tokens:
+        if token == b'(' and not isinstance(token, Literal):
+            items.append(_parse_list(tokens))
+        elif token == b')' and not isinstance(token, Literal):
+            return items
+        else:
+            items.append(token)
+    return items
+
+
+def parse_fetch_response(data):
+    """Interpretar a resposta de um UID FETCH
+
+    Devolve uma lista de dicionários {ITEM: valor} (ex.: b'UID', b'BODYSTRUCTURE',
+    b'BODY[1]'), um por mensagem, com os nomes dos itens em maiúsculas.
+    """
+    tokens = iter(_tokens(data))
+    messages = []
+    for token in tokens:
+        if token == b'(' and not isinstance(token, Literal):
+            values = _parse_list(tokens)
+            message = {}
+            for index in range(0, len(values) - 1, 2):
+                name = values[index]
+                if isinstance(name, bytes):
+                    message[name.upper()] = values[index + 1]
+            messages.append(message)
+    return messages
+
+
+def fetch_item(message, prefix):
+    """Obter um item de uma mensagem pelo prefixo (ex.: b'BODY[HEADER' ou b'BODY[1]')"""
+    for name, value in message.items():
+        if name.startswith(prefix):
+            return value
+    return None
+
+
+def _text(value):
+    return value.decode('ascii', errors='replace').lower() if isinstance(value, bytes) else None
+
+
+def _params(value):
+    if not isinstance(value, list):
+        return {}
+    return {_text(value[i]): value[i + 1] for i in range(0, len(value) - 1, 2)}
+
+
+def _disposition_from_header(value):
+    header = email.message.Message()
+    header['Content-Disposition'] = value.decode('utf-8', errors='replace')
+    disposition = header.get_content_disposition()
+    filename = header.get_filename()
+    params = [b'filename', filename.encode('utf-8')] if filename else None
+    return [disposition.encode(), params] if disposition else None
+
+
+def iter_parts(structure, prefix=''):
+    """Percorrer as partes folha de um BODYSTRUCTURE
+
+    Gera dicionários com a especificação da parte (ex.: '1', '2.1'), tipo MIME,
+    codificação, charset, tamanho, disposição e nome do ficheiro.
+    """
+    if not isinstance(structure, list) or not structure:
+        return
+
+    if isinstance(structure[0], list):
+        # multipart: (parte1)(parte2)... "subtipo" ...
+        number = 1
+        for child in structure:
+            if not isinstance(child, list):
+                break
+            yield from iter_parts(child, f'{prefix}{number}.')
+            number += 1
+        return
+
+    maintype = _text(structure[0]) or 'text'
+    subtype = _text(structure[1]) or 'plain'
+    params = _params(structure[2]) if len(structure) > 2 else {}
+    encoding = _text(structure[5]) if len(structure) > 5 else None
+    size = int(structure[6]) if len(structure) > 6 and structure[6] and structure[6].isdigit() else None
+
+    # Extensões: texto tem o número de linhas antes do MD5; message/rfc822 tem envelope, corpo e linhas
+    if maintype == 'text':
+        disposition_index = 9
+    elif maintype == 'message' and subtype == 'rfc822':
+        disposition_index = 11
+    else:
+        disposition_index = 8
+    disposition = structure[disposition_index] if len(structure) > disposition_index else None
+    if isinstance(disposition, bytes):
+        # Alguns servidores enviam o cabeçalho em bruto ("attachment; filename=...") em vez da lista
+        disposition = _disposition_from_header(disposition)
+    disposition_type = _text(disposition[0]) if isinstance(disposition, list) and disposition else None
+    disposition_params = _params(disposition[1]) if isinstance(disposition, list) and len(disposition) > 1 else {}
+
+    filename = disposition_params.get('filename') or params.get('name')
+    yield {
+        'part': prefix.rstrip('.') or '1',
+        'content_type': f'{maintype}/{subtype}',
+        'encoding': encoding or '7bit',
+        'charset': _text(params.get('charset')) or 'utf-8',
+        'size': size,
+        'disposition': disposition_type,
+        'filename': filename.decode('utf-8', errors='replace') if isinstance(filename, bytes) else None,
+    }
+
+
+def find_body_part(structure, content_type='text/plain'):
+    """Encontrar a primeira parte do tipo indicado que não seja um anexo"""
+    for part in iter_parts(structure):
+        if part['content_type'] == content_type and part['disposition'] != 'attachment':
+            return part
+    return None
+
+
+def find_attachments(structure, body_part=None):
+    """Partes com nome de ficheiro que não sejam a parte usada como corpo do email"""
+    skip = body_part['part'] if body_part else None
+    return [
+        part for part in iter_parts(structure)
+        if part['filename'] and part['part'] != skip
+        and (part['disposition'] == 'attachment' or not part['content_type'].startswith('text/'))
+    ]
+
+
+class StreamDecoder:
+    """Descodificar o transfer-encoding de uma parte recebida aos bocados
+
+    Guarda entre chamadas o que ainda não pode ser descodificado (base64 que não
+    completa um grupo de 4 caracteres, linha quoted-printable incompleta), para que
+    uma parte possa ser lida em blocos sem nunca estar toda em memória.
+    """
+
+    def __init__(self, encoding):
+        self.encoding = (encoding or '7bit').lower()
+        self._pending = b''
+
+    def decode(self, chunk):
+        if self.encoding == 'base64':
+            data = self._pending + re.sub(rb'[^A-Za-z0-9+/=]', b'', chunk)
+            usable = len(data) - len(data) % 4
+            self._pending = data[usable:]
+            return base64.b64decode(data[:usable]) if usable else b''
+        if self.encoding == 'quoted-printable':
+            data = self._pending + chunk
+            end = data.rfind(b'\n') + 1
+            self._pending = data[end:]
+            return quopri.decodestring(data[:end]) if end else b''
+        return chunk
+
+    def flush(self):
+        data, self._pending = self._pending, b''
+        if not data:
+            return b''
+        if self.encoding == 'base64':
+            # Padding em falta no fim de uma parte mal formada
+            try:
+                return base64.b64decode(data + b'=' * (-len(data) % 4))
+            except (binascii.Error, ValueError):
+                return b''
+        if self.encoding == 'quoted-printable':
+            return quopri.decodestring(data)
+        return data
+
+
+def decode_part(payload, encoding, charset):
+    """Descodificar o conteúdo de uma parte (transfer-encoding e charset)"""
+    if payload is None:
+        return ''
+    encoding = (encoding or '7bit').lower()
+    try:
+        if encoding == 'base64':
+            payload = base64.b64decode(payload)
+        elif encoding == 'quoted-printable':
+            payload = quopri.decodestring(payload)
+    except (binascii.Error, ValueError):
+        pass
+    try:
+        return payload.decode(charset or 'utf-8', errors='replace')
+    except LookupError:
+        return payload.decode('utf-8', errors='replace')
+
+
+def compress_uids(uids):
+    """Converter uma lista de UIDs num conjunto IMAP compacto (ex.: 1:5,8,10:12)"""
+    values = sorted({int(uid) for uid in uids})
+    ranges = []
+    start = previous = None
+    for value in values:
+        if start is None:
+            start = previous = value
+        elif value == previous + 1:
+            previous = value
+        else:
+            ranges.append((start, previous))
+            start = previous = value
+    if start is not None:
+        ranges.append((start, previous))
+    return ','.join(str(a) if a == b else f'{a}:{b}' for a, b in ranges)
+
+
+def chunked(values, size):
+    for index in range(0, len(values), size):
+        yield values[index:index + size]
@@ -0,0 +1,284 @@
+import os
+import socket
+import threading
+import traceback
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_, update
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from src.models.user import db
+from src.models.job import Job
+
+# Espera antes de nova tentativa: JOB_RETRY_BASE_SECONDS * 2^(tentativa-1), até JOB_RETRY_MAX_SECONDS
+JOB_RETRY_BASE_SECONDS = int(os.getenv('JOB_RETRY_BASE_SECONDS', '30'))
+JOB_RETRY_MAX_SECONDS = int(os.getenv('JOB_RETRY_MAX_SECONDS', '3600'))
+# Uma tarefa em execução há mais do que isto é considerada abandonada (worker terminado) e volta à fila
+JOB_LOCK_TIMEOUT = int(os.getenv('JOB_LOCK_TIMEOUT', '1800'))
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', '2'))
+
+ACTIVE_STATUSES = ('queued', 'running')
+ABANDONED_ERROR = 'Tarefa abandonada (worker terminado) depois de esgotar as tentativas'
+
+_handlers = {}
+
+
+class JobError(Exception):
+    """Erro definitivo de uma tarefa: não vale a pena tentar novamente"""
+
+
+def job_handler(kind):
+    """Registar a função que executa as tarefas de um tipo
+
+    A função recebe (job, payload) e devolve o resultado (serializável em JSON).
+    """
+    def decorator(func):
+        _handlers[kind] = func
+        return func
+    return decorator
+
+
+def registered_kinds():
+    _load_handlers()
+    return sorted(_handlers)
+
+
+def _load_handlers():
+    # Os handlers ficam junto dos serviços respetivos; importá-los regista-os
+    from src.services import email_jobs, recovery_analytics, reports  # noqa: F401
+
+
+def enqueue(kind, payload=None, idempotency_key=None, max_attempts=3, run_after=None, created_by=None,
+            unique_active=False, commit=True):
+    """Criar uma tarefa e devolver (job, criada)
+
+    Com idempotency_key, um pedido repetido devolve a tarefa já existente com essa
+    chave. Com unique_active=True, se já houver uma tarefa do mesmo tipo na fila ou
+    em execução é essa a devolvida (ex.: não acumular verificações de email). Com
+    commit=False a tarefa fica na transação de quem chamou e é confirmada com ela.
+    """
+    _load_handlers()
+    if kind not in _handlers:
+        raise ValueError(f'Tipo de tarefa desconhecido: {kind}')
+
+    if idempotency_key:
+        existing = Job.query.filter_by(idempotency_key=idempotency_key).first()
+        if existing:
+            return existing, False
+    if unique_active:
+        existing = _active_job(kind)
+        if existing:
+            return existing, False
+
+    job = Job(
+        kind=kind,
+        payload=payload or {},
+        status='queued',
+        idempotency_key=idempotency_key,
+        unique_active=unique_active,
+        max_attempts=max_attempts,
+        run_after=run_after or datetime.utcnow(),
+        created_by=created_by
+    )
+    try:
+        # Acrescentar dentro do savepoint: begin_nested() faz flush do que já está na sessão,
+        # e um INSERT falhado fora do savepoint invalidaria a transação de quem chamou
+        with db.session.begin_nested():
+            db.session.add(job)
+            db.session.flush()
+    except IntegrityError:
+        # Outro pedido criou entretanto a tarefa com a mesma chave (ou, com unique_active, uma
+        # do mesmo tipo: o índice único parcial uq_job_kind_active impede duas ativas)
+        existing = Job.query.filter_by(idempotency_key=idempotency_key).first() if idempotency_key else None
+        if existing is None and unique_active:
+            existing = _active_job(kind)
+        return existing, False
+    if commit:
+        db.session.commit()
+    return job, True
+
+
+def _active_job(kind):
+    return Job.query.filter(Job.kind == kind, Job.status.in_(ACTIVE_STATUSES)).order_by(Job.id).first()
+
+
+def claim_next(worker_id, kinds=None):
+    """Reservar a próxima tarefa pronta a executar, ou None
+
+    Em PostgreSQL usa SELECT ... FOR UPDATE SKIP LOCKED, para que vários workers
+    não esperem uns pelos outros; nos restantes a reserva é um UPDATE condicional
+    sobre o estado lido. Uma tarefa abandonada (worker terminado a meio) volta à
+    fila enquanto tiver tentativas; a que já as esgotou é dada como falhada, para
+    que uma tarefa que faz o worker cair não seja repetida indefinidamente.
+    """
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=JOB_LOCK_TIMEOUT)
+    query = Job.query.filter(or_(
+        (Job.status == 'queued') & (Job.run_after <= now),
+        (Job.status == 'running') & (Job.locked_at < stale)
+    ))
+    if kinds:
+        query = query.filter(Job.kind.in_(kinds))
+    query = query.order_by(Job.run_after, Job.id)
+
+    if db.session.get_bind().dialect.name == 'postgresql':
+        while True:
+            job = query.with_for_update(skip_locked=True).first()
+            if job is None:
+                db.session.rollback()
+                return None
+            if job.status == 'running' and job.attempts >= job.max_attempts:
+                _mark_abandoned(job, now)
+                db.session.commit()
+                continue
+            _mark_running(job, worker_id, now)
+            db.session.commit()
+            return job
+
+    candidates = query.with_entities(Job.id, Job.status, Job.locked_at, Job.attempts, Job.max_attempts).limit(5)
+    for job_id, status, locked_at, attempts, max_attempts in candidates:
+        exhausted = status == 'running' and attempts >= max_attempts
+        if exhausted:
+            values = dict(status='failed', error=ABANDONED_ERROR, locked_by=None, locked_at=None,
+                          finished_at=now, updated_at=now)
+        else:
+            values = dict(status='running', locked_by=worker_id, locked_at=now, attempts=Job.attempts + 1,
+                          started_at=now, updated_at=now)
+        claimed = db.session.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.status == status,
+                   Job.locked_at.is_(None) if locked_at is None else Job.locked_at == locked_at)
+            .values(**values)
+        ).rowcount
+        db.session.commit()
+        if claimed and not exhausted:
+            return db.session.get(Job, job_id)
+    db.session.rollback()
+    return None
+
+
+def _mark_abandoned(job, now):
+    job.status = 'failed'
+    job.error = ABANDONED_ERROR
+    job.locked_by = None
+    job.locked_at = None
+    job.finished_at = now
+
+
+def _mark_running(job, worker_id, now):
+    job.status = 'running'
+    job.locked_by = worker_id
+    job.locked_at = now
+    job.attempts = job.attempts + 1
+    job.started_at = now
+
+
+def report_progress(job, progress, message=None):
+    """Atualizar o progresso (0 a 100) de uma tarefa em execução
+
+    É gravado numa ligação própria, para que fique visível de imediato sem
+    confirmar o trabalho que a tarefa ainda tem por gravar. Serve também de
+    sinal de vida: renova locked_at, pelo que tarefas longas que reportam
+    progresso não são tomadas por abandonadas.
+    """
+    progress = max(0, min(100, int(progress)))
+    try:
+        with db.engine.begin() as connection:
+            connection.execute(
+                update(Job).where(Job.id == job.id)
+                .values(progress=progress, progress_message=(message or '')[:200] or None,
+                        locked_at=datetime.utcnow(), updated_at=datetime.utcnow())
+            )
+    except OperationalError as e:
+        # Em SQLite a escrita falha enquanto a própria tarefa tem uma leitura em curso
+        # (ex.: um cursor aberto com yield_per); o progresso é informativo, a tarefa continua
+        print(f"Não foi possível atualizar o progresso da tarefa {job.id}: {str(e.orig or e)}")
+
+
+def retry_delay(attempts):
+    return min(JOB_RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0), JOB_RETRY_MAX_SECONDS)
+
+
+def run_job(job):
+    """Executar uma tarefa reservada e gravar o resultado ou agendar nova tentativa"""
+    _load_handlers()
+    handler = _handlers.get(job.kind)
+    job_id = job.id
+    try:
+        if handler is None:
+            raise JobError(f'Tipo de tarefa desconhecido: {job.kind}')
+        result = handler(job, job.payload or {})
+    except Exception as e:
+        db.session.rollback()
+        job = db.session.get(Job, job_id)
+        now = datetime.utcnow()
+        job.error = f'{type(e).__name__}: {str(e)}'[:2000]
+        job.locked_by = None
+        job.locked_at = None
+        if isinstance(e, JobError) or job.attempts >= job.max_attempts:
+            job.status = 'failed'
+            job.finished_at = now
+        else:
+            job.status = 'queued'
+            job.run_after = now + timedelta(seconds=retry_delay(job.attempts))
+        db.session.commit()
+        print(f"Erro na tarefa {job_id} ({job.kind}), tentativa {job.attempts}: {str(e)}")
+        traceback.print_exc()
+        return job
+
+    job = db.session.get(Job, job_id)
+    job.status = 'succeeded'
+    job.result = result
+    job.error = None
+    job.progress = 100
+    job.locked_by = None
+    job.locked_at = None
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+    return job
+
+
+def retry(job):
+    """Voltar a pôr na fila uma tarefa falhada"""
+    job.status = 'queued'
+    job.run_after = datetime.utcnow()
+    job.attempts = 0
+    job.error = None
+    job.progress = 0
+    job.progress_message = None
+    job.finished_at = None
+    db.session.commit()
+    return job
+
+
+class Worker:
+    """Processo que reserva e executa tarefas em ciclo"""
+
+    def __init__(self, app, kinds=None, poll_interval=JOB_POLL_INTERVAL, worker_id=None):
+        self.app = app
+        self.kinds = kinds
+        self.poll_interval = poll_interval
+        self.worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}'
+
+    def run_once(self):
+        """Executar uma tarefa, se houver; devolve True se executou alguma"""
+        with self.app.app_context():
+            try:
+                job = claim_next(self.worker_id, self.kinds)
+                if job is None:
+                    return False
+                run_job(job)
+                return True
+            finally:
+                db.session.remove()
+
+    def run(self, stop_event=None):
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            try:
+                ran = self.run_once()
+            except Exception as e:
+                print(f"Erro no worker {self.worker_id}: {str(e)}")
+                ran = False
+            if not ran:
+                stop_event.wait(self.poll_interval)
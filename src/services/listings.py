@@ -0,0 +1,121 @@
+"""Listagens de veículos e de emails separadas da sua execução
+
+Cada listagem valida os parâmetros do pedido, constrói as instruções select()
+e monta a resposta a partir das linhas lidas. A execução fica com quem a usa:
+as rotas Flask correm as instruções na sessão (db.session) e o modo ASGI
+(src/asgi.py) num engine assíncrono, com exatamente o mesmo resultado.
+"""
+
+from sqlalchemy import func, select
+
+from src.models.rent_a_car import EmailTrigger
+from src.models.vehicle import Vehicle
+from src.services.pagination import apply_keyset, decode_cursor, encode_cursor, parse_page_size
+from src.services.serialization import EMAIL_TRIGGER_SCHEMA, VEHICLE_SCHEMA
+
+# Valores de Flask-SQLAlchemy paginate() usados até aqui pela listagem de emails
+EMAIL_TRIGGER_PER_PAGE = 10
+EMAIL_TRIGGER_MAX_PER_PAGE = 100
+
+
+def apply_vehicle_filters(query, args):
+    """Aplicar os filtros da listagem de veículos (status, marca, loja)"""
+    status = args.get('status')
+    marca = args.get('marca')
+    loja = args.get('loja')
+
+    if status:
+        query = query.filter(Vehicle.status == status)
+    if marca:
+        query = query.filter(Vehicle.marca.ilike(f'%{marca}%'))
+    if loja:
+        query = query.filter(Vehicle.loja_aluguer.ilike(f'%{loja}%'))
+    return query
+
+
+def _count(statement):
+    return select(func.count()).select_from(statement.order_by(None).subquery())
+
+
+class VehicleListing:
+    """GET /vehicles: paginada por keyset sobre (created_at, id) ou, com all=true, lista completa
+
+    Lança InvalidFields (fields=) ou InvalidCursor (cursor=) com parâmetros inválidos.
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.fields = VEHICLE_SCHEMA.parse_fields(args.get('fields'))
+        # Sem limit= a página tem DEFAULT_PAGE_SIZE veículos; all=true (sem limit/cursor) devolve
+        # a lista completa no formato antigo, para integrações que ainda não paginam
+        self.paginated = 'limit' in args or 'cursor' in args or args.get('all', 'false').lower() != 'true'
+        self.limit = parse_page_size(args.get('limit'))
+        self.cursor = decode_cursor(args['cursor']) if self.paginated and args.get('cursor') else None
+        self.include_total = self.paginated and args.get('include_total', 'false').lower() == 'true'
+
+    def statement(self):
+        # id e created_at são sempre lidos, porque são necessários para o cursor
+        statement = apply_vehicle_filters(VEHICLE_SCHEMA.select(self.fields, extra=('id', 'created_at')), self.args)
+        if not self.paginated:
+            return statement.order_by(Vehicle.created_at.desc().nulls_last(), Vehicle.id.desc())
+        # Pedir uma linha extra para saber se existe página seguinte sem um COUNT
+        return apply_keyset(statement, Vehicle.created_at, Vehicle.id, self.cursor).limit(self.limit + 1)
+
+    def count_statement(self):
+        """Contagem total (só com include_total=true)"""
+        if not self.include_total:
+            return None
+        return apply_vehicle_filters(select(func.count(Vehicle.id)), self.args)
+
+    def response(self, rows, total=None):
+        if not self.paginated:
+            return VEHICLE_SCHEMA.dump(rows, self.fields)
+        has_more = len(rows) > self.limit
+        rows = rows[:self.limit]
+        response = {
+            'vehicles': VEHICLE_SCHEMA.dump(rows, self.fields),
+            'next_cursor': encode_cursor(rows[-1].created_at, rows[-1].id) if has_more else None,
+            'has_more': has_more,
+            'limit': self.limit
+        }
+        if self.include_total:
+            response['total'] = total
+        return response
+
+
+class EmailTriggerListing:
+    """GET /email-triggers: paginação por página (page, per_page), filtro processed
+
+    Lança InvalidFields com um fields= inválido.
+    """
+
+    def __init__(self, args):
+        self.fields = EMAIL_TRIGGER_SCHEMA.parse_fields(args.get('fields'))
+        self.requested_page = args.get('page', 1, type=int)
+        self.page = max(self.requested_page, 1)
+        per_page = args.get('per_page', EMAIL_TRIGGER_PER_PAGE, type=int)
+        self.per_page = min(per_page, EMAIL_TRIGGER_MAX_PER_PAGE) if per_page >= 1 else 20
+        processed = args.get('processed')
+        self.processed = None if processed is None else processed.lower() == 'true'
+
+    def _filtered(self):
+        statement = EMAIL_TRIGGER_SCHEMA.select(self.fields)
+        if self.processed is not None:
+            statement = statement.filter(EmailTrigger.processed == self.processed)
+        return statement
+
+    def statement(self):
+        # Ordenar por data de recebimento (mais recentes primeiro)
+        return self._filtered().order_by(EmailTrigger.received_at.desc()) \
+            .limit(self.per_page).offset((self.page - 1) * self.per_page)
+
+    def count_statement(self):
+        return _count(self._filtered())
+
+    def response(self, rows, total):
+        return {
+            'email_triggers': EMAIL_TRIGGER_SCHEMA.dump(rows, self.fields),
+            'total': total,
+            'pages': -(-total // self.per_page) if total else 0,
+            'current_page': self.requested_page
+        }
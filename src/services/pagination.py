@@ -0,0 +1,59 @@
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+class InvalidCursor(ValueError):
+    """Cursor de paginação mal formado ou adulterado"""
+
+
+def encode_cursor(created_at, row_id):
+    """Codificar a posição (created_at, id) da última linha numa string opaca"""
+    payload = json.dumps([created_at.isoformat() if created_at else None, row_id])
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Descodificar um cursor gerado por encode_cursor"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return (datetime.fromisoformat(created_at) if created_at else None), int(row_id)
+    except (ValueError, TypeError, json.JSONDecodeError) as e:
+        raise InvalidCursor(str(e))
+
+
+def parse_page_size(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """Normalizar o parâmetro limit para o intervalo [1, maximum]"""
+    if value is None or value == '':
+        return default
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, maximum))
+
+
+def apply_keyset(query, created_col, id_col, cursor):
+    """Aplicar ordenação descendente por (created_at, id) e o filtro de keyset
+
+    Linhas com created_at NULL ficam sempre no fim da listagem, tanto em
+    PostgreSQL como em SQLite, para que o cursor seja estável.
+    """
+    if cursor is not None:
+        created_at, row_id = cursor
+        if created_at is None:
+            query = query.filter(created_col.is_(None), id_col < row_id)
+        else:
+            query = query.filter(or_(
+                created_col < created_at,
+                and_(created_col == created_at, id_col < row_id),
+                created_col.is_(None)
+            ))
+    return query.order_by(created_col.desc().nulls_last(), id_col.desc())
+
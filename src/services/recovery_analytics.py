@@ -0,0 +1,563 @@
+"""Análise dos tempos de recuperação (séries por dia, semana ou mês)
+
+As séries são servidas a partir da tabela recovery_rollup, com os agregados de
+cada período por dimensão (total, marca, loja e rent-a-car): contagens por
+estado, valor perdido e média e percentis (50, 75 e 90) dos dias até à
+recuperação. Cada caso conta no período do desaparecimento (ou da submissão,
+se a data de desaparecimento não for conhecida).
+
+A tabela é mantida de forma incremental: qualquer alteração a um veículo (ou à
+ligação de um email a um veículo) marca o mês afetado em recovery_rollup_dirty,
+na mesma transação, que agenda também a tarefa analytics.refresh_rollup; a
+tarefa recalcula apenas os meses marcados. Em PostgreSQL cada período é calculado numa só consulta, com
+GROUPING SETS para as várias dimensões e percentile_cont para os percentis; nos
+restantes (SQLite) as linhas são lidas e agregadas com NumPy.
+"""
+
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import case, cast, delete, event, func, insert, inspect, literal_column, or_, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from src.models.recovery_rollup import RecoveryRollup, RecoveryRollupDirty
+from src.models.rent_a_car import EmailTrigger, RentACar
+from src.models.user import db
+from src.models.vehicle import Vehicle
+from src.services import job_queue
+from src.services.job_queue import job_handler
+
+REFRESH = 'analytics.refresh_rollup'
+
+GRANULARITIES = ('day', 'week', 'month')
+DIMENSIONS = ('total', 'marca', 'loja', 'rent_a_car')
+# Etiqueta do grupo dos veículos sem valor na dimensão
+MISSING_LABELS = {'marca': 'Sem marca', 'loja': 'Sem loja', 'rent_a_car': 'Sem rent-a-car'}
+PERCENTILES = (0.5, 0.75, 0.9)
+OPEN_STATUSES = ('em_tratamento', 'submetido')
+# Campos do veículo que entram nos agregados; alterar outros não marca o mês
+TRACKED_FIELDS = ('marca', 'loja_aluguer', 'status', 'valor', 'data_desaparecimento', 'data_submissao',
+                  'data_recuperacao')
+POINT_COLUMNS = RecoveryRollup.POINT_COLUMNS
+# Séries devolvidas por omissão quando se agrupa por uma dimensão (as com mais casos)
+DEFAULT_SERIES_LIMIT = 10
+
+_PENDING_KEY = 'recovery_rollup_months'
+_REFRESH_KEY = 'recovery_rollup_refresh'
+# Enquanto as tabelas não existirem (script ainda não executado) não se marca nada
+_TABLE_CHECK_SECONDS = 60
+_table_checked = {}
+
+
+class AnalyticsError(ValueError):
+    """Parâmetros de análise inválidos"""
+
+
+def _month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def _next_month(value):
+    return date(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+def _week_start(value):
+    return value - timedelta(days=value.weekday())
+
+
+def _case_start(vehicle):
+    return vehicle.data_desaparecimento or vehicle.data_submissao
+
+
+def _start_column():
+    return func.coalesce(Vehicle.data_desaparecimento, Vehicle.data_submissao)
+
+
+# --- Marcação dos meses a recalcular ---------------------------------------------------------
+
+def _tables_exist(connection):
+    key = str(connection.engine.url)
+    exists, checked_at = _table_checked.get(key, (False, 0))
+    if not exists and time.monotonic() - checked_at > _TABLE_CHECK_SECONDS:
+        exists = inspect(connection).has_table(RecoveryRollupDirty.__tablename__)
+        _table_checked[key] = (exists, time.monotonic())
+    return exists
+
+
+def mark_dirty(connection, dates):
+    """Marcar os meses das datas indicadas para recálculo (na transação de connection)
+
+    Devolve True se algum mês foi marcado.
+    """
+    months = {_month_start(value) for value in dates if value is not None}
+    if not months or not _tables_exist(connection):
+        return False
+    table = RecoveryRollupDirty.__table__
+    now = datetime.utcnow()
+    params = [{'month': month, 'marked_at': now} for month in sorted(months)]
+    dialect = connection.dialect.name
+    if dialect == 'postgresql':
+        connection.execute(postgresql.insert(table).on_conflict_do_nothing(index_elements=['month']), params)
+    elif dialect == 'sqlite':
+        connection.execute(sqlite.insert(table).on_conflict_do_nothing(index_elements=['month']), params)
+    else:
+        existing = set(connection.execute(select(table.c.month).where(table.c.month.in_(months))).scalars())
+        params = [item for item in params if item['month'] not in existing]
+        if params:
+            connection.execute(insert(table), params)
+    return True
+
+
+def mark_session_dirty(session, dates):
+    """Marcar os meses na transação da sessão e agendar o recálculo quando ela for confirmada"""
+    if mark_dirty(session.connection(), dates):
+        session.info[_REFRESH_KEY] = True
+
+
+def _pending(target):
+    session = Session.object_session(target)
+    return session.info.setdefault(_PENDING_KEY, set()) if session is not None else None
+
+
+def _old_value(state, name):
+    history = state.attrs[name].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return state.attrs[name].value
+
+
+@event.listens_for(Vehicle, 'after_insert')
+def _vehicle_inserted(mapper, connection, target):
+    pending = _pending(target)
+    if pending is not None:
+        pending.add(_case_start(target) or datetime.utcnow())
+
+
+@event.listens_for(Vehicle, 'after_update')
+def _vehicle_updated(mapper, connection, target):
+    state = inspect(target)
+    if not any(state.attrs[name].history.has_changes() for name in TRACKED_FIELDS):
+        return
+    pending = _pending(target)
+    if pending is not None:
+        pending.add(_old_value(state, 'data_desaparecimento') or _old_value(state, 'data_submissao'))
+        pending.add(_case_start(target))
+
+
+@event.listens_for(Vehicle, 'after_delete')
+def _vehicle_deleted(mapper, connection, target):
+    state = inspect(target)
+    pending = _pending(target)
+    if pending is not None:
+        pending.add(_old_value(state, 'data_desaparecimento') or _old_value(state, 'data_submissao'))
+
+
+def _trigger_changed(connection, target, vehicle_ids):
+    # A rent-a-car de um caso vem do email que o originou
+    vehicle_ids = [vehicle_id for vehicle_id in vehicle_ids if vehicle_id]
+    pending = _pending(target)
+    if not vehicle_ids or pending is None:
+        return
+    pending.update(connection.execute(select(_start_column()).where(Vehicle.id.in_(vehicle_ids))).scalars())
+
+
+@event.listens_for(EmailTrigger, 'after_insert')
+def _trigger_inserted(mapper, connection, target):
+    if target.vehicle_id and target.rent_a_car_id:
+        _trigger_changed(connection, target, [target.vehicle_id])
+
+
+@event.listens_for(EmailTrigger, 'after_update')
+def _trigger_updated(mapper, connection, target):
+    state = inspect(target)
+    if state.attrs.vehicle_id.history.has_changes() or state.attrs.rent_a_car_id.history.has_changes():
+        _trigger_changed(connection, target, {_old_value(state, 'vehicle_id'), target.vehicle_id})
+
+
+@event.listens_for(Session, 'after_flush')
+def _write_pending(session, flush_context):
+    dates = session.info.pop(_PENDING_KEY, None)
+    if dates:
+        mark_session_dirty(session, dates)
+
+
+@event.listens_for(Session, 'before_commit')
+def _schedule_refresh(session):
+    # O recálculo é agendado na transação que marcou os meses, e não nas leituras da API
+    if session.in_nested_transaction():
+        return
+    # As alterações ainda por gravar só marcam os meses no flush do commit
+    session.flush()
+    if session.info.pop(_REFRESH_KEY, False):
+        request_refresh(commit=False)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_refresh(session, previous_transaction):
+    if previous_transaction.parent is None:
+        session.info.pop(_REFRESH_KEY, None)
+
+
+# --- Cálculo dos agregados ---------------------------------------------------------------------
+
+def _rent_a_car_subquery():
+    return db.session.query(
+        EmailTrigger.vehicle_id.label('vehicle_id'),
+        func.min(EmailTrigger.rent_a_car_id).label('rent_a_car_id')
+    ).filter(EmailTrigger.vehicle_id.isnot(None), EmailTrigger.rent_a_car_id.isnot(None)) \
+        .group_by(EmailTrigger.vehicle_id).subquery()
+
+
+def _dimension_value(value):
+    return '' if value is None else str(value)[:100]
+
+
+def _rollup_row(granularity, bucket, dimension, value, casos, em_aberto, recuperados, perdidos,
+                valor_perdido, tempo_n, tempo_medio, percentiles, now):
+    def number(item, digits=2):
+        return round(float(item), digits) if item is not None and item == item else None
+
+    return {
+        'granularity': granularity,
+        'bucket': bucket,
+        'dimension': dimension,
+        'dimension_value': _dimension_value(value),
+        'casos': int(casos),
+        'em_aberto': int(em_aberto or 0),
+        'recuperados': int(recuperados or 0),
+        'perdidos': int(perdidos or 0),
+        'valor_perdido': number(valor_perdido),
+        'tempo_n': int(tempo_n or 0),
+        'tempo_medio': number(tempo_medio, 1) if tempo_n else None,
+        'tempo_p50': number(percentiles[0], 1) if tempo_n else None,
+        'tempo_p75': number(percentiles[1], 1) if tempo_n else None,
+        'tempo_p90': number(percentiles[2], 1) if tempo_n else None,
+        'updated_at': now,
+    }
+
+
+def _compute_sql(granularity, lo, hi):
+    """Agregados de um período em PostgreSQL: todas as dimensões numa passagem (GROUPING SETS)"""
+    start = _start_column()
+    # A granularidade vem de GRANULARITIES; como literal, a expressão é igual no SELECT e no GROUP BY
+    bucket = cast(func.date_trunc(literal_column(f"'{granularity}'"), start), db.Date)
+    days = case(
+        ((Vehicle.status == 'recuperado') & (Vehicle.data_recuperacao >= start),
+         func.extract('epoch', Vehicle.data_recuperacao - start) / 86400.0),
+        else_=None
+    )
+    rent_a_car = _rent_a_car_subquery()
+    dimensions = (Vehicle.marca, Vehicle.loja_aluguer, rent_a_car.c.rent_a_car_id)
+    query = db.session.query(
+        bucket.label('bucket'),
+        *dimensions,
+        func.grouping(*dimensions).label('grouping'),
+        func.count().label('casos'),
+        func.sum(case((Vehicle.status.in_(OPEN_STATUSES), 1), else_=0)),
+        func.sum(case((Vehicle.status == 'recuperado', 1), else_=0)),
+        func.sum(case((Vehicle.status == 'perdido', 1), else_=0)),
+        func.sum(case((Vehicle.status == 'perdido', Vehicle.valor), else_=None)),
+        func.count(days),
+        func.avg(days),
+        *[func.percentile_cont(fraction).within_group(days) for fraction in PERCENTILES]
+    ).outerjoin(rent_a_car, rent_a_car.c.vehicle_id == Vehicle.id) \
+        .filter(start >= lo, start < hi) \
+        .group_by(func.grouping_sets(
+            tuple_(bucket),
+            *[tuple_(bucket, dimension) for dimension in dimensions]
+        ))
+
+    # grouping() tem um bit por coluna, a 1 quando a coluna não faz parte do agrupamento
+    grouping_dimension = {0b111: 'total', 0b011: 'marca', 0b101: 'loja', 0b110: 'rent_a_car'}
+    now = datetime.utcnow()
+    rows = []
+    for row in query:
+        dimension = grouping_dimension[row[4]]
+        value = {'total': None, 'marca': row[1], 'loja': row[2], 'rent_a_car': row[3]}[dimension]
+        rows.append(_rollup_row(granularity, row[0], dimension, value, *row[5:12], row[12:], now))
+    return rows
+
+
+def _grouped_percentiles(groups, values, count, fractions):
+    """Percentis (interpolação linear, como percentile_cont) de values por grupo, sem ciclos por grupo"""
+    import numpy as np
+
+    result = np.full((count, len(fractions)), np.nan)
+    valid = ~np.isnan(values)
+    groups, values = groups[valid], values[valid]
+    if not len(values):
+        return result
+    order = np.lexsort((values, groups))
+    groups, values = groups[order], values[order]
+    sizes = np.bincount(groups, minlength=count)
+    offsets = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    present = sizes > 0
+    for column, fraction in enumerate(fractions):
+        position = (sizes[present] - 1) * fraction
+        lower = np.floor(position).astype(np.int64)
+        upper = np.ceil(position).astype(np.int64)
+        low_values = values[offsets[present] + lower]
+        high_values = values[offsets[present] + upper]
+        result[present, column] = low_values + (high_values - low_values) * (position - lower)
+    return result
+
+
+def _compute_numpy(granularities, lo, hi, week_lo, week_hi):
+    """Agregados lidos linha a linha e calculados com NumPy (bases de dados sem GROUPING SETS)"""
+    import numpy as np
+
+    start = _start_column()
+    rent_a_car = _rent_a_car_subquery()
+    records = db.session.query(
+        start, Vehicle.status, Vehicle.valor, Vehicle.data_recuperacao,
+        Vehicle.marca, Vehicle.loja_aluguer, rent_a_car.c.rent_a_car_id
+    ).outerjoin(rent_a_car, rent_a_car.c.vehicle_id == Vehicle.id) \
+        .filter(start >= datetime.combine(week_lo, datetime.min.time()),
+                start < datetime.combine(week_hi, datetime.min.time())).all()
+    if not records:
+        return []
+
+    columns = list(zip(*records))
+    starts = np.array(columns[0], dtype='datetime64[s]')
+    status = np.array(columns[1], dtype=object)
+    valor = np.array([float(value) if value is not None else 0.0 for value in columns[2]])
+    recovered = np.array(columns[3], dtype='datetime64[s]')
+    days = (recovered - starts) / np.timedelta64(1, 'D')
+    days[(status != 'recuperado') | ~(days >= 0)] = np.nan
+    is_open = np.isin(status, OPEN_STATUSES)
+    is_recovered = status == 'recuperado'
+    is_lost = status == 'perdido'
+    keys = {
+        'total': np.full(len(records), '', dtype=object),
+        'marca': np.array([_dimension_value(value) for value in columns[4]], dtype=object),
+        'loja': np.array([_dimension_value(value) for value in columns[5]], dtype=object),
+        'rent_a_car': np.array([_dimension_value(value) for value in columns[6]], dtype=object),
+    }
+
+    day_numbers = starts.astype('datetime64[D]').astype(np.int64)
+    buckets = {
+        'day': day_numbers,
+        # 1970-01-01 foi uma quinta-feira: recuar até à segunda-feira anterior
+        'week': day_numbers - (day_numbers + 3) % 7,
+        'month': starts.astype('datetime64[M]').astype('datetime64[D]').astype(np.int64),
+    }
+    in_range = (starts >= np.datetime64(lo)) & (starts < np.datetime64(hi))
+
+    now = datetime.utcnow()
+    epoch = date(1970, 1, 1)
+    rows = []
+    for granularity in granularities:
+        # Os dias e meses fora de [lo, hi) estariam incompletos; as semanas cobrem [week_lo, week_hi)
+        mask = in_range if granularity != 'week' else np.ones(len(records), dtype=bool)
+        bucket_values, bucket_index = np.unique(buckets[granularity][mask], return_inverse=True)
+        for dimension in DIMENSIONS:
+            key_values, key_index = np.unique(keys[dimension][mask].astype(str), return_inverse=True)
+            group_ids, groups = np.unique(bucket_index * len(key_values) + key_index, return_inverse=True)
+            count = len(group_ids)
+            casos = np.bincount(groups, minlength=count)
+            em_aberto = np.bincount(groups, weights=is_open[mask], minlength=count)
+            recuperados = np.bincount(groups, weights=is_recovered[mask], minlength=count)
+            perdidos = np.bincount(groups, weights=is_lost[mask], minlength=count)
+            valor_perdido = np.bincount(groups, weights=valor[mask] * is_lost[mask], minlength=count)
+            group_days = days[mask]
+            has_days = ~np.isnan(group_days)
+            tempo_n = np.bincount(groups, weights=has_days, minlength=count)
+            tempo_soma = np.bincount(groups, weights=np.where(has_days, group_days, 0.0), minlength=count)
+            percentiles = _grouped_percentiles(groups, group_days, count, PERCENTILES)
+
+            for index, group_id in enumerate(group_ids):
+                bucket = epoch + timedelta(days=int(bucket_values[group_id // len(key_values)]))
+                value = key_values[group_id % len(key_values)]
+                rows.append(_rollup_row(
+                    granularity, bucket, dimension, value or None,
+                    casos[index], em_aberto[index], recuperados[index], perdidos[index],
+                    valor_perdido[index] if perdidos[index] else None,
+                    tempo_n[index], tempo_soma[index] / tempo_n[index] if tempo_n[index] else None,
+                    percentiles[index], now
+                ))
+    return rows
+
+
+def _compute(lo, hi, week_lo, week_hi):
+    if db.session.get_bind().dialect.name == 'postgresql':
+        rows = []
+        for granularity in GRANULARITIES:
+            if granularity == 'week':
+                rows.extend(_compute_sql(granularity, week_lo, week_hi))
+            else:
+                rows.extend(_compute_sql(granularity, lo, hi))
+        return rows
+    return _compute_numpy(GRANULARITIES, lo, hi, week_lo, week_hi)
+
+
+def _month_ranges(months):
+    """Agrupar meses consecutivos em intervalos [início, fim)"""
+    ranges = []
+    for month in sorted(months):
+        if ranges and ranges[-1][1] == month:
+            ranges[-1][1] = _next_month(month)
+        else:
+            ranges.append([month, _next_month(month)])
+    return [tuple(item) for item in ranges]
+
+
+def refresh_rollup(full=False):
+    """Recalcular os agregados dos meses marcados (ou de todo o histórico, com full=True)
+
+    Os meses marcados são retirados da lista na mesma transação em que os
+    agregados são substituídos; uma alteração confirmada entretanto volta a
+    marcar o mês e é tratada no próximo recálculo.
+    """
+    started = time.perf_counter()
+    dirty = RecoveryRollupDirty.__table__
+    rollup = RecoveryRollup.__table__
+    if full:
+        first, last = db.session.query(func.min(_start_column()), func.max(_start_column())).one()
+        db.session.execute(delete(dirty))
+        db.session.execute(delete(rollup))
+        ranges = [(_month_start(first), _next_month(last))] if first else []
+        months = 0
+    else:
+        dirty_months = list(db.session.execute(select(dirty.c.month).order_by(dirty.c.month)).scalars())
+        if not dirty_months:
+            db.session.rollback()
+            return {'months': 0, 'rows': 0, 'seconds': 0}
+        db.session.execute(delete(dirty).where(dirty.c.month.in_(dirty_months)))
+        ranges = _month_ranges(dirty_months)
+        months = len(dirty_months)
+
+    written = 0
+    for lo, hi in ranges:
+        week_lo = _week_start(lo)
+        week_hi = hi if _week_start(hi) == hi else _week_start(hi) + timedelta(days=7)
+        if not full:
+            db.session.execute(delete(rollup).where(or_(
+                (rollup.c.granularity != 'week') & (rollup.c.bucket >= lo) & (rollup.c.bucket < hi),
+                (rollup.c.granularity == 'week') & (rollup.c.bucket >= week_lo) & (rollup.c.bucket < week_hi)
+            )))
+        rows = _compute(lo, hi, week_lo, week_hi)
+        if rows:
+            db.session.execute(insert(rollup), rows)
+        written += len(rows)
+        if full:
+            months += (hi.year - lo.year) * 12 + hi.month - lo.month
+    db.session.commit()
+    return {'months': months, 'rows': written, 'seconds': round(time.perf_counter() - started, 3)}
+
+
+@job_handler(REFRESH)
+def refresh_rollup_job(job, payload):
+    """Recalcular os agregados de recuperação dos meses alterados"""
+    return refresh_rollup(full=payload.get('full', False))
+
+
+def pending_months():
+    return db.session.query(func.count(RecoveryRollupDirty.month)).scalar()
+
+
+def request_refresh(commit=True):
+    """Agendar o recálculo dos meses marcados (sem duplicar uma tarefa já na fila)"""
+    job, _ = job_queue.enqueue(REFRESH, {}, unique_active=True, max_attempts=2, commit=commit)
+    return job
+
+
+# --- Leitura das séries ------------------------------------------------------------------------
+
+def _parse_day(value, name):
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise AnalyticsError(f'{name} inválida (formato AAAA-MM-DD)')
+
+
+def series_params(args):
+    """Validar os parâmetros de GET /analytics/recovery (lança AnalyticsError)
+
+    Devolve os argumentos de recovery_series: granularity, group_by, start e end
+    (datas) e limit.
+    """
+    granularity = args.get('granularity', 'week')
+    group_by = args.get('group_by', 'total')
+    if granularity not in GRANULARITIES:
+        raise AnalyticsError(f"Granularidade inválida (valores aceites: {', '.join(GRANULARITIES)})")
+    if group_by not in DIMENSIONS:
+        raise AnalyticsError(f"Agrupamento inválido (valores aceites: {', '.join(DIMENSIONS)})")
+    limit = args.get('limit', type=int)
+    return {
+        'granularity': granularity,
+        'group_by': group_by,
+        'start': _parse_day(args.get('start_date'), 'Data de início'),
+        'end': _parse_day(args.get('end_date'), 'Data de fim'),
+        'limit': max(limit, 1) if limit else None,
+    }
+
+
+def recovery_series(granularity='week', group_by='total', start=None, end=None, limit=None):
+    """Séries de um tipo de período por valor da dimensão, lidas da tabela de agregados
+
+    Recebe os parâmetros já validados por series_params; start e end (inclusivos)
+    limitam os períodos devolvidos. Cada série tem os pontos por período e um
+    resumo com os totais do intervalo; as séries vêm ordenadas pelo número de
+    casos e limitadas a limit.
+    """
+
+    table = RecoveryRollup.__table__
+    # Colunas em vez de objetos do ORM: uma série diária tem milhares de pontos
+    query = select(table.c.dimension_value, *[table.c[name] for name in POINT_COLUMNS]).where(
+        table.c.granularity == granularity,
+        table.c.dimension == group_by
+    )
+    if start:
+        query = query.where(table.c.bucket >= start)
+    if end:
+        query = query.where(table.c.bucket <= end)
+
+    series = {}
+    for row in db.session.execute(query.order_by(table.c.dimension_value, table.c.bucket)):
+        item = series.setdefault(row[0], {'key': row[0] or None, 'points': []})
+        item['points'].append(RecoveryRollup.point(row[1:]))
+
+    for item in series.values():
+        points = item['points']
+        casos = sum(point['casos'] for point in points)
+        perdidos = sum(point['perdidos'] for point in points)
+        recuperados = sum(point['recuperados'] for point in points)
+        tempo_n = sum(point['tempo_n'] for point in points)
+        item['resumo'] = {
+            'casos': casos,
+            'em_aberto': sum(point['em_aberto'] for point in points),
+            'recuperados': recuperados,
+            'perdidos': perdidos,
+            'taxa_recuperacao': round(recuperados / casos, 4) if casos else None,
+            'taxa_perda': round(perdidos / casos, 4) if casos else None,
+            'valor_perdido': round(sum(point['valor_perdido'] or 0 for point in points), 2),
+            'tempo_medio': round(sum(point['tempo_medio'] * point['tempo_n'] for point in points
+                                     if point['tempo_n']) / tempo_n, 1) if tempo_n else None,
+        }
+
+    ordered = sorted(series.values(), key=lambda item: (-item['resumo']['casos'], item['key'] or ''))
+    if group_by != 'total':
+        ordered = ordered[:limit or DEFAULT_SERIES_LIMIT]
+    _add_labels(group_by, ordered)
+    return ordered
+
+
+def _add_labels(group_by, series):
+    names = {}
+    if group_by == 'rent_a_car':
+        ids = [int(item['key']) for item in series if item['key']]
+        if ids:
+            names = {str(rent_a_car_id): nome for rent_a_car_id, nome in
+                     db.session.query(RentACar.id, RentACar.nome).filter(RentACar.id.in_(ids))}
+    for item in series:
+        if group_by == 'total':
+            item['label'] = 'Total'
+        elif item['key'] is None:
+            item['label'] = MISSING_LABELS[group_by]
+        else:
+            item['label'] = names.get(item['key'], item['key'])
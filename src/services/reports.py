@@ -0,0 +1,377 @@
+"""Motor de relatórios (executado em segundo plano por job_worker.py)
+
+Os relatórios são calculados com agregações em SQL e gravados como ficheiro
+(CSV, XLSX ou NDJSON) no document store. Cada pedido é uma tarefa cuja chave de
+idempotência resulta dos parâmetros (com o período já convertido em datas) e da
+versão dos dados: pedir o mesmo relatório sem que os veículos tenham mudado
+devolve a tarefa e o ficheiro já gerados.
+"""
+
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from sqlalchemy import case, func, select
+
+from src.models.job import Job
+from src.models.user import db
+from src.models.vehicle import Document, Vehicle, VehicleUpdate
+from src.services import job_queue
+from src.services.dashboard_stats import STATUSES
+from src.services.document_storage import get_document_store
+from src.services.job_queue import job_handler, report_progress
+from src.services.vehicle_export import EXPORT_FORMATS, export_stream, stream_rows
+
+GENERATE = 'report.generate'
+
+REPORT_TYPES = ('summary', 'detailed', 'statistics', 'recovery', 'vehicles')
+# Período -> número de dias até hoje (None: todo o histórico)
+DATE_RANGES = {
+    'last_week': 7,
+    'last_month': 30,
+    'last_3_months': 90,
+    'last_6_months': 180,
+    'last_year': 365,
+    'all': None,
+}
+# Relatórios gerados há mais do que isto são apagados (e o ficheiro libertado)
+REPORT_RETENTION_HOURS = int(os.getenv('REPORT_RETENTION_HOURS', '24'))
+# Linhas das tabelas agregadas incluídas também no resultado da tarefa (para mostrar no ecrã)
+RESULT_MAX_ROWS = 500
+PROGRESS_EVERY = 5000
+
+
+class ReportError(ValueError):
+    """Parâmetros de relatório inválidos"""
+
+
+def _parse_day(value, name):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except (TypeError, ValueError):
+        raise ReportError(f'{name} inválida (formato AAAA-MM-DD)')
+
+
+def normalize_params(data, now=None):
+    """Validar os parâmetros de um pedido e converter o período em datas absolutas
+
+    Devolve um dicionário com type, format, status, date_range, start e end
+    (AAAA-MM-DD; end exclusivo, start None para todo o histórico).
+    """
+    now = now or datetime.utcnow()
+    report_type = data.get('type') or 'summary'
+    if report_type not in REPORT_TYPES:
+        raise ReportError(f"Tipo de relatório inválido (valores aceites: {', '.join(REPORT_TYPES)})")
+    export_format = data.get('format') or 'xlsx'
+    if export_format not in EXPORT_FORMATS:
+        raise ReportError(f"Formato inválido (valores aceites: {', '.join(EXPORT_FORMATS)})")
+    status = data.get('status') or 'all'
+    if status != 'all' and status not in STATUSES:
+        raise ReportError(f"Status inválido (valores aceites: all, {', '.join(STATUSES)})")
+
+    date_range = data.get('date_range') or 'last_month'
+    today = datetime(now.year, now.month, now.day)
+    end = today + timedelta(days=1)
+    if date_range == 'custom':
+        start = _parse_day(data.get('start_date'), 'Data de início')
+        if data.get('end_date'):
+            end = _parse_day(data['end_date'], 'Data de fim') + timedelta(days=1)
+        if start >= end:
+            raise ReportError('A data de início deve ser anterior à data de fim')
+    elif date_range in DATE_RANGES:
+        days = DATE_RANGES[date_range]
+        start = end - timedelta(days=days) if days else None
+    else:
+        raise ReportError(f"Período inválido (valores aceites: {', '.join(list(DATE_RANGES) + ['custom'])})")
+
+    return {
+        'type': report_type,
+        'format': export_format,
+        'status': status,
+        'date_range': date_range,
+        'start': start.strftime('%Y-%m-%d') if start else None,
+        'end': end.strftime('%Y-%m-%d'),
+    }
+
+
+def data_version():
+    """Versão dos dados dos relatórios: muda com qualquer inserção, alteração ou remoção
+
+    Os veículos são seguidos por updated_at; as atualizações e os documentos (que
+    entram nos relatórios detalhados pelas contagens e pela última atualização)
+    só são inseridos ou apagados, por isso bastam a contagem e o maior id.
+    """
+    count, last_update, updates, last_update_id, documents, last_document_id = db.session.query(
+        select(func.count(Vehicle.id)).scalar_subquery(),
+        select(func.max(Vehicle.updated_at)).scalar_subquery(),
+        select(func.count(VehicleUpdate.id)).scalar_subquery(),
+        select(func.max(VehicleUpdate.id)).scalar_subquery(),
+        select(func.count(Document.id)).scalar_subquery(),
+        select(func.max(Document.id)).scalar_subquery()
+    ).one()
+    return (f"{count}:{last_update.isoformat() if last_update else ''}:"
+            f"{updates}:{last_update_id or 0}:{documents}:{last_document_id or 0}")
+
+
+def cache_key(params, version=None):
+    version = version if version is not None else data_version()
+    digest = hashlib.sha256(json.dumps([params, version], sort_keys=True).encode('utf-8')).hexdigest()
+    return f'{GENERATE}:{digest}'
+
+
+def request_report(params, created_by=None):
+    """Agendar um relatório, ou devolver o que já existe para os mesmos parâmetros e dados
+
+    Devolve (job, criada). Uma tarefa anterior que falhou volta a ser posta na fila.
+    """
+    version = data_version()
+    job, created = job_queue.enqueue(
+        GENERATE,
+        dict(params, data_version=version),
+        idempotency_key=cache_key(params, version),
+        created_by=created_by,
+        max_attempts=2
+    )
+    if job.status == 'failed':
+        job = job_queue.retry(job)
+        created = True
+    return job, created
+
+
+def purge_expired_reports(max_age_hours=None):
+    """Apagar relatórios antigos e libertar os respetivos ficheiros; devolve quantos foram apagados"""
+    limit = datetime.utcnow() - timedelta(hours=max_age_hours or REPORT_RETENTION_HOURS)
+    expired = Job.query.filter(
+        Job.kind == GENERATE,
+        Job.status.in_(('succeeded', 'failed')),
+        Job.finished_at < limit
+    ).all()
+    store = get_document_store()
+    for job in expired:
+        artifact = (job.result or {}).get('artifact')
+        if artifact:
+            store.release(artifact['content_key'])
+        db.session.delete(job)
+    db.session.commit()
+    return len(expired)
+
+
+def _month(column):
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return func.to_char(column, 'YYYY-MM')
+    return func.strftime('%Y-%m', column)
+
+
+def _days_between(start, end):
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return func.extract('epoch', end - start) / 86400.0
+    return func.julianday(end) - func.julianday(start)
+
+
+def _count_status(status):
+    return func.sum(case((Vehicle.status == status, 1), else_=0))
+
+
+def _recovery_days():
+    # Dias entre o desaparecimento (ou a submissão, se não for conhecido) e a recuperação
+    return func.avg(case(
+        (Vehicle.status == 'recuperado',
+         _days_between(func.coalesce(Vehicle.data_desaparecimento, Vehicle.data_submissao), Vehicle.data_recuperacao)),
+        else_=None
+    ))
+
+
+def _filtered(query, params):
+    if params.get('start'):
+        query = query.filter(Vehicle.data_submissao >= datetime.strptime(params['start'], '%Y-%m-%d'))
+    query = query.filter(Vehicle.data_submissao < datetime.strptime(params['end'], '%Y-%m-%d'))
+    if params.get('status') and params['status'] != 'all':
+        query = query.filter(Vehicle.status == params['status'])
+    return query
+
+
+def _aggregate_columns():
+    return [
+        func.count(Vehicle.id).label('total'),
+        *[_count_status(status).label(status) for status in STATUSES],
+        func.sum(case((Vehicle.status != 'recuperado', Vehicle.valor), else_=None)).label('valor_em_falta'),
+        _recovery_days().label('dias_medios_recuperacao'),
+    ]
+
+
+def _rate(recovered, total):
+    return round(float(recovered or 0) / total, 4) if total else None
+
+
+def _number(value, digits=2):
+    return round(float(value), digits) if value is not None else None
+
+
+def _aggregate_row(row, **keys):
+    total = row.total or 0
+    values = dict(keys)
+    values.update({
+        'total': total,
+        **{status: int(getattr(row, status) or 0) for status in STATUSES},
+        'taxa_recuperacao': _rate(row.recuperado, total),
+        'valor_em_falta': _number(row.valor_em_falta),
+        'dias_medios_recuperacao': _number(row.dias_medios_recuperacao, 1),
+    })
+    return values
+
+
+AGGREGATE_FIELDS = ['total', *STATUSES, 'taxa_recuperacao', 'valor_em_falta', 'dias_medios_recuperacao']
+
+
+def summary_table(params):
+    row = _filtered(db.session.query(*_aggregate_columns()), params).one()
+    values = _aggregate_row(row)
+    return ['indicador', 'valor'], [{'indicador': name, 'valor': values[name]} for name in AGGREGATE_FIELDS]
+
+
+def statistics_table(params):
+    query = _filtered(db.session.query(Vehicle.marca, Vehicle.loja_aluguer, *_aggregate_columns()), params)
+    rows = query.group_by(Vehicle.marca, Vehicle.loja_aluguer) \
+        .order_by(func.count(Vehicle.id).desc(), Vehicle.marca, Vehicle.loja_aluguer).all()
+    fields = ['marca', 'loja_aluguer', *AGGREGATE_FIELDS]
+    return fields, [_aggregate_row(row, marca=row.marca, loja_aluguer=row.loja_aluguer) for row in rows]
+
+
+def recovery_table(params):
+    """Taxa de recuperação por mês de submissão (um GROUP BY, mesmo sobre todo o histórico)"""
+    month = _month(Vehicle.data_submissao).label('mes')
+    rows = _filtered(db.session.query(month, *_aggregate_columns()), params) \
+        .group_by(month).order_by(month).all()
+    fields = ['mes', *AGGREGATE_FIELDS]
+    return fields, [_aggregate_row(row, mes=row.mes) for row in rows]
+
+
+VEHICLE_REPORT_FIELDS = [
+    'id', 'matricula', 'marca', 'modelo', 'vin', 'status', 'valor', 'data_submissao', 'data_desaparecimento',
+    'data_recuperacao', 'loja_aluguer', 'cliente_nome', 'cliente_contacto', 'nuipc', 'nuipc_numero', 'gps_ativo'
+]
+
+
+def vehicles_query(params):
+    columns = [getattr(Vehicle, name) for name in VEHICLE_REPORT_FIELDS]
+    return _filtered(db.session.query(*columns), params).order_by(Vehicle.data_submissao.desc(), Vehicle.id.desc())
+
+
+def detailed_query(params):
+    """Veículos com o número de atualizações e documentos e a data da última atualização"""
+    updates = db.session.query(
+        VehicleUpdate.vehicle_id.label('vehicle_id'),
+        func.count(VehicleUpdate.id).label('atualizacoes'),
+        func.max(VehicleUpdate.data_atualizacao).label('ultima_atualizacao')
+    ).group_by(VehicleUpdate.vehicle_id).subquery()
+    documents = db.session.query(
+        Document.vehicle_id.label('vehicle_id'),
+        func.count(Document.id).label('documentos')
+    ).group_by(Document.vehicle_id).subquery()
+
+    columns = [getattr(Vehicle, name) for name in VEHICLE_REPORT_FIELDS] + [
+        func.coalesce(updates.c.atualizacoes, 0).label('atualizacoes'),
+        updates.c.ultima_atualizacao,
+        func.coalesce(documents.c.documentos, 0).label('documentos'),
+        Vehicle.observacoes,
+    ]
+    query = db.session.query(*columns) \
+        .outerjoin(updates, updates.c.vehicle_id == Vehicle.id) \
+        .outerjoin(documents, documents.c.vehicle_id == Vehicle.id)
+    return _filtered(query, params).order_by(Vehicle.data_submissao.desc(), Vehicle.id.desc())
+
+
+DETAILED_FIELDS = VEHICLE_REPORT_FIELDS + ['atualizacoes', 'ultima_atualizacao', 'documentos', 'observacoes']
+
+TABLE_REPORTS = {
+    'summary': summary_table,
+    'statistics': statistics_table,
+    'recovery': recovery_table,
+}
+ROW_REPORTS = {
+    'vehicles': (vehicles_query, VEHICLE_REPORT_FIELDS),
+    'detailed': (detailed_query, DETAILED_FIELDS),
+}
+
+
+def _tracked(rows, job, total):
+    """Reportar o progresso à medida que as linhas são escritas (10% a 95%)"""
+    for index, row in enumerate(rows, start=1):
+        yield row
+        if index % PROGRESS_EVERY == 0:
+            report_progress(job, 10 + 85 * index / max(total, index), f'{index} de {total} linhas')
+
+
+def _write_artifact(chunks, filename, content_type):
+    """Gravar o ficheiro gerado no document store (em blocos, com hash na mesma passagem)"""
+    store = get_document_store()
+    path = store.staging_file()
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        with open(path, 'wb') as destination:
+            for chunk in chunks:
+                destination.write(chunk)
+                hasher.update(chunk)
+                size += len(chunk)
+        content_key = store.store_file(path, hasher.hexdigest(), size)
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+    return {'content_key': content_key, 'filename': filename, 'size': size, 'content_type': content_type}
+
+
+def report_rows(params, job=None):
+    """Colunas e linhas do relatório (objetos com um atributo por coluna, como os exportadores esperam)
+
+    Devolve (fields, rows, row_count, data); data são as linhas das tabelas
+    agregadas a incluir no resultado da tarefa (None nos relatórios por veículo).
+    """
+    report_type = params['type']
+    if report_type in TABLE_REPORTS:
+        fields, values = TABLE_REPORTS[report_type](params)
+        rows = [SimpleNamespace(**value) for value in values]
+        return fields, rows, len(values), values[:RESULT_MAX_ROWS]
+
+    build_query, fields = ROW_REPORTS[report_type]
+    query = build_query(params)
+    row_count = query.order_by(None).count()
+    rows = stream_rows(query)
+    if job is not None:
+        rows = _tracked(rows, job, row_count)
+    return fields, rows, row_count, None
+
+
+def generate_report(job, params):
+    """Calcular o relatório e gravar o ficheiro; devolve o resultado guardado na tarefa"""
+    report_type = params['type']
+    export_format = params['format']
+    report_progress(job, 5, 'A calcular o relatório')
+
+    fields, rows, row_count, data = report_rows(params, job)
+
+    report_progress(job, 10, f'A gerar o ficheiro ({row_count} linhas)')
+    period = f"{params['start'] or 'inicio'}_{params['end']}"
+    filename = f"relatorio_{report_type}_{period}.{export_format}"
+    artifact = _write_artifact(export_stream(export_format, fields, rows), filename, EXPORT_FORMATS[export_format])
+
+    result = {
+        'type': report_type,
+        'params': {key: params.get(key) for key in ('type', 'format', 'status', 'date_range', 'start', 'end')},
+        'columns': fields,
+        'row_count': row_count,
+        'artifact': artifact,
+        'generated_at': datetime.utcnow().isoformat(),
+    }
+    if data is not None:
+        result['data'] = data
+        result['data_truncated'] = row_count > len(data)
+    return result
+
+
+@job_handler(GENERATE)
+def generate_report_job(job, payload):
+    purge_expired_reports()
+    return generate_report(job, payload)
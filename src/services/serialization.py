@@ -0,0 +1,155 @@
+"""Serialização das listagens a partir dos metadados das colunas
+
+Cada Schema descreve os campos de um modelo (as colunas da tabela e, quando
+preciso, colunas de tabelas relacionadas lidas com um outer join). As listagens
+seleccionam só as colunas pedidas e constroem os dicionários diretamente dos
+Row devolvidos, sem criar instâncias ORM nem chamar to_dict() por linha; as
+datas e os Decimal ficam para o codificador.
+
+O codificador JSON da aplicação (JSONProvider) usa o orjson quando está
+instalado, que serializa datetime/date nativamente no mesmo formato que
+isoformat(); sem orjson usa o json da biblioteca padrão com as mesmas regras.
+"""
+
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import select
+
+from src.models.user import User, db
+from src.models.car_model import CarBrand, CarModel
+from src.models.job import Job
+from src.models.rent_a_car import EmailTrigger, RentACar
+from src.models.store_location import StoreLocation
+from src.models.vehicle import Document, Vehicle, VehicleUpdate
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class InvalidFields(ValueError):
+    """Campos pedidos em fields= que o schema não tem"""
+
+
+def _default(value):
+    """Tipos que o codificador não conhece (no orjson, só Decimal e os da Flask)"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return DefaultJSONProvider.default(value)
+
+
+def dumps(value):
+    """Codificar em JSON (bytes UTF-8)"""
+    if orjson is not None:
+        return orjson.dumps(value, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, default=_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class JSONProvider(DefaultJSONProvider):
+    """Codificador usado por jsonify(): orjson quando disponível, datas em ISO 8601"""
+
+    default = staticmethod(_default)
+    ensure_ascii = False
+    sort_keys = False
+
+    def dumps(self, obj, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+        return super().dumps(obj, **kwargs)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj) + b'\n', mimetype=self.mimetype)
+
+
+class Schema:
+    """Campos serializáveis de um modelo
+
+    exclude: colunas que nunca são devolvidas (ex.: password_hash).
+    related: {nome: (coluna, modelo relacionado, condição do join)} para campos
+    de outras tabelas, lidos com um outer join só quando são pedidos.
+    """
+
+    def __init__(self, model, exclude=(), related=None):
+        self.model = model
+        self.columns = {
+            column.key: getattr(model, column.key)
+            for column in model.__table__.columns if column.key not in exclude
+        }
+        self.related = related or {}
+        self.fields = tuple(self.columns) + tuple(self.related)
+
+    def parse_fields(self, raw_fields):
+        """Validar o parâmetro fields= e devolver a lista de campos pedidos (None = todos)"""
+        if not raw_fields:
+            return None
+        names = [name.strip() for name in raw_fields.split(',') if name.strip()]
+        unknown = [name for name in names if name not in self.columns and name not in self.related]
+        if unknown:
+            raise InvalidFields(f"Campos desconhecidos: {', '.join(unknown)}")
+        return list(dict.fromkeys(names))
+
+    def _selection(self, fields, extra):
+        names = list(fields or self.fields)
+        names += [name for name in extra if name not in names]
+        selected = []
+        joins = {}
+        for name in names:
+            if name in self.columns:
+                selected.append(self.columns[name])
+            else:
+                column, target, onclause = self.related[name]
+                selected.append(column.label(name))
+                joins.setdefault(target, onclause)
+        return selected, joins
+
+    def query(self, fields=None, extra=()):
+        """Consulta que selecciona fields (por esta ordem) e, no fim, as colunas extra
+
+        As colunas extra (ex.: as do cursor) ficam depois dos campos pedidos e são
+        ignoradas por dump(fields).
+        """
+        selected, joins = self._selection(fields, extra)
+        query = db.session.query(*selected).select_from(self.model)
+        for target, onclause in joins.items():
+            query = query.outerjoin(target, onclause)
+        return query
+
+    def select(self, fields=None, extra=()):
+        """O mesmo que query(), como instrução select() sem sessão (ex.: para um engine assíncrono)"""
+        selected, joins = self._selection(fields, extra)
+        statement = select(*selected).select_from(self.model)
+        for target, onclause in joins.items():
+            statement = statement.outerjoin(target, onclause)
+        return statement
+
+    def dump(self, rows, fields=None):
+        """Converter os Row de query(fields) em dicionários"""
+        names = tuple(fields or self.fields)
+        return [dict(zip(names, row)) for row in rows]
+
+
+VEHICLE_SCHEMA = Schema(Vehicle)
+VEHICLE_UPDATE_SCHEMA = Schema(VehicleUpdate)
+DOCUMENT_SCHEMA = Schema(Document)
+USER_SCHEMA = Schema(User, exclude=('password_hash',))
+RENT_A_CAR_SCHEMA = Schema(RentACar)
+EMAIL_TRIGGER_SCHEMA = Schema(EmailTrigger)
+CAR_BRAND_SCHEMA = Schema(CarBrand)
+CAR_MODEL_SCHEMA = Schema(CarModel, related={
+    'brand_name': (CarBrand.name, CarBrand, CarModel.brand_id == CarBrand.id)
+})
+STORE_LOCATION_SCHEMA = Schema(StoreLocation, related={
+    'rent_a_car_nome': (RentACar.nome, RentACar, StoreLocation.rent_a_car_id == RentACar.id)
+})
+JOB_SCHEMA = Schema(Job)
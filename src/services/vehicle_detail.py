@@ -0,0 +1,95 @@
+"""Detalhe de um veículo com expansão opcional das relações (include=)
+
+O veículo, os documentos (joinedload) e o número de atualizações são lidos numa
+única consulta; a timeline, quando pedida, é lida numa segunda consulta e
+paginada por keyset (data_atualizacao, id), para que um veículo com milhares de
+atualizações não seja devolvido de uma vez.
+"""
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import joinedload
+
+from src.models.user import db
+from src.models.vehicle import Vehicle, VehicleUpdate
+from src.services.pagination import apply_keyset, encode_cursor, parse_page_size
+from src.services.serialization import VEHICLE_UPDATE_SCHEMA
+
+EXPANSIONS = ('atualizacoes', 'documentos')
+TIMELINE_PAGE_SIZE = 50
+TIMELINE_MAX_PAGE_SIZE = 500
+
+
+class InvalidInclude(ValueError):
+    """Relação pedida em include= que não existe"""
+
+
+def parse_include(value, default=EXPANSIONS):
+    """Converter o parâmetro include (nomes separados por vírgulas) num conjunto
+
+    Sem parâmetro devolve default; include= vazio devolve só o veículo.
+    """
+    if value is None:
+        return set(default)
+    names = {name.strip() for name in value.split(',') if name.strip()}
+    unknown = names - set(EXPANSIONS)
+    if unknown:
+        raise InvalidInclude(
+            f"Relações desconhecidas em include: {', '.join(sorted(unknown))} "
+            f"(valores aceites: {', '.join(EXPANSIONS)})"
+        )
+    return names
+
+
+def parse_timeline_limit(value):
+    return parse_page_size(value, default=TIMELINE_PAGE_SIZE, maximum=TIMELINE_MAX_PAGE_SIZE)
+
+
+def timeline_page(vehicle_id, limit=TIMELINE_PAGE_SIZE, cursor=None):
+    """Uma página da timeline (mais recentes primeiro); limit=None devolve-a toda
+
+    Devolve (atualizações já serializadas, cursor da página seguinte ou None).
+    """
+    query = apply_keyset(
+        VEHICLE_UPDATE_SCHEMA.query().filter(VehicleUpdate.vehicle_id == vehicle_id),
+        VehicleUpdate.data_atualizacao, VehicleUpdate.id, cursor
+    )
+    if limit is None:
+        return VEHICLE_UPDATE_SCHEMA.dump(query.all()), None
+    # Uma linha a mais indica que existe página seguinte, sem contar as restantes
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return VEHICLE_UPDATE_SCHEMA.dump(rows), None
+    rows = rows[:limit]
+    return VEHICLE_UPDATE_SCHEMA.dump(rows), encode_cursor(rows[-1].data_atualizacao, rows[-1].id)
+
+
+def load_vehicle_detail(criterion, include=EXPANSIONS, timeline_limit=TIMELINE_PAGE_SIZE, timeline_cursor=None):
+    """Obter o dicionário do veículo que satisfaz criterion com as relações de include, ou None"""
+    update_count = select(func.count(VehicleUpdate.id)) \
+        .where(VehicleUpdate.vehicle_id == Vehicle.id).scalar_subquery()
+    query = db.session.query(Vehicle, update_count.label('atualizacoes_total')).filter(criterion)
+    if 'documentos' in include:
+        query = query.options(joinedload(Vehicle.documentos))
+    row = query.first()
+    if row is None:
+        return None
+
+    vehicle, total = row
+    data = vehicle.to_dict()
+    data['atualizacoes_total'] = total
+    if 'documentos' in include:
+        documents = sorted(
+            vehicle.documentos,
+            key=lambda doc: (doc.data_upload is not None, doc.data_upload, doc.id),
+            reverse=True
+        )
+        data['documentos'] = [doc.to_dict() for doc in documents]
+    if 'atualizacoes' in include:
+        if total:
+            updates, next_cursor = timeline_page(vehicle.id, timeline_limit, timeline_cursor)
+        else:
+            # Sem atualizações não é preciso a segunda consulta
+            updates, next_cursor = [], None
+        data['atualizacoes'] = updates
+        data['atualizacoes_next_cursor'] = next_cursor
+    return data
@@ -0,0 +1,219 @@
+"""Exportação de veículos em streaming (CSV, NDJSON e XLSX)
+
+As linhas são lidas com yield_per (cursor do lado do servidor em PostgreSQL) e
+cada formato é gerado por um gerador que vai entregando blocos à resposta, pelo
+que a memória usada não depende do número de veículos exportados e o primeiro
+byte é enviado antes de a consulta terminar.
+"""
+
+import csv
+import io
+import os
+import re
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from src.services.serialization import dumps
+
+# Linhas lidas da base de dados de cada vez
+EXPORT_BATCH_SIZE = int(os.getenv('VEHICLE_EXPORT_BATCH_SIZE', '1000'))
+# Tamanho aproximado de cada bloco enviado ao cliente
+FLUSH_SIZE = 64 * 1024
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+CSV_DELIMITERS = {',': ',', ';': ';', 'tab': '\t'}
+
+# Caracteres de controlo que não são permitidos em XML
+_INVALID_XML_RE = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+# Inícios de texto que o Excel/LibreOffice interpretam como fórmula
+_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def stream_rows(query, batch_size=None):
+    """Percorrer o resultado de uma consulta em blocos, sem o carregar todo"""
+    return query.yield_per(batch_size or EXPORT_BATCH_SIZE)
+
+
+def _neutralize_formula(text):
+    """Impedir que texto vindo dos utilizadores (ex.: emails importados) seja executado como fórmula"""
+    return f"'{text}" if text.startswith(_FORMULA_PREFIXES) else text
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, str):
+        return _neutralize_formula(value)
+    return value
+
+
+def csv_stream(fields, rows, delimiter=','):
+    """Gerar um CSV em blocos; começa com BOM para que o Excel reconheça o UTF-8"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=delimiter)
+    buffer.write('\ufeff')
+    writer.writerow(fields)
+    yield buffer.getvalue().encode('utf-8')
+    buffer.seek(0)
+    buffer.truncate()
+
+    for row in rows:
+        writer.writerow([_csv_value(getattr(row, name)) for name in fields])
+        if buffer.tell() >= FLUSH_SIZE:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def ndjson_stream(fields, rows):
+    """Gerar um objeto JSON por linha"""
+    chunk = []
+    size = 0
+    # O primeiro objeto é enviado de imediato; os seguintes em blocos de FLUSH_SIZE
+    limit = 0
+    for row in rows:
+        line = dumps({name: getattr(row, name) for name in fields}) + b'\n'
+        chunk.append(line)
+        size += len(line)
+        if size >= limit:
+            yield b''.join(chunk)
+            chunk = []
+            size = 0
+            limit = FLUSH_SIZE
+    if chunk:
+        yield b''.join(chunk)
+
+
+class _ChunkSink:
+    """Destino não posicionável para o zipfile: acumula o que é escrito até ser recolhido"""
+
+    def __init__(self):
+        self._chunks = []
+        self.size = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        self.size = 0
+        return data
+
+
+_XLSX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+_XLSX_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_XLSX_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+_XLSX_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+
+
+def _xlsx_cell(value):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, bool):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float, Decimal)):
+        return f'<c><v>{value}</v></c>'
+    if isinstance(value, (datetime, date)):
+        value = value.isoformat()
+    elif isinstance(value, str):
+        value = _neutralize_formula(value)
+    text = escape(_INVALID_XML_RE.sub('', str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def xlsx_stream(fields, rows, sheet_name='Veiculos'):
+    """Gerar um XLSX (uma folha, texto inline) à medida que as linhas são lidas
+
+    O zip é escrito num destino não posicionável, com descritores de dados no
+    fim de cada ficheiro, por isso não é preciso conhecer o tamanho da folha
+    antes de a enviar. Não usa o openpyxl, que só grava o ficheiro no fim.
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', _XLSX_CONTENT_TYPES)
+        archive.writestr('_rels/.rels', _XLSX_ROOT_RELS)
+        archive.writestr('xl/workbook.xml', _XLSX_WORKBOOK.format(name=escape(sheet_name)))
+        archive.writestr('xl/_rels/workbook.xml.rels', _XLSX_WORKBOOK_RELS)
+
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            sheet.write(('<row>' + ''.join(_xlsx_cell(name) for name in fields) + '</row>').encode('utf-8'))
+            yield sink.drain()
+
+            pending = []
+            size = 0
+            for row in rows:
+                line = '<row>' + ''.join(_xlsx_cell(getattr(row, name)) for name in fields) + '</row>'
+                pending.append(line)
+                size += len(line)
+                if size >= FLUSH_SIZE:
+                    sheet.write(''.join(pending).encode('utf-8'))
+                    pending = []
+                    size = 0
+                    if sink.size:
+                        yield sink.drain()
+            if pending:
+                sheet.write(''.join(pending).encode('utf-8'))
+            sheet.write(b'</sheetData></worksheet>')
+    yield sink.drain()
+
+
+def export_stream(export_format, fields, rows, delimiter=','):
+    if export_format == 'csv':
+        return csv_stream(fields, rows, delimiter)
+    if export_format == 'ndjson':
+        return ndjson_stream(fields, rows)
+    if export_format == 'xlsx':
+        return xlsx_stream(fields, rows)
+    raise ValueError(f'Formato de exportação desconhecido: {export_format}')
@@ -0,0 +1,397 @@
+"""Importação em massa de veículos a partir de ficheiros CSV ou XLSX
+
+O ficheiro é lido linha a linha (csv.reader sobre o stream do upload, ou openpyxl
+em modo read_only), validado em blocos e cada bloco é gravado de uma vez: as
+matrículas já existentes são procuradas numa única consulta IN por bloco e as
+linhas novas são carregadas com COPY em PostgreSQL ou com INSERT de várias linhas
+nos restantes. O resultado indica, por linha, os erros e os duplicados.
+"""
+
+import csv
+import io
+import os
+import unicodedata
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+from src.models.user import db
+from src.models.vehicle import Vehicle
+from src.services import recovery_analytics
+from src.services.dashboard_stats import STATUSES, snapshot as dashboard_stats
+
+# Linhas validadas e gravadas de cada vez (um commit por bloco)
+IMPORT_CHUNK_SIZE = int(os.getenv('VEHICLE_IMPORT_CHUNK_SIZE', '2000'))
+# Linhas por executemany quando não é possível usar COPY
+INSERT_BATCH_SIZE = 1000
+# Número máximo de linhas com problemas incluídas no relatório
+MAX_REPORTED_ROWS = 1000
+
+# Nome normalizado da coluna no ficheiro -> campo do veículo
+COLUMN_ALIASES = {
+    'matricula': 'matricula', 'plate': 'matricula', 'license_plate': 'matricula',
+    'marca': 'marca', 'make': 'marca', 'brand': 'marca',
+    'modelo': 'modelo', 'model': 'modelo',
+    'vin': 'vin', 'chassis': 'vin', 'numero_chassis': 'vin',
+    'valor': 'valor', 'value': 'valor',
+    'nuipc': 'nuipc', 'queixa': 'nuipc',
+    'nuipc_numero': 'nuipc_numero', 'numero_nuipc': 'nuipc_numero',
+    'gps_ativo': 'gps_ativo', 'gps': 'gps_ativo',
+    'status': 'status', 'estado': 'status',
+    'data_desaparecimento': 'data_desaparecimento', 'data': 'data_desaparecimento',
+    'loja_aluguer': 'loja_aluguer', 'loja': 'loja_aluguer', 'store': 'loja_aluguer',
+    'observacoes': 'observacoes', 'notas': 'observacoes', 'notes': 'observacoes',
+    'cliente_nome': 'cliente_nome', 'nome_cliente': 'cliente_nome', 'cliente': 'cliente_nome',
+    'cliente_contacto': 'cliente_contacto', 'contacto': 'cliente_contacto', 'telefone': 'cliente_contacto',
+    'cliente_morada': 'cliente_morada', 'morada': 'cliente_morada',
+    'cliente_email': 'cliente_email', 'email': 'cliente_email',
+    'cliente_observacoes': 'cliente_observacoes',
+}
+
+REQUIRED_FIELDS = ('matricula', 'marca')
+BOOLEAN_FIELDS = ('nuipc', 'gps_ativo')
+TRUE_VALUES = {'1', 'true', 'sim', 's', 'yes', 'y', 'x'}
+FALSE_VALUES = {'0', 'false', 'nao', 'n', 'no'}
+DATE_FORMATS = ('%d/%m/%Y', '%d-%m-%Y', '%Y-%m-%d', '%d/%m/%Y %H:%M', '%Y-%m-%d %H:%M:%S')
+
+# Colunas gravadas por cada linha (todas explícitas, porque o COPY não aplica os defaults do modelo)
+INSERT_COLUMNS = (
+    'matricula', 'marca', 'modelo', 'vin', 'valor', 'nuipc', 'nuipc_numero', 'gps_ativo', 'status',
+    'data_submissao', 'data_desaparecimento', 'loja_aluguer', 'observacoes', 'cliente_nome',
+    'cliente_contacto', 'cliente_morada', 'cliente_email', 'cliente_observacoes', 'created_at', 'updated_at'
+)
+
+
+class VehicleImportError(ValueError):
+    """Ficheiro que não pode ser importado (formato, cabeçalho)"""
+
+
+def normalize_header(value):
+    text = unicodedata.normalize('NFKD', str(value or '')).encode('ascii', 'ignore').decode('ascii')
+    return '_'.join(text.strip().lower().replace('-', ' ').replace('.', ' ').split())
+
+
+def _normalize_text(value):
+    return unicodedata.normalize('NFKD', value).encode('ascii', 'ignore').decode('ascii').strip().lower()
+
+
+def iter_csv_rows(stream, encoding='utf-8-sig'):
+    """Ler um CSV (separado por vírgulas, ponto e vírgula ou tabs) sem o carregar todo para memória
+
+    Gera listas de valores, começando pelo cabeçalho.
+    """
+    text = io.TextIOWrapper(stream, encoding=encoding, errors='replace', newline='')
+    first_line = text.readline()
+    if not first_line:
+        return
+    # O Excel em português exporta CSV separado por ponto e vírgula
+    delimiter = max((';', ',', '\t'), key=first_line.count)
+    yield next(csv.reader([first_line], delimiter=delimiter))
+    yield from csv.reader(text, delimiter=delimiter)
+
+
+def iter_xlsx_rows(stream):
+    """Ler a primeira folha de um XLSX em modo read_only (linha a linha)"""
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise VehicleImportError('A importação de XLSX requer o pacote openpyxl (pip install openpyxl)')
+    try:
+        workbook = load_workbook(stream, read_only=True, data_only=True)
+    except Exception as e:
+        raise VehicleImportError(f'Ficheiro XLSX inválido: {str(e)}')
+    try:
+        for row in workbook.worksheets[0].iter_rows(values_only=True):
+            yield list(row)
+    finally:
+        workbook.close()
+
+
+def iter_file_rows(stream, filename):
+    extension = (filename or '').rsplit('.', 1)[-1].lower()
+    if extension == 'xlsx':
+        return iter_xlsx_rows(stream)
+    if extension in ('csv', 'txt'):
+        return iter_csv_rows(stream)
+    raise VehicleImportError('Formato não suportado: use um ficheiro .csv ou .xlsx')
+
+
+class VehicleImporter:
+    """Validar e gravar em blocos as linhas de um ficheiro de veículos
+
+    Com dry_run=True as linhas são validadas e os duplicados detetados, mas nada
+    é gravado.
+    """
+
+    def __init__(self, chunk_size=None, dry_run=False):
+        self.chunk_size = chunk_size or IMPORT_CHUNK_SIZE
+        self.dry_run = dry_run
+        self.total = 0
+        self.imported = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.report = []
+        self.truncated = False
+        self.ignored_columns = []
+        self._seen = set()
+        self._fields = None
+
+    def run(self, rows):
+        """Importar as linhas (a primeira é o cabeçalho) e devolver o relatório"""
+        rows = iter(rows)
+        header = next(rows, None)
+        if header is None:
+            raise VehicleImportError('O ficheiro está vazio')
+        self._read_header(header)
+
+        chunk = []
+        try:
+            for line_number, values in enumerate(rows, start=2):
+                if not any(value not in (None, '') for value in values):
+                    continue
+                chunk.append((line_number, values))
+                if len(chunk) >= self.chunk_size:
+                    self._process_chunk(chunk)
+                    chunk = []
+            if chunk:
+                self._process_chunk(chunk)
+        finally:
+            if self.imported:
+                # Inserções em massa não passam pelos eventos do ORM que mantêm o snapshot
+                dashboard_stats.invalidate()
+        return self.result()
+
+    def result(self):
+        return {
+            'total_rows': self.total,
+            'imported': self.imported,
+            'duplicates': self.duplicates,
+            'invalid': self.invalid,
+            'dry_run': self.dry_run,
+            'ignored_columns': self.ignored_columns,
+            'rows': self.report,
+            'truncated': self.truncated
+        }
+
+    def _read_header(self, header):
+        self._fields = []
+        for name in header:
+            field = COLUMN_ALIASES.get(normalize_header(name))
+            if field is None or field in self._fields:
+                if name not in (None, ''):
+                    self.ignored_columns.append(str(name))
+                field = None
+            self._fields.append(field)
+        missing = [field for field in REQUIRED_FIELDS if field not in self._fields]
+        if missing:
+            raise VehicleImportError(f"Colunas obrigatórias em falta: {', '.join(missing)}")
+
+    def _add_report(self, line_number, matricula, status, errors=None):
+        if len(self.report) >= MAX_REPORTED_ROWS:
+            self.truncated = True
+            return
+        entry = {'row': line_number, 'matricula': matricula, 'status': status}
+        if errors:
+            entry['errors'] = errors
+        self.report.append(entry)
+
+    def _process_chunk(self, chunk):
+        now = datetime.utcnow()
+        valid = {}
+        for line_number, values in chunk:
+            self.total += 1
+            record, errors = self._validate(values, now)
+            matricula = record.get('matricula')
+            if errors:
+                self.invalid += 1
+                self._add_report(line_number, matricula, 'invalid', errors)
+            elif matricula in self._seen:
+                self.duplicates += 1
+                self._add_report(line_number, matricula, 'duplicate', ['Matrícula repetida no ficheiro'])
+            else:
+                self._seen.add(matricula)
+                valid[matricula] = (line_number, record)
+        if not valid:
+            return
+
+        # Uma única consulta para todas as matrículas do bloco
+        existing = {
+            matricula for (matricula,) in
+            db.session.query(Vehicle.matricula).filter(Vehicle.matricula.in_(list(valid)))
+        }
+        for matricula in existing:
+            line_number, _ = valid.pop(matricula)
+            self.duplicates += 1
+            self._add_report(line_number, matricula, 'duplicate', ['Veículo com esta matrícula já existe'])
+
+        if self.dry_run or not valid:
+            db.session.rollback()
+            return
+
+        inserted = self._insert([record for _, record in valid.values()])
+        # Inserções em massa não passam pelos eventos do ORM: marcar os meses afetados na mesma transação
+        recovery_analytics.mark_session_dirty(db.session, [
+            record['data_desaparecimento'] or record['data_submissao']
+            for matricula, (_, record) in valid.items() if matricula in inserted
+        ])
+        db.session.commit()
+        self.imported += len(inserted)
+        # Matrículas criadas por outro pedido entre a consulta e a inserção
+        for matricula, (line_number, _) in valid.items():
+            if matricula not in inserted:
+                self.duplicates += 1
+                self._add_report(line_number, matricula, 'duplicate', ['Veículo com esta matrícula já existe'])
+
+    def _validate(self, values, now):
+        record = {}
+        errors = []
+        for field, value in zip(self._fields, values):
+            if field is None:
+                continue
+            if isinstance(value, str):
+                value = value.strip()
+            record[field] = None if value == '' else value
+
+        matricula = record.get('matricula')
+        if matricula is not None:
+            record['matricula'] = str(matricula).upper()
+        for field in REQUIRED_FIELDS:
+            if record.get(field) is None:
+                errors.append(f'{field} é obrigatório')
+
+        for field, column in (('matricula', 20), ('marca', 50), ('modelo', 100), ('vin', 17), ('nuipc_numero', 50),
+                              ('loja_aluguer', 100), ('cliente_nome', 200), ('cliente_contacto', 50),
+                              ('cliente_morada', 500), ('cliente_email', 200)):
+            value = record.get(field)
+            if value is None:
+                continue
+            value = str(value)
+            record[field] = value
+            if len(value) > column:
+                errors.append(f'{field} excede {column} caracteres')
+        for field in ('observacoes', 'cliente_observacoes'):
+            if record.get(field) is not None:
+                record[field] = str(record[field])
+
+        if record.get('valor') is not None:
+            try:
+                valor = record['valor']
+                if isinstance(valor, str):
+                    valor = valor.replace(' ', '').replace('€', '')
+                    # 1.234,56 (formato português) ou 1234.56
+                    if ',' in valor:
+                        valor = valor.replace('.', '').replace(',', '.')
+                record['valor'] = Decimal(str(valor)).quantize(Decimal('0.01'))
+                if abs(record['valor']) >= Decimal('100000000'):
+                    errors.append('valor fora do intervalo permitido')
+            except (InvalidOperation, ValueError):
+                errors.append('valor inválido')
+
+        for field in BOOLEAN_FIELDS:
+            value = record.get(field)
+            if value is None or isinstance(value, bool):
+                record[field] = bool(value)
+                continue
+            text = _normalize_text(str(value))
+            if text in TRUE_VALUES:
+                record[field] = True
+            elif text in FALSE_VALUES:
+                record[field] = False
+            else:
+                errors.append(f'{field} inválido')
+
+        status = record.get('status')
+        if status is None:
+            record['status'] = 'em_tratamento'
+        else:
+            status = _normalize_text(str(status)).replace(' ', '_')
+            if status not in STATUSES:
+                errors.append(f"status inválido (valores aceites: {', '.join(STATUSES)})")
+            record['status'] = status
+
+        value = record.get('data_desaparecimento')
+        if value is not None:
+            parsed = self._parse_date(value)
+            if parsed is None:
+                errors.append('data_desaparecimento inválida')
+            record['data_desaparecimento'] = parsed
+
+        record['data_submissao'] = now
+        record['created_at'] = now
+        record['updated_at'] = now
+        return {column: record.get(column) for column in INSERT_COLUMNS}, errors
+
+    @staticmethod
+    def _parse_date(value):
+        if isinstance(value, datetime):
+            return value
+        if isinstance(value, date):
+            return datetime(value.year, value.month, value.day)
+        for fmt in DATE_FORMATS:
+            try:
+                return datetime.strptime(str(value), fmt)
+            except ValueError:
+                continue
+        return None
+
+    def _insert(self, records):
+        """Gravar as linhas e devolver o conjunto das matrículas inseridas"""
+        if db.session.get_bind().dialect.name == 'postgresql':
+            try:
+                with db.session.begin_nested():
+                    self._copy(records)
+                return {record['matricula'] for record in records}
+            except Exception:
+                # Conflito com uma matrícula criada entretanto: inserir ignorando os conflitos
+                pass
+        inserted = set()
+        for index in range(0, len(records), INSERT_BATCH_SIZE):
+            inserted |= self._insert_batch(records[index:index + INSERT_BATCH_SIZE])
+        return inserted
+
+    def _copy(self, records):
+        """Carregar as linhas com COPY ... FROM STDIN (muito mais rápido do que INSERT)"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for record in records:
+            writer.writerow([_copy_value(record[column]) for column in INSERT_COLUMNS])
+        buffer.seek(0)
+        connection = db.session.connection().connection.dbapi_connection
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY vehicle ({', '.join(INSERT_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer
+            )
+
+    def _insert_batch(self, records):
+        # INSERT sobre a tabela (não sobre o modelo) com executemany: a instrução é compilada uma
+        # só vez e o SQLAlchemy agrupa as linhas em INSERTs de vários valores (insertmanyvalues)
+        table = Vehicle.__table__
+        dialect = db.session.get_bind().dialect.name
+        if dialect == 'postgresql':
+            statement = postgresql.insert(table).on_conflict_do_nothing(index_elements=['matricula'])
+        elif dialect == 'sqlite':
+            statement = sqlite.insert(table).on_conflict_do_nothing(index_elements=['matricula'])
+        else:
+            inserted = set()
+            for record in records:
+                try:
+                    with db.session.begin_nested():
+                        db.session.execute(table.insert(), record)
+                    inserted.add(record['matricula'])
+                except IntegrityError:
+                    pass
+            return inserted
+        return set(db.session.execute(statement.returning(table.c.matricula), records).scalars())
+
+
+def _copy_value(value):
+    # Em COPY ... csv um campo vazio sem aspas é NULL
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    return value
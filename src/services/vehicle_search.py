@@ -0,0 +1,293 @@
+import re
+
+from markupsafe import escape
+from sqlalchemy import text
+
+from src.models.user import db
+
+# Marcadores usados pelo motor de pesquisa à volta dos termos encontrados;
+# são trocados por <mark> depois de o texto ser escapado
+_START, _STOP = '\x02', '\x03'
+
+RESULT_COLUMNS = ('id', 'matricula', 'marca', 'modelo', 'status', 'vin', 'cliente_nome', 'loja_aluguer')
+HIGHLIGHT_COLUMNS = ('matricula', 'vin', 'cliente_nome', 'observacoes')
+
+# Expressão da matrícula normalizada (sem hífenes nem espaços, em maiúsculas);
+# tem de ser igual à usada nos índices para que o planner os utilize
+PLATE_EXPR = "upper(replace(replace(matricula, '-', ''), ' ', ''))"
+PG_DOCUMENT_EXPR = (
+    "to_tsvector('portuguese', coalesce(matricula, '') || ' ' || coalesce(vin, '') || ' ' || "
+    "coalesce(cliente_nome, '') || ' ' || coalesce(observacoes, ''))"
+)
+
+PG_INDEX_STATEMENTS = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX IF NOT EXISTS ix_vehicle_plate_norm ON vehicle ({PLATE_EXPR})",
+    f"CREATE INDEX IF NOT EXISTS ix_vehicle_plate_trgm ON vehicle USING gin ({PLATE_EXPR} gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_vehicle_vin_trgm ON vehicle USING gin (upper(vin) gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_vehicle_cliente_trgm ON vehicle USING gin (lower(cliente_nome) gin_trgm_ops)",
+    f"CREATE INDEX IF NOT EXISTS ix_vehicle_search_tsv ON vehicle USING gin ({PG_DOCUMENT_EXPR})",
+]
+
+# Em SQLite a pesquisa usa uma tabela FTS5 com o tokenizer trigram (pesquisa por
+# fragmentos) mantida por triggers, para que também as inserções em massa fiquem indexadas
+_SQLITE_FTS_COLUMNS = "matricula, matricula_norm, vin, cliente_nome, observacoes"
+_SQLITE_FTS_VALUES = (
+    "new.id, new.matricula, upper(replace(replace(new.matricula, '-', ''), ' ', '')), "
+    "new.vin, new.cliente_nome, new.observacoes"
+)
+SQLITE_INDEX_STATEMENTS = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS vehicle_fts USING fts5({_SQLITE_FTS_COLUMNS}, tokenize='trigram')",
+    f"CREATE INDEX IF NOT EXISTS ix_vehicle_plate_norm ON vehicle ({PLATE_EXPR})",
+    f"""CREATE TRIGGER IF NOT EXISTS vehicle_fts_ai AFTER INSERT ON vehicle BEGIN
+        INSERT INTO vehicle_fts(rowid, {_SQLITE_FTS_COLUMNS}) VALUES ({_SQLITE_FTS_VALUES});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS vehicle_fts_au AFTER UPDATE ON vehicle BEGIN
+        DELETE FROM vehicle_fts WHERE rowid = old.id;
+        INSERT INTO vehicle_fts(rowid, {_SQLITE_FTS_COLUMNS}) VALUES ({_SQLITE_FTS_VALUES});
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS vehicle_fts_ad AFTER DELETE ON vehicle BEGIN
+        DELETE FROM vehicle_fts WHERE rowid = old.id;
+    END""",
+]
+_SQLITE_REBUILD = f"""
+    INSERT INTO vehicle_fts(rowid, {_SQLITE_FTS_COLUMNS})
+    SELECT id, matricula, {PLATE_EXPR}, vin, cliente_nome, observacoes FROM vehicle
+"""
+
+_PLATE_RE = re.compile(r'^[A-Z0-9]{6}$')
+
+# Engines em que os índices de SQLite já foram verificados neste processo
+_sqlite_ready = set()
+
+
+def normalize_plate(value):
+    """Remover separadores e passar a maiúsculas (AA-00-BB -> AA00BB)"""
+    return re.sub(r'[\W_]', '', value or '').upper()
+
+
+def _contains_pattern(value):
+    """Padrão LIKE '%value%' com %, _ e \\ escapados (usado com ESCAPE '\\')"""
+    escaped = value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+def _render_highlight(value):
+    """Escapar o texto e converter os marcadores do motor de pesquisa em <mark>"""
+    if value is None:
+        return None
+    return str(escape(value)).replace(_START, '<mark>').replace(_STOP, '</mark>')
+
+
+def _mark_fragment(value, needle, ignore_separators=False):
+    """Marcar as ocorrências de needle em value (usado nos campos curtos)"""
+    if not value or not needle:
+        return None
+    if ignore_separators:
+        pattern = r'[-\s]?'.join(re.escape(char) for char in needle)
+    else:
+        pattern = re.escape(needle)
+    marked, count = re.subn(f'({pattern})', f'{_START}\\1{_STOP}', value, flags=re.IGNORECASE)
+    return _render_highlight(marked) if count else None
+
+
+class VehicleSearch:
+    """Pesquisa ordenada de veículos por matrícula, VIN, cliente e observações
+
+    Usa índices tsvector/pg_trgm em PostgreSQL e uma tabela FTS5 em SQLite.
+    Os índices são criados por ensure_indexes(), só a partir do script
+    src/scripts/create_vehicle_search_index.py: a pesquisa nunca altera o
+    esquema. Em SQLite, enquanto a tabela FTS5 não existir, a pesquisa usa LIKE.
+    """
+
+    def __init__(self, session=None):
+        self.session = session or db.session
+        self.dialect = self.session.get_bind().dialect.name
+
+    def ensure_indexes(self):
+        if self.dialect == 'postgresql':
+            for statement in PG_INDEX_STATEMENTS:
+                self.session.execute(text(statement))
+        elif self.dialect == 'sqlite':
+            engine_url = str(self.session.get_bind().url)
+            if engine_url in _sqlite_ready:
+                return
+            exists = self.session.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'vehicle_fts'"
+            )).first()
+            for statement in SQLITE_INDEX_STATEMENTS:
+                self.session.execute(text(statement))
+            if not exists:
+                self.session.execute(text(_SQLITE_REBUILD))
+            _sqlite_ready.add(engine_url)
+        self.session.commit()
+
+    def _has_sqlite_fts(self):
+        engine_url = str(self.session.get_bind().url)
+        if engine_url in _sqlite_ready:
+            return True
+        exists = self.session.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'vehicle_fts'"
+        )).first() is not None
+        if exists:
+            _sqlite_ready.add(engine_url)
+        return exists
+
+    def search(self, query, limit=20, status=None, marca=None):
+        query = (query or '').strip()
+        plate = normalize_plate(query)
+
+        # Caminho rápido: matrícula completa resolvida pelo índice da matrícula normalizada
+        if _PLATE_RE.match(plate):
+            results = self._exact_plate(plate, status, marca)
+            if results:
+                return results
+
+        if self.dialect == 'postgresql':
+            return self._search_postgres(query, plate, limit, status, marca)
+        if self.dialect == 'sqlite':
+            return self._search_sqlite(query, plate, limit, status, marca)
+        raise RuntimeError(f'Pesquisa não suportada para o dialecto {self.dialect}')
+
+    def _select_columns(self, alias='v'):
+        return ', '.join(f'{alias}.{column}' for column in RESULT_COLUMNS)
+
+    def _filters(self, status, marca):
+        """Condições dos filtros da listagem (status exato, marca contida como em apply_vehicle_filters)"""
+        sql = ''
+        params = {}
+        if status:
+            sql += " AND v.status = :status"
+            params['status'] = status
+        if marca:
+            sql += " AND lower(v.marca) LIKE :marca_like ESCAPE '\\'"
+            params['marca_like'] = _contains_pattern(marca.lower())
+        return sql, params
+
+    def _exact_plate(self, plate, status, marca):
+        filters, params = self._filters(status, marca)
+        sql = f"SELECT {self._select_columns()} FROM vehicle v WHERE {PLATE_EXPR.replace('matricula', 'v.matricula')} = :plate{filters}"
+        params['plate'] = plate
+        rows = self.session.execute(text(sql), params).mappings().all()
+        return [self._result(row, 1.0, {'matricula': _mark_fragment(row['matricula'], plate, True)}) for row in rows]
+
+    def _search_postgres(self, query, plate, limit, status, marca):
+        plate_expr = PLATE_EXPR.replace('matricula', 'v.matricula')
+        document_expr = PG_DOCUMENT_EXPR.replace('coalesce(', 'coalesce(v.')
+        filters, filter_params = self._filters(status, marca)
+        sql = f"""
+            WITH q AS (SELECT websearch_to_tsquery('portuguese', :query) AS tsq),
+            ranked AS (
+                SELECT v.id,
+                       ts_rank({document_expr}, q.tsq)
+                       + 2 * coalesce(similarity({plate_expr}, :plate), 0)
+                       + coalesce(similarity(upper(v.vin), :plate), 0)
+                       + coalesce(similarity(lower(v.cliente_nome), :lower), 0) AS rank
+                FROM vehicle v, q
+                WHERE ({document_expr} @@ q.tsq
+                       OR {plate_expr} LIKE :plate_like ESCAPE '\\'
+                       OR upper(v.vin) LIKE :plate_like ESCAPE '\\'
+                       OR lower(v.cliente_nome) LIKE :lower_like ESCAPE '\\')
+                      {filters}
+                ORDER BY rank DESC
+                LIMIT :limit
+            )
+            SELECT {self._select_columns()}, ranked.rank,
+                   ts_headline('portuguese', coalesce(v.observacoes, ''), q.tsq,
+                               'StartSel={_START}, StopSel={_STOP}, MaxFragments=2') AS observacoes_highlight
+            FROM ranked JOIN vehicle v ON v.id = ranked.id, q
+            ORDER BY ranked.rank DESC
+        """
+        params = {
+            'query': query,
+            'plate': plate or query.upper(),
+            'lower': query.lower(),
+            # LIKE NULL nunca é verdadeiro, o que desliga o filtro quando não há fragmento de matrícula
+            'plate_like': _contains_pattern(plate) if len(plate) >= 2 else None,
+            'lower_like': _contains_pattern(query.lower()),
+            'limit': limit,
+            **filter_params,
+        }
+        results = []
+        for row in self.session.execute(text(sql), params).mappings():
+            highlight = row['observacoes_highlight']
+            highlights = {
+                'matricula': _mark_fragment(row['matricula'], plate, True),
+                'vin': _mark_fragment(row['vin'], plate),
+                'cliente_nome': _mark_fragment(row['cliente_nome'], query),
+                'observacoes': _render_highlight(highlight) if highlight and _START in highlight else None,
+            }
+            results.append(self._result(row, float(row['rank']), highlights))
+        return results
+
+    def _search_sqlite(self, query, plate, limit, status, marca):
+        # O tokenizer trigram só consegue procurar termos com 3 ou mais caracteres
+        terms = [term for term in re.split(r'\s+', query) if len(term) >= 3]
+        if not terms or not self._has_sqlite_fts():
+            return self._search_like(query, plate, limit, status, marca)
+
+        quote = lambda term: '"{}"'.format(term.replace('"', '""'))
+        match = ' '.join(quote(term) for term in terms)
+        if len(terms) > 1 or terms[0] != query:
+            # A frase completa (incluindo termos curtos como "Cliente 1") pontua acima dos termos soltos
+            match = f'{quote(query)} OR ({match})'
+        if plate and len(plate) >= 3 and plate not in terms:
+            match = f'({match}) OR matricula_norm : "{plate}"'
+        filters, params = self._filters(status, marca)
+        highlight = ', '.join(
+            f"highlight(vehicle_fts, {index}, char(2), char(3)) AS {column}_highlight"
+            for index, column in ((0, 'matricula'), (2, 'vin'), (3, 'cliente_nome'), (4, 'observacoes'))
+        )
+        sql = f"""
+            SELECT {self._select_columns()}, -bm25(vehicle_fts, 4.0, 4.0, 3.0, 2.0, 1.0) AS rank, {highlight}
+            FROM vehicle_fts JOIN vehicle v ON v.id = vehicle_fts.rowid
+            WHERE vehicle_fts MATCH :match{filters}
+            ORDER BY rank DESC
+            LIMIT :limit
+        """
+        rows = self.session.execute(text(sql), {'match': match, 'limit': limit, **params}).mappings()
+        results = []
+        for row in rows:
+            highlights = {
+                column: _render_highlight(row[f'{column}_highlight'])
+                if row[f'{column}_highlight'] and _START in row[f'{column}_highlight'] else None
+                for column in HIGHLIGHT_COLUMNS
+            }
+            if highlights['matricula'] is None:
+                highlights['matricula'] = _mark_fragment(row['matricula'], plate, True)
+            results.append(self._result(row, float(row['rank']), highlights))
+        return results
+
+    def _search_like(self, query, plate, limit, status, marca):
+        """Pesquisa para termos demasiado curtos para o índice trigram (ou sem a tabela FTS5)"""
+        filters, filter_params = self._filters(status, marca)
+        sql = f"""
+            SELECT {self._select_columns()} FROM vehicle v
+            WHERE ({PLATE_EXPR.replace('matricula', 'v.matricula')} LIKE :plate_like ESCAPE '\\'
+                   OR upper(v.vin) LIKE :plate_like ESCAPE '\\'
+                   OR lower(v.cliente_nome) LIKE :lower_like ESCAPE '\\')
+                  {filters}
+            ORDER BY v.created_at DESC
+            LIMIT :limit
+        """
+        params = {
+            'plate_like': _contains_pattern(plate) if len(plate) >= 2 else None,
+            'lower_like': _contains_pattern(query.lower()),
+            'limit': limit,
+            **filter_params,
+        }
+        return [
+            self._result(row, 0.0, {
+                'matricula': _mark_fragment(row['matricula'], plate, True),
+                'vin': _mark_fragment(row['vin'], plate),
+                'cliente_nome': _mark_fragment(row['cliente_nome'], query),
+            })
+            for row in self.session.execute(text(sql), params).mappings()
+        ]
+
+    def _result(self, row, rank, highlights):
+        return {
+            'vehicle': {column: row[column] for column in RESULT_COLUMNS},
+            'rank': round(rank, 4),
+            'highlights': {key: value for key, value in highlights.items() if value}
+        }